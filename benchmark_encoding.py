@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark response encoding for representative scb_fetch_data payloads
+Compares the old pretty-printed json.dumps with the compact and orjson encoders,
+for the row ('json') and 'columnar' result formats
+
+Usage: python benchmark_encoding.py [rows ...]
+"""
+
+import itertools
+import json
+import sys
+import time
+
+from scb_format import format_response
+from scb_json import JsonEncoder, make_encoder, orjson_available
+
+REGIONS = [f"{i:04d}" for i in range(290)]
+YEARS = [str(year) for year in range(1968, 2024)]
+
+
+def fetch_result(rows: int, format: str) -> dict:
+    """A scb_fetch_data result shaped like BE0101N1 (population by region and year)"""
+    keys = itertools.islice(itertools.cycle(itertools.product(REGIONS, YEARS)), rows)
+    response = {
+        "columns": [
+            {"code": "Region", "text": "region", "type": "d"},
+            {"code": "Tid", "text": "år", "type": "t"},
+            {"code": "BE0101N1", "text": "Folkmängd", "type": "c"},
+        ],
+        "comments": [],
+        "data": [{"key": list(key), "values": [str(10_000 + i * 7)]} for i, key in enumerate(keys)],
+    }
+    variables = [
+        {"code": "Region", "values": REGIONS, "valueTexts": [f"Kommun {r}" for r in REGIONS]},
+        {"code": "Tid", "values": YEARS, "valueTexts": YEARS},
+    ]
+    return {
+        "table_id": "BE0101N1",
+        "language": "sv",
+        "query": {"Region": ["*"], "Tid": ["*"]},
+        "format": format,
+        "data": format_response(response, format, variables, "Folkmängd"),
+    }
+
+
+def measure(encode, payload, repeat: int = 5) -> tuple:
+    """Best-of-repeat encode time in milliseconds, and encoded size in bytes"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = encode(payload)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(encoded)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 16_240, 150_000]
+    encoders = {
+        "json indent=2 (old)": lambda obj: json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8"),
+        "json compact": JsonEncoder().dumps,
+    }
+    if orjson_available():
+        encoders["orjson compact"] = make_encoder("orjson").dumps
+    else:
+        print("orjson is not installed; skipping the orjson encoder\n")
+
+    print(f"{'rows':>8}  {'format':<9}  {'encoder':<20}  {'ms':>8}  {'bytes':>11}")
+    for rows in sizes:
+        for format in ("json", "columnar"):
+            payload = fetch_result(rows, format)
+            for name, encode in encoders.items():
+                ms, size = measure(encode, payload)
+                print(f"{rows:>8}  {format:<9}  {name:<20}  {ms:>8.1f}  {size:>11,}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Offline load benchmark of the SCB MCP servers against a local PxWeb stand-in
+Each server's tool path (HTTP /call_tool, the SSE and stdio MCP handlers) runs in-process
+against scb_mock_pxweb.py with configurable latency and 429 injection. For each tool and
+concurrency level it reports throughput, p50/p95/p99 latency, peak Python allocations (with
+--trace-memory) and the process's peak RSS so far.
+
+Usage: python benchmark_servers.py [--servers http sse stdio] [--concurrency 1 8 32]
+       [--requests 200] [--latency 0.02] [--throttle-rate 0.0] [--trace-memory] [--json results.json]
+       [--baseline results.json --tolerance 0.25]
+With --baseline, exits with status 1 if any p95 latency regressed by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+import scb_mcp_server
+import scb_mcp_server_http
+import scb_mcp_server_sse
+import scb_tools
+from scb_cache import TieredCache
+from scb_client import ScbClient
+from scb_mock_pxweb import REGIONS, YEARS, MockPxWeb
+from scb_rate_limit import RateLimiter
+
+SERVERS = ("http", "sse", "stdio")
+
+
+def workloads() -> dict:
+    """Argument generators per tool; arguments vary so that calls are not all coalesced"""
+    rng = random.Random(1)
+    return {
+        "scb_browse_metadata": lambda: {"path": rng.choice(["", "BE", "BE/BE0101"])},
+        "scb_get_table_metadata": lambda: {"table_id": rng.choice(["BE0101N1", "BE0101A9"])},
+        "scb_fetch_data": lambda: {
+            "table_id": "BE0101A9",
+            "query": {"Region": rng.sample(REGIONS, rng.randint(1, 50)), "ContentsCode": ["BE0101N1"],
+                      "Tid": rng.sample(YEARS, rng.randint(1, 10))},
+        },
+        "scb_fetch_data_large": lambda: {
+            "table_id": "BE0101A9",
+            "query": {"Region": ["*"], "Kon": ["*"], "ContentsCode": ["*"], "Tid": rng.sample(YEARS, 30)},
+            "format": rng.choice(["json", "columnar"]),
+        },
+    }
+
+
+def tool_name(workload: str) -> str:
+    return "scb_fetch_data" if workload.startswith("scb_fetch_data") else workload
+
+
+class Harness:
+    """Routes the shared SCB client to the mock and calls a server's tool entry point"""
+
+    def __init__(self, mock: MockPxWeb, rate_limit: int):
+        self.mock = mock
+        self.rate_limit = rate_limit
+        self.http: httpx.AsyncClient = None
+
+    def reset_client(self) -> None:
+        """Fresh client and caches per run, so runs do not warm each other up"""
+        scb_tools.scb_client = ScbClient(
+            transport=httpx.ASGITransport(app=self.mock.app),
+            rate_limiter=RateLimiter(self.rate_limit, 1.0),
+            cache=TieredCache(),
+        )
+
+    async def call(self, server: str, name: str, arguments: dict) -> None:
+        if server == "http":
+            response = await self.http.post("/call_tool", json={"name": name, "arguments": arguments})
+            response.raise_for_status()
+            if b'"error"' in response.content[:200]:
+                raise RuntimeError(response.text[:200])
+        else:
+            handler = scb_mcp_server_sse.call_tool if server == "sse" else scb_mcp_server.call_tool
+            content = await handler(name, arguments)
+            if content[0].text.startswith('{"error"'):
+                raise RuntimeError(content[0].text[:200])
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+async def run_level(harness: Harness, server: str, workload: str, make_args, concurrency: int,
+                    requests: int, trace_memory: bool) -> dict:
+    """Run 'requests' calls with 'concurrency' workers and summarize them"""
+    harness.reset_client()
+    latencies = []
+    errors = 0
+    remaining = requests
+    name = tool_name(workload)
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            arguments = make_args()
+            started = time.perf_counter()
+            try:
+                await harness.call(server, name, arguments)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    await scb_tools.scb_client.aclose()
+
+    return {
+        "server": server,
+        "tool": workload,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "peak_alloc_mb": round(peak / 2 ** 20, 2) if trace_memory else None,
+        # ru_maxrss is the process high-water mark, not this run's usage: it never goes down between runs
+        "process_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+async def run_benchmark(servers: list, tools: list, concurrency: list, requests: int, latency: float = 0.0,
+                        jitter: float = 0.0, throttle_rate: float = 0.0, fixtures: list = None,
+                        rate_limit: int = 1_000_000, trace_memory: bool = False, report=None) -> list:
+    """Run every server x tool x concurrency combination and return one result dict per run"""
+    mock = MockPxWeb(latency=latency, jitter=jitter, throttle_rate=throttle_rate, fixtures=fixtures, seed=1)
+    harness = Harness(mock, rate_limit)
+    available = workloads()
+    original = scb_tools.scb_client
+    results = []
+    transport = httpx.ASGITransport(app=scb_mcp_server_http.api)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+            harness.http = http
+            for server in servers:
+                for workload in tools:
+                    for level in concurrency:
+                        result = await run_level(harness, server, workload, available[workload], level,
+                                                 requests, trace_memory)
+                        results.append(result)
+                        if report:
+                            report(result)
+    finally:
+        scb_tools.scb_client = original
+    return results
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    """Runs whose p95 latency exceeds the baseline's by more than 'tolerance' (a fraction)"""
+    previous = {(r["server"], r["tool"], r["concurrency"]): r for r in baseline}
+    slower = []
+    for result in results:
+        before = previous.get((result["server"], result["tool"], result["concurrency"]))
+        if before and before["p95_ms"] > 0 and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            slower.append((result, before))
+    return slower
+
+
+def print_row(result: dict) -> None:
+    peak = f"{result['peak_alloc_mb']:>9.1f}" if result["peak_alloc_mb"] is not None else f"{'-':>9}"
+    print(f"{result['server']:<6} {result['tool']:<24} {result['concurrency']:>5} {result['requests']:>6} "
+          f"{result['errors']:>6} {result['throughput']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+          f"{result['p99_ms']:>9.1f} {peak} {result['process_peak_rss_mb']:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--servers", nargs="+", choices=SERVERS, default=list(SERVERS))
+    parser.add_argument("--tools", nargs="+", choices=list(workloads()), default=list(workloads()))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Calls per server, tool and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock PxWeb latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Random extra mock latency in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of mock responses that are 429")
+    parser.add_argument("--rate-limit", type=int, default=1_000_000, help="Client requests per second")
+    parser.add_argument("--fixtures", nargs="*", default=[], help="Cassettes of recorded PxWeb exchanges to serve")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report peak Python allocations with tracemalloc (slows calls down)")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Earlier --json output to compare p95 latency against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 regression (fraction)")
+    args = parser.parse_args()
+
+    print(f"{'server':<6} {'tool':<24} {'conc':>5} {'calls':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'p99 ms':>9} {'alloc MB':>9} {'proc peak MB':>13}")
+    results = asyncio.run(run_benchmark(
+        args.servers, args.tools, args.concurrency, args.requests, latency=args.latency, jitter=args.jitter,
+        throttle_rate=args.throttle_rate, fixtures=args.fixtures, rate_limit=args.rate_limit,
+        trace_memory=args.trace_memory, report=print_row,
+    ))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for result, before in slower:
+            print(f"REGRESSION {result['server']} {result['tool']} x{result['concurrency']}: "
+                  f"p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
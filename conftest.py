@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Shared pytest fixtures: an in-process HTTP API client and a mocked SCB upstream
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import scb_mcp_server_http
+import scb_tools
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+
+
+@pytest.fixture
+def api_client():
+    """Send one request to an ASGI app (the HTTP server by default) and return the response"""
+    def request(method, url, app=None, **kwargs):
+        async def run():
+            transport = httpx.ASGITransport(app=app or scb_mcp_server_http.api)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, url, **kwargs)
+
+        return asyncio.run(run())
+
+    return request
+
+
+@pytest.fixture
+def mock_scb(monkeypatch):
+    """Point the tools at a client whose requests are answered by handler(request) for this test"""
+    def install(handler, **kwargs):
+        kwargs.setdefault("rate_limiter", RateLimiter(1000, 1))
+        client = ScbClient(transport=httpx.MockTransport(handler), **kwargs)
+        monkeypatch.setattr(scb_tools, "scb_client", client)
+        return client
+
+    return install
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Server-side filtering and aggregation of PxWeb responses
+Keys are dictionary-encoded into integer arrays and values into a float matrix, so filters,
+group-by and top-n run as vectorized NumPy operations. The result keeps PxWeb's response
+shape (columns + data rows), so the result formats apply to it unchanged.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from scb_format import parse_value
+
+AGGREGATES = ("sum", "mean", "min", "max", "count")
+
+# Comparison operators accepted in measure filters, e.g. {"BE0101N1": {"gte": 10000}}
+OPERATORS = {
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+}
+
+
+def _encode(response: dict) -> tuple:
+    """Return (key columns, measure columns, key code arrays, category lists, value matrix)"""
+    columns = response.get("columns", [])
+    keys = [col for col in columns if col.get("type") != "c"]
+    measures = [col for col in columns if col.get("type") == "c"]
+    rows = response.get("data", [])
+
+    if rows:
+        raw_keys = np.array([row["key"] for row in rows], dtype=object).reshape(len(rows), len(keys))
+    else:
+        raw_keys = np.empty((0, len(keys)), dtype=object)
+    categories, codes = [], []
+    for i in range(len(keys)):
+        values, inverse = np.unique(raw_keys[:, i].astype(str), return_inverse=True)
+        categories.append(values.tolist())
+        codes.append(inverse.reshape(-1))
+
+    matrix = np.full((len(rows), len(measures)), np.nan)
+    for r, row in enumerate(rows):
+        for m, raw in enumerate(row.get("values", [])[:len(measures)]):
+            value = parse_value(raw)
+            if value is not None:
+                matrix[r, m] = value
+    return keys, measures, codes, categories, matrix
+
+
+def _number(value: float):
+    """Convert a NumPy float to a JSON number; NaN (no data) becomes None"""
+    if np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else round(float(value), 6)
+
+
+def validate(group_by: Optional[list], aggregate: str, filter: Optional[dict], top_n: Optional[int]) -> None:
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{aggregate}'. Available: {', '.join(AGGREGATES)}")
+    if group_by is not None and (not isinstance(group_by, list) or not all(isinstance(c, str) for c in group_by)):
+        raise ValueError("'group_by' must be a list of variable codes")
+    if filter is not None and not isinstance(filter, dict):
+        raise ValueError("'filter' must be an object")
+    for code, condition in (filter or {}).items():
+        if isinstance(condition, dict):
+            unknown = [op for op in condition if op not in OPERATORS]
+            if unknown:
+                raise ValueError(f"Unknown filter operator '{unknown[0]}'. Available: {', '.join(OPERATORS)}")
+    if top_n is not None and (not isinstance(top_n, int) or isinstance(top_n, bool) or top_n < 1):
+        raise ValueError("'top_n' must be a positive integer")
+
+
+def dimension_filters(filter: Optional[dict]) -> dict:
+    """The value-list part of a filter ({code: [values]}), which can be pushed into the query"""
+    return {
+        code: [condition] if isinstance(condition, str) else list(condition)
+        for code, condition in (filter or {}).items()
+        if not isinstance(condition, dict)
+    }
+
+
+def push_down(variables: list, selection: dict, filter: Optional[dict]) -> dict:
+    """Narrow an expanded selection by the filter's value lists, so fewer cells are fetched.
+
+    A filtered variable the query left out is added with the filter's values.
+    """
+    narrowed = dict(selection)
+    order = [var.get("code") for var in variables]
+    for code, values in dimension_filters(filter).items():
+        if code not in order:
+            raise ValueError(f"Unknown variable '{code}' in filter. Available: {', '.join(order)}")
+        allowed = set(values)
+        narrowed[code] = [value for value in narrowed.get(code, values) if value in allowed]
+        if not narrowed[code]:
+            raise ValueError(f"Filter leaves no values selected for '{code}'")
+    return {code: narrowed[code] for code in order if code in narrowed}
+
+
+def aggregate_response(response: dict, group_by: Optional[list] = None, aggregate: str = "sum",
+                       filter: Optional[dict] = None, top_n: Optional[int] = None) -> dict:
+    """Filter rows, aggregate measures per group_by combination, and keep the top_n groups.
+
+    'filter' maps a dimension code to allowed values, or a measure code to comparisons
+    such as {"gte": 1000}. Value lists for variables that are not key columns (the contents
+    variable) were already applied to the query by push_down and are skipped here.
+    Without group_by, every row is its own group. top_n keeps the groups with the largest
+    value of the first measure, in descending order.
+    """
+    validate(group_by, aggregate, filter, top_n)
+    keys, measures, codes, categories, matrix = _encode(response)
+    key_codes = [col.get("code") for col in keys]
+    measure_codes = [col.get("code") for col in measures]
+
+    mask = np.ones(len(matrix), dtype=bool)
+    for code, condition in (filter or {}).items():
+        if isinstance(condition, dict):
+            if code not in measure_codes:
+                raise ValueError(f"Unknown measure '{code}' in filter. Available: {', '.join(measure_codes)}")
+            column = matrix[:, measure_codes.index(code)]
+            for op, operand in condition.items():
+                with np.errstate(invalid="ignore"):
+                    mask &= OPERATORS[op](column, float(operand))
+        elif code in key_codes:
+            i = key_codes.index(code)
+            allowed = [categories[i].index(v) for v in dimension_filters({code: condition})[code] if v in categories[i]]
+            mask &= np.isin(codes[i], allowed)
+
+    if group_by is None:
+        group_by = key_codes
+        aggregate_label = None
+    else:
+        unknown = [code for code in group_by if code not in key_codes]
+        if unknown:
+            raise ValueError(f"Unknown variable '{unknown[0]}' in group_by. Available: {', '.join(key_codes)}")
+        aggregate_label = aggregate
+
+    positions = [key_codes.index(code) for code in group_by]
+    matrix = matrix[mask]
+    group_codes = [codes[i][mask] for i in positions]
+
+    if positions:
+        shape = tuple(len(categories[i]) for i in positions)
+        flat = np.ravel_multi_index(group_codes, shape) if len(matrix) else np.empty(0, dtype=np.int64)
+        groups, inverse = np.unique(flat, return_inverse=True)
+        group_keys = np.array(np.unravel_index(groups, shape)).T.reshape(len(groups), len(positions))
+    else:
+        groups = np.zeros(1 if len(matrix) else 0, dtype=np.int64)
+        inverse = np.zeros(len(matrix), dtype=np.int64)
+        group_keys = np.empty((len(groups), 0), dtype=np.int64)
+    inverse = inverse.reshape(-1)
+    n = len(groups)
+
+    present = ~np.isnan(matrix)
+    counts = np.stack([np.bincount(inverse, weights=present[:, m], minlength=n) for m in range(len(measures))],
+                      axis=1) if measures else np.zeros((n, 0))
+    if aggregate in ("sum", "mean"):
+        sums = np.stack([np.bincount(inverse, weights=np.where(present[:, m], matrix[:, m], 0.0), minlength=n)
+                         for m in range(len(measures))], axis=1) if measures else np.zeros((n, 0))
+        result = sums if aggregate == "sum" else sums / np.where(counts > 0, counts, 1)
+    elif aggregate == "count":
+        result = counts
+    else:
+        result = np.full((n, len(measures)), np.inf if aggregate == "min" else -np.inf)
+        (np.fmin if aggregate == "min" else np.fmax).at(result, inverse, matrix)
+    if aggregate != "count":
+        result = np.where(counts > 0, result, np.nan)
+
+    order = np.arange(n)
+    if top_n is not None and measures:
+        ranking = np.where(np.isnan(result[:, 0]), -np.inf, result[:, 0])
+        order = np.argsort(-ranking, kind="stable")[:top_n]
+
+    columns = [keys[i] for i in positions]
+    for col in measures:
+        text = col.get("text", col.get("code"))
+        columns.append({**col, "text": f"{text} ({aggregate_label})" if aggregate_label else text})
+
+    data = [
+        {
+            "key": [categories[positions[j]][group_keys[g, j]] for j in range(len(positions))],
+            "values": [_number(value) for value in result[g]],
+        }
+        for g in order
+    ]
+    aggregated = {key: value for key, value in response.items() if key not in ("columns", "data")}
+    aggregated.update({"columns": columns, "data": data})
+    return aggregated
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+In-process data backends that stand in for the SCB PxWeb API
+A backend is an httpx transport that answers PxWeb requests without network access, so
+every server, cache and tool runs unchanged on top of it. SCB_BACKEND selects it: "demo"
+serves the demo tree (scb_demo_data.py) with generated values, "snapshot" serves a local
+directory of recorded cassettes and table store replicas, e.g. during SCB outages.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import httpx
+
+from scb_cassette import describe, entry_key, read_cassette, request_key
+from scb_executor import run_blocking
+from scb_json import dumps
+from scb_mock_pxweb import MockPxWeb
+from scb_rate_limit import RateLimiter
+from scb_table_store import TableStore
+
+logger = logging.getLogger("scb-backend")
+
+DEFAULT_SNAPSHOT_DIR = "scb_snapshot"
+CASSETTE_SUFFIXES = (".jsonl", ".jsonl.gz")
+
+
+class LocalBackend(httpx.AsyncBaseTransport, ABC):
+    """Base class for backends; subclasses implement respond() for one parsed PxWeb request"""
+
+    name = "local"
+
+    def __init__(self):
+        # SCB's request quota does not apply to local data
+        self.rate_limiter = RateLimiter(1_000_000, 1.0)
+        self.requests = 0
+        self.misses = 0
+
+    @abstractmethod
+    async def respond(self, method: str, language: str, path: str, params: dict, body) -> tuple:
+        """Status and JSON content for a request"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        info = describe(request)
+        self.requests += 1
+        status, content = await self.respond(info["method"], info["language"], info["path"], info["params"],
+                                             info["body"])
+        if status == 404:
+            self.misses += 1
+        return httpx.Response(status, content=dumps(content), headers={"Content-Type": "application/json"},
+                              request=request)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "requests": self.requests, "misses": self.misses}
+
+
+class DemoBackend(LocalBackend):
+    """Demo tree and tables with deterministic generated values, answered by scb_mock_pxweb.py's logic"""
+
+    name = "demo"
+
+    def __init__(self):
+        super().__init__()
+        self.pxweb = MockPxWeb()
+
+    async def respond(self, method: str, language: str, path: str, params: dict, body) -> tuple:
+        return self.pxweb.respond(method, language, path, params, body)
+
+
+class SnapshotBackend(LocalBackend):
+    """A snapshot directory: cassettes (*.jsonl, *.jsonl.gz) for recorded responses, plus table
+    store replicas that answer any data query, metadata request or ID search for their tables.
+
+    Record the cassettes with SCB_CASSETTE_MODE=record and fill the replicas with
+    SCB_TABLE_STORE_DIR pointing at the same directory.
+    """
+
+    name = "snapshot"
+
+    def __init__(self, directory: str = DEFAULT_SNAPSHOT_DIR):
+        super().__init__()
+        self.directory = directory
+        self.store = TableStore(directory)
+        self.responses: dict = {}
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        for name in names:
+            if name.endswith(CASSETTE_SUFFIXES):
+                # Later recordings win; failed exchanges are not worth serving
+                for entry in read_cassette(os.path.join(directory, name)):
+                    if entry.get("status") == 200 and "response" in entry:
+                        self.responses[entry_key(entry)] = entry["response"]
+        self.tables = {language: self.store.stored_tables(language) for language in ("sv", "en")}
+        logger.info(f"Snapshot {directory}: {len(self.responses)} recorded responses, "
+                    f"{sum(map(len, self.tables.values()))} stored tables")
+
+    def search(self, query: str, language: str) -> list:
+        """PxWeb search hits among the stored tables, matching the table ID or title"""
+        query = query.lower()
+        hits = []
+        for table in self.tables.get(language, []):
+            folder, _, table_id = table["path"].rpartition("/")
+            if query in table_id.lower() or query in table["title"].lower():
+                hits.append({"id": table_id, "path": "/" + folder, "title": table["title"], "score": 1.0,
+                             "published": table["updated"]})
+        return hits
+
+    async def respond(self, method: str, language: str, path: str, params: dict, body) -> tuple:
+        recorded = self.responses.get(request_key(method, language, path, params, body))
+        if method == "POST" and self.store.has(path, language):
+            query = {item["code"]: item["selection"]["values"] for item in (body or {}).get("query", [])}
+            try:
+                response = await run_blocking(self.store.lookup, path, language, query)
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            if response is not None:
+                return 200, response
+        if recorded is not None:
+            return 200, recorded
+        if method == "GET" and "query" in params:
+            return 200, self.search(params["query"], language)
+        metadata = self.store.metadata(path, language) if method == "GET" and not params else None
+        if metadata is not None:
+            return 200, metadata
+        return 404, {"error": f"{method} {language}/{path} is not in snapshot {self.directory}"}
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({"dir": self.directory, "recorded_responses": len(self.responses),
+                      "stored_tables": {language: len(tables) for language, tables in self.tables.items()},
+                      "table_store": self.store.stats()})
+        return stats
+
+
+BACKENDS = {
+    "demo": DemoBackend,
+    "snapshot": lambda: SnapshotBackend(os.environ.get("SCB_SNAPSHOT_DIR") or DEFAULT_SNAPSHOT_DIR),
+}
+
+_backend: Optional[LocalBackend] = None
+
+
+def get_backend() -> Optional[LocalBackend]:
+    """Get the process-wide backend from SCB_BACKEND; None (the live SCB API) when unset or "scb" """
+    global _backend
+    name = os.environ.get("SCB_BACKEND", "scb").lower()
+    if _backend is None and name != "scb":
+        if name not in BACKENDS:
+            logger.warning(f"Unknown SCB_BACKEND '{name}' (available: scb, {', '.join(BACKENDS)}), using the SCB API")
+            return None
+        _backend = BACKENDS[name]()
+        logger.info(f"Serving PxWeb data from the {name} backend")
+    return _backend
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tiered cache for SCB metadata
+In-memory LRU with TTL in front of an optional on-disk tier that survives restarts
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from scb_executor import run_blocking
+
+logger = logging.getLogger("scb-cache")
+
+# PxWeb metadata changes at most a few times a day
+DEFAULT_TTL = 6 * 3600.0
+DEFAULT_MAX_ENTRIES = 2048
+
+
+def cache_key(*parts: str) -> str:
+    """Build a cache key such as 'nodes:sv:BE/BE0101'"""
+    return ":".join(str(part) for part in parts)
+
+
+class MemoryCache:
+    """Size-bounded LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """One JSON file per entry, named by the hash of its key"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (expires_at, value) or None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            self.delete(key)
+            return None
+        return entry["expires_at"], entry["value"]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per thread, so concurrent writes of the same key never share a temporary file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class TieredCache:
+    """Memory tier backed by an optional disk tier; values must be JSON serializable"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 directory: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = MemoryCache(max_entries)
+        self.disk = DiskCache(directory) if directory else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.disk is not None:
+            entry = await run_blocking(self.disk.get, key)
+            if entry is not None:
+                expires_at, value = entry
+                self.memory.set(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                await run_blocking(self.disk.set, key, value, expires_at)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key}: {e}")
+
+    async def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            await run_blocking(self.disk.delete, key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.memory.evictions,
+            "disk_dir": self.disk.directory if self.disk else None,
+        }
+
+
+_metadata_cache: Optional[TieredCache] = None
+
+
+def get_metadata_cache(backend: Optional[str] = None) -> TieredCache:
+    """Get the process-wide metadata cache, configured from SCB_CACHE_* variables.
+
+    A local data backend (SCB_BACKEND) keeps its disk entries in a subdirectory named after it.
+    """
+    global _metadata_cache
+    if _metadata_cache is None:
+        try:
+            ttl = float(os.environ.get("SCB_CACHE_TTL", DEFAULT_TTL))
+            max_entries = int(os.environ.get("SCB_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        except ValueError:
+            logger.warning("Invalid cache settings, using defaults")
+            ttl, max_entries = DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+        directory = os.environ.get("SCB_CACHE_DIR") or None
+        if directory and backend:
+            directory = os.path.join(directory, backend)
+        _metadata_cache = TieredCache(ttl=ttl, max_entries=max_entries, directory=directory)
+    return _metadata_cache
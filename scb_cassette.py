@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Record and replay of upstream PxWeb traffic
+In record mode every PxWeb request and response is appended to a gzipped JSON-lines cassette;
+in replay mode the client is answered from the cassette without network access, in recorded
+order for repeated requests. Cassettes also serve as scb_mock_pxweb.py fixtures and can warm
+the metadata cache at startup.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+from scb_cache import cache_key
+from scb_executor import get_executor, run_blocking
+from scb_json import dumps
+
+logger = logging.getLogger("scb-cassette")
+
+MODES = ("record", "replay")
+DEFAULT_CASSETTE_PATH = "scb_cassette.jsonl.gz"
+# Recorded entries are written in batches of this size (and when the client closes)
+FLUSH_EVERY = 100
+
+_API_PATH = re.compile(r"/([a-z]{2})/ssd/?(.*)$")
+
+
+def request_key(method: str, language: str, path: str, params: Optional[dict] = None, body=None) -> str:
+    """Canonical identity of a PxWeb request, used to look up recorded responses"""
+    return json.dumps([method.upper(), language, path.strip("/"), params or {}, body],
+                      sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def describe(request: httpx.Request) -> dict:
+    """Method, language, table tree path, query parameters and JSON body of a PxWeb request"""
+    match = _API_PATH.search(request.url.path)
+    language, path = (match.group(1), match.group(2)) if match else ("", request.url.path)
+    content = request.content
+    return {
+        "method": request.method,
+        "language": language,
+        "path": path.strip("/"),
+        "params": dict(request.url.params),
+        "body": json.loads(content) if content else None,
+    }
+
+
+def entry_key(entry: dict) -> str:
+    return request_key(entry["method"], entry["language"], entry["path"], entry.get("params"), entry.get("body"))
+
+
+def read_cassette(path: str) -> list:
+    """Entries of a cassette (gzipped or plain JSON lines), in recorded order.
+
+    Response bodies are recorded as raw text; JSON bodies are also parsed into "response".
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    for entry in entries:
+        if "response" not in entry and "text" in entry:
+            try:
+                entry["response"] = json.loads(entry["text"])
+            except ValueError:
+                pass
+    return entries
+
+
+class Cassette:
+    """Recorded PxWeb exchanges; in replay mode each request key yields its responses in order"""
+
+    def __init__(self, path: str = DEFAULT_CASSETTE_PATH, mode: str = "replay", realtime: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}'. Available: {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self._pending: list = []
+        self._lock = threading.Lock()
+        # Serializes appends to the file; never taken on the event loop
+        self._write_lock = threading.Lock()
+        self._started = time.time()
+        self._entries: dict = {}
+        self._positions: dict = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if mode == "replay":
+            for entry in read_cassette(path):
+                self._entries.setdefault(entry_key(entry), []).append(entry)
+
+    def lookup(self, request: httpx.Request) -> Optional[dict]:
+        """Next recorded entry for a request; the last one repeats once the recording runs out"""
+        key = entry_key(describe(request))
+        entries = self._entries.get(key)
+        if not entries:
+            self.misses += 1
+            return None
+        position = self._positions.get(key, 0)
+        self._positions[key] = position + 1
+        self.replayed += 1
+        return entries[min(position, len(entries) - 1)]
+
+    def record(self, request: httpx.Request, response: httpx.Response, elapsed: float) -> None:
+        entry = describe(request)
+        # Kept as text: parsing the body again here would cost the event loop a second json.loads
+        entry["text"] = response.content.decode("utf-8-sig", errors="replace")
+        entry.update({
+            "status": response.status_code,
+            "t": round(time.time() - self._started, 3),
+            "elapsed": round(elapsed, 4),
+        })
+        if "retry-after" in response.headers:
+            entry["headers"] = {"Retry-After": response.headers["retry-after"]}
+        with self._lock:
+            self._pending.append(entry)
+            self.recorded += 1
+            full = len(self._pending) >= FLUSH_EVERY
+        if full:
+            get_executor().submit(self.flush)
+
+    def flush(self) -> None:
+        """Append pending entries to the cassette as one gzip member"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        # Compressed and written outside self._lock, so record() on the event loop never waits for it
+        data = b"".join(dumps(entry) + b"\n" for entry in pending)
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with self._write_lock:
+            with opener(self.path, "ab") as f:
+                f.write(data)
+
+    def stats(self) -> dict:
+        return {"path": self.path, "mode": self.mode, "recorded": self.recorded,
+                "replayed": self.replayed, "misses": self.misses}
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests to the real transport and records each exchange"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        self.cassette.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers requests from a cassette; a request that was never recorded fails"""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self.cassette.lookup(request)
+        if entry is None:
+            raise httpx.TransportError(f"No recorded response for {request.method} {request.url}")
+        if self.cassette.realtime and entry.get("elapsed"):
+            await asyncio.sleep(entry["elapsed"])
+        content = entry["text"].encode("utf-8") if "text" in entry else dumps(entry.get("response"))
+        headers = {"Content-Type": "application/json", **entry.get("headers", {})}
+        return httpx.Response(entry.get("status", 200), content=content, headers=headers, request=request)
+
+
+async def warm_cache(cache, path: str) -> int:
+    """Load successful metadata responses from a cassette into a metadata cache; returns the count"""
+    count = 0
+    for entry in await run_blocking(read_cassette, path):
+        if entry["method"] != "GET" or entry.get("status") != 200 or "response" not in entry:
+            continue
+        response, params = entry["response"], entry.get("params") or {}
+        if "query" in params:
+            key = cache_key("search", entry["language"], params["query"].lower())
+        elif isinstance(response, list):
+            key = cache_key("nodes", entry["language"], entry["path"])
+        elif isinstance(response, dict) and "variables" in response:
+            key = cache_key("table", entry["language"], entry["path"])
+        else:
+            continue
+        await cache.set(key, response)
+        count += 1
+    return count
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Get the process-wide cassette from SCB_CASSETTE_MODE / SCB_CASSETTE_PATH; None when neither mode is set"""
+    global _cassette
+    mode = os.environ.get("SCB_CASSETTE_MODE", "").lower()
+    if _cassette is None and mode in MODES:
+        path = os.environ.get("SCB_CASSETTE_PATH") or DEFAULT_CASSETTE_PATH
+        realtime = os.environ.get("SCB_CASSETTE_REALTIME", "0") == "1"
+        _cassette = Cassette(path, mode, realtime)
+        logger.info(f"{'Recording' if mode == 'record' else 'Replaying'} upstream traffic: {path}")
+    return _cassette
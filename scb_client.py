@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Stateless asyncio SCB PxWeb client
+Every call takes its own language, path or table, and all calls share one pooled
+httpx.AsyncClient so repeated tool calls reuse keep-alive (and HTTP/2) connections
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+import httpx
+
+import scb_metrics as metrics
+import scb_tracing as tracing
+from scb_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, MemoryCache, TieredCache, cache_key
+from scb_cassette import Cassette, RecordingTransport, ReplayTransport
+from scb_executor import run_blocking
+from scb_query import TableSchema, merge_responses, plan_selection
+from scb_rate_limit import RateLimiter, get_rate_limiter, retry_delay
+from scb_result_cache import ResultCache, result_key
+from scb_singleflight import SingleFlight
+
+logger = logging.getLogger("scb-client")
+
+SCB_API_URL = "https://api.scb.se/OV0104/v1/doris/{lang}/ssd/"
+SCB_WEB_URL = "https://www.statistikdatabasen.scb.se/pxweb/{lang}/ssd/START__"
+
+# Connection pool defaults, overridable through environment variables
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 3
+# Sub-queries held in flight at once while streaming a large result
+DEFAULT_STREAM_IN_FLIGHT = 2
+
+# Upstream statuses that mean "slow down and try again"
+RETRY_STATUSES = (429, 503)
+
+
+def _env_number(name: str, default: float, cast=int):
+    """Read a positive number from the environment, falling back to the default"""
+    try:
+        value = cast(os.environ.get(name, ""))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (installed with httpx[http2])"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def normalize_language(language: str) -> str:
+    """Map a language argument to 'sv' or 'en'"""
+    return "en" if (language or "").lower() == "en" else "sv"
+
+
+def normalize_path(path: str) -> str:
+    """Strip surrounding slashes from a metadata path"""
+    return (path or "").strip().strip("/")
+
+
+class ScbClient:
+    """Async SCB client without per-table or per-path state"""
+
+    def __init__(
+        self,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        http2: Optional[bool] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: Optional[int] = None,
+        cache: Optional[TieredCache] = None,
+        result_cache: Optional[ResultCache] = None,
+        api_url: Optional[str] = None,
+        cassette: Optional[Cassette] = None,
+    ):
+        self.transport = transport
+        # Local backends (scb_backend.py) are named, so their results never share cache keys with SCB's
+        self.source = getattr(transport, "name", None) or "scb"
+        self.cassette = cassette
+        # SCB_API_URL points the client at a stand-in such as scb_mock_pxweb.py
+        self.api_url = api_url or os.environ.get("SCB_API_URL") or SCB_API_URL
+        self.cache = cache
+        self.result_cache = result_cache
+        self.inflight = SingleFlight()
+        # Compiled table metadata, so data queries are validated and expanded locally
+        self.schemas = MemoryCache(cache.memory.max_entries if cache is not None else DEFAULT_MAX_ENTRIES)
+        self.schema_hits = 0
+        self.schema_misses = 0
+        if rate_limiter is None and cassette is not None and cassette.mode == "replay":
+            # Replayed traffic never reaches SCB, so its request quota does not pace it
+            rate_limiter = RateLimiter(1_000_000, 1.0)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        if max_retries is None:
+            max_retries = _env_number("SCB_MAX_RETRIES", DEFAULT_MAX_RETRIES)
+        self.max_retries = max_retries
+        if http2 is None:
+            http2 = os.environ.get("SCB_HTTP2", "1") != "0"
+        self.http2 = http2 and transport is None and http2_available()
+        self.limits = httpx.Limits(
+            max_connections=max_connections or _env_number("SCB_HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=max_keepalive or _env_number("SCB_HTTP_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE),
+            keepalive_expiry=keepalive_expiry or _env_number("SCB_HTTP_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY, float),
+        )
+        self.timeout = httpx.Timeout(
+            timeout or _env_number("SCB_HTTP_TIMEOUT", DEFAULT_TIMEOUT, float),
+            connect=DEFAULT_CONNECT_TIMEOUT,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client, creating it for the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            transport = self.transport
+            if self.cassette is not None and self.cassette.mode == "replay":
+                transport = ReplayTransport(self.cassette)
+            elif self.cassette is not None:
+                inner = transport or httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits)
+                transport = RecordingTransport(inner, self.cassette)
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=transport,
+                headers={"Accept": "application/json"},
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        if self.cassette is not None and self.cassette.mode == "record":
+            await run_blocking(self.cassette.flush)
+
+    def url(self, path: str = "", language: str = "sv") -> str:
+        """Get the API URL for a metadata path"""
+        return self.api_url.format(lang=normalize_language(language)) + normalize_path(path)
+
+    async def _request(self, method: str, url: str, **kwargs) -> Any:
+        for attempt in range(self.max_retries + 1):
+            with metrics.overlapping("rate_limit"), tracing.span("rate_limit.wait"):
+                await self.rate_limiter.acquire()
+            with metrics.upstream_request(method) as outcome, \
+                    tracing.span(f"http {method}", **{"http.method": method, "http.url": url}) as span:
+                response = await self._http().request(method, url, **kwargs)
+                outcome["status"] = response.status_code
+                span.set("http.status_code", response.status_code)
+                span.set("attempt", attempt)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            delay = retry_delay(response, attempt)
+            logger.warning(f"SCB returned {response.status_code} for {url}, retrying in {delay:.1f}s")
+            self.rate_limiter.backoff(delay)
+
+        response.raise_for_status()
+        return json.loads(response.content.decode("utf-8-sig"))
+
+    async def _cached_get(self, key: str, url: str, params: Optional[dict] = None, refresh: bool = False) -> Any:
+        """GET a metadata URL through the cache, if one is configured; refresh=True skips the lookup"""
+        if self.cache is not None and not refresh:
+            value = await self.cache.get(key)
+            if value is not None:
+                return value
+
+        async def fetch():
+            value = await self._request("GET", url, params=params)
+            if self.cache is not None:
+                await self.cache.set(key, value)
+            return value
+
+        # Concurrent misses for the same key share one upstream request
+        return await self.inflight.do(key, fetch)
+
+    async def list_nodes(self, path: str = "", language: str = "sv", refresh: bool = False) -> list:
+        """List the child nodes of a folder in the metadata tree; refresh=True bypasses the cache"""
+        key = cache_key("nodes", normalize_language(language), normalize_path(path))
+        result = await self._cached_get(key, self.url(path, language), refresh=refresh)
+        if not isinstance(result, list):
+            raise ValueError(f"'{normalize_path(path)}' is a table, not a folder")
+        return result
+
+    async def find_table(self, table_id: str, language: str = "sv") -> str:
+        """Resolve a table ID (or a full table path) to its path in the metadata tree"""
+        table_id = normalize_path(table_id)
+        if "/" in table_id:
+            return table_id
+
+        key = cache_key("search", normalize_language(language), table_id.lower())
+        hits = await self._cached_get(key, self.url("", language), params={"query": table_id, "filter": "*"})
+        for hit in hits or []:
+            if hit.get("id", "").lower() == table_id.lower():
+                return normalize_path(f"{hit.get('path', '')}/{hit['id']}")
+        # Other hits are different tables; answering with one would return unrelated data
+        raise ValueError(f"Table '{table_id}' not found")
+
+    async def get_table_metadata(self, table_path: str, language: str = "sv") -> dict:
+        """Get title and variables for a table"""
+        key = cache_key("table", normalize_language(language), normalize_path(table_path))
+        result = await self._cached_get(key, self.url(table_path, language))
+        if not isinstance(result, dict) or "variables" not in result:
+            raise ValueError(f"'{normalize_path(table_path)}' is a folder, not a table")
+        return result
+
+    async def get_table_schema(self, table_path: str, language: str = "sv") -> TableSchema:
+        """Get the compiled metadata of a table, fetching it only on the first use or after expiry"""
+        key = cache_key("schema", normalize_language(language), normalize_path(table_path))
+        schema = self.schemas.get(key)
+        if schema is not None:
+            self.schema_hits += 1
+            return schema
+        self.schema_misses += 1
+        schema = TableSchema(await self.get_table_metadata(table_path, language))
+        ttl = self.cache.ttl if self.cache is not None else DEFAULT_TTL
+        self.schemas.set(key, schema, time.time() + ttl)
+        return schema
+
+    def schema_stats(self) -> dict:
+        lookups = self.schema_hits + self.schema_misses
+        return {
+            "entries": len(self.schemas),
+            "hits": self.schema_hits,
+            "misses": self.schema_misses,
+            "hit_ratio": round(self.schema_hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def invalidate_table(self, table_path: str, language: str = "sv") -> None:
+        """Drop cached metadata for a table after it has been updated upstream"""
+        self.schemas.delete(cache_key("schema", normalize_language(language), normalize_path(table_path)))
+        if self.cache is not None:
+            await self.cache.delete(cache_key("table", normalize_language(language), normalize_path(table_path)))
+
+    async def _schema(self, table_path: str, language: str, variables: Optional[list],
+                      schema: Optional[TableSchema]) -> TableSchema:
+        if schema is not None:
+            return schema
+        if variables is not None:
+            return TableSchema({"variables": variables})
+        return await self.get_table_schema(table_path, language)
+
+    async def get_data(self, table_path: str, query: dict, language: str = "sv",
+                       variables: Optional[list] = None, updated: Optional[str] = None,
+                       schema: Optional[TableSchema] = None) -> dict:
+        """Fetch data for a table; 'schema' (or 'variables') may be passed to avoid looking up metadata.
+
+        The query is validated against the table metadata before anything is sent, so
+        unknown variable or value codes fail without an upstream request.
+
+        Queries above SCB's cell limit are split into sub-queries that run concurrently
+        (paced by the rate limiter) and are merged into one response. With a result cache,
+        a repeated query for a table whose 'updated' timestamp is unchanged is served from it.
+        """
+        schema = await self._schema(table_path, language, variables, schema)
+        selection = schema.expand(query)
+        cells = schema.count_cells(query)
+        key = result_key(normalize_path(table_path), normalize_language(language), selection, self.source)
+        if self.result_cache is not None:
+            with tracing.span("result_cache.get") as span:
+                cached = await self.result_cache.get(key, updated)
+                span.set("hit", cached is not None)
+            if cached is not None:
+                return cached
+
+        async def fetch():
+            url = self.url(table_path, language)
+            bodies = plan_selection(selection, cells=cells)
+            tracing.current_span().set("chunks", len(bodies))
+            responses = await asyncio.gather(*(self._request("POST", url, json=body) for body in bodies))
+            data = merge_responses(list(responses))
+            if self.result_cache is not None:
+                with tracing.span("result_cache.set"):
+                    await self.result_cache.set(key, data, updated)
+            return data
+
+        # Equivalent concurrent queries (e.g. '*' and the explicit value list) share one fetch
+        return await self.inflight.do(key, fetch)
+
+    async def iter_data(self, table_path: str, query: dict, language: str = "sv",
+                        variables: Optional[list] = None, max_in_flight: int = DEFAULT_STREAM_IN_FLIGHT,
+                        max_chunks: Optional[int] = None, schema: Optional[TableSchema] = None):
+        """Yield (chunk index, chunk count, response) for each sub-query as it completes.
+
+        At most max_in_flight sub-queries are requested at a time, so memory stays
+        bounded by a few chunks regardless of the total result size.
+        """
+        schema = await self._schema(table_path, language, variables, schema)
+        selection = schema.expand(query)
+        bodies = plan_selection(selection, max_chunks=max_chunks, cells=schema.count_cells(query))
+        url = self.url(table_path, language)
+        pending = {}
+        next_index = 0
+        try:
+            while next_index < len(bodies) or pending:
+                while next_index < len(bodies) and len(pending) < max_in_flight:
+                    task = asyncio.ensure_future(self._request("POST", url, json=bodies[next_index]))
+                    pending[task] = next_index
+                    next_index += 1
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield pending.pop(task), len(bodies), task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_table_url(self, table_path: str, language: str = "sv") -> str:
+        """Get the Statistikdatabasen web URL for a table"""
+        parts = normalize_path(table_path).split("/")
+        return SCB_WEB_URL.format(lang=normalize_language(language)) + "__".join(parts[:-1]) + "/" + parts[-1]
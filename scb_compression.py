@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Negotiated response compression for the HTTP and SSE servers
+An ASGI middleware that compresses with zstd, brotli or gzip depending on Accept-Encoding.
+Streaming responses (NDJSON, SSE) are flushed per chunk so events are not held back.
+"""
+
+import logging
+import os
+import zlib
+from typing import Optional
+
+logger = logging.getLogger("scb-compression")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are sent uncompressed
+DEFAULT_MIN_SIZE = 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def available_encodings() -> list:
+    """Supported content codings in server preference order"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, encodings: Optional[list] = None) -> Optional[str]:
+    """Pick the coding to use for an Accept-Encoding header, or None for identity"""
+    encodings = available_encodings() if encodings is None else encodings
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class Compressor:
+    """Incremental compressor; compress(flush=True) emits everything written so far"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level or 3).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=level or 4)
+        elif encoding == "gzip":
+            self._obj = zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported encoding '{encoding}'")
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self.encoding == "br":
+            out = self._obj.process(data)
+            return out + self._obj.flush() if flush else out
+        out = self._obj.compress(data)
+        if flush:
+            if self.encoding == "zstd":
+                out += self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            else:
+                out += self._obj.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def _compressible(content_type: str) -> bool:
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compress JSON, NDJSON and SSE responses the client accepts in a supported coding"""
+
+    def __init__(self, app, min_size: int = DEFAULT_MIN_SIZE, encodings: Optional[list] = None):
+        self.app = app
+        self.min_size = min_size
+        self.encodings = available_encodings() if encodings is None else encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.lower(): value for key, value in scope.get("headers", [])}
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or not _compressible(content_type):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                # First body chunk decides: small complete responses go out as they are
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding)
+                if not more_body:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers = _compressed_headers(start_message, encoding)
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start_message, "headers": _compressed_headers(start_message, encoding)})
+
+            if more_body:
+                # Flush each chunk so streamed rows and events reach the client promptly
+                chunk = compressor.compress(body, flush=True) if body else b""
+            else:
+                chunk = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _compressed_headers(start_message: dict, encoding: str) -> list:
+    """Response headers for a compressed body: length dropped, coding and Vary added.
+
+    A strong ETag names the uncompressed bytes, so the compressed variant gets a weak one;
+    If-None-Match uses weak comparison, so revalidation still matches.
+    """
+    headers = []
+    for key, value in start_message.get("headers", []):
+        if key.lower() in (b"content-length", b"vary"):
+            continue
+        if key.lower() == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        headers.append((key, value))
+    vary = [value for key, value in start_message.get("headers", []) if key.lower() == b"vary"]
+    headers.append((b"content-encoding", encoding.encode("latin-1")))
+    headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    return headers
+
+
+def compression_options() -> Optional[dict]:
+    """Middleware options from SCB_COMPRESSION and SCB_COMPRESSION_MIN_SIZE; None when disabled"""
+    if os.environ.get("SCB_COMPRESSION", "1") == "0":
+        return None
+    try:
+        min_size = int(os.environ.get("SCB_COMPRESSION_MIN_SIZE", DEFAULT_MIN_SIZE))
+    except ValueError:
+        min_size = DEFAULT_MIN_SIZE
+    return {"min_size": max(0, min_size)}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Execution layer for blocking work
+Runs disk cache and search index I/O, table store lookups, aggregation and other blocking calls in
+a bounded thread pool so they never block the event loop
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("scb-executor")
+
+# Default number of worker threads for blocking calls
+DEFAULT_MAX_WORKERS = 8
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_max_workers() -> int:
+    """Get pool size from SCB_MAX_WORKERS, falling back to the default"""
+    value = os.environ.get("SCB_MAX_WORKERS", "")
+    try:
+        workers = int(value)
+    except ValueError:
+        return DEFAULT_MAX_WORKERS
+    return workers if workers > 0 else DEFAULT_MAX_WORKERS
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the shared thread pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        max_workers = get_max_workers()
+        logger.info(f"Starting SCB worker pool with {max_workers} threads")
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scb-worker")
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Shut down the shared thread pool"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking function in the shared thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
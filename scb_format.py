@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Compact result formats for scb_fetch_data
+PxWeb's JSON repeats every dimension key on every row; these formats store each dimension's
+categories once and the data as flat, typed arrays
+"""
+
+from typing import Optional
+
+FORMATS = ("json", "columnar", "json-stat2")
+
+# Dimension id used for the measures of a table in json-stat2 output
+CONTENTS_CODE = "ContentsCode"
+
+
+def parse_value(value: str):
+    """Parse a PxWeb cell into int or float; symbols such as '..' (missing) become None"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def value_labels(variables: list) -> dict:
+    """Map variable code to {value code: value text} from table metadata"""
+    return {
+        var.get("code"): dict(zip(var.get("values", []), var.get("valueTexts", var.get("values", []))))
+        for var in variables or []
+    }
+
+
+def split_columns(response: dict) -> tuple:
+    """Split PxWeb columns into key columns (dimensions and time) and content columns (measures)"""
+    columns = response.get("columns", [])
+    keys = [col for col in columns if col.get("type") != "c"]
+    measures = [col for col in columns if col.get("type") == "c"]
+    return keys, measures
+
+
+def _dimensions(response: dict, variables: Optional[list]) -> list:
+    """Dimension descriptions with the categories that occur in the data, in table order"""
+    keys, _ = split_columns(response)
+    labels = value_labels(variables)
+    order = {var.get("code"): list(var.get("values", [])) for var in variables or []}
+
+    dimensions = []
+    for position, col in enumerate(keys):
+        code = col.get("code")
+        seen = {row["key"][position] for row in response.get("data", [])}
+        known = [value for value in order.get(code, []) if value in seen]
+        values = known + sorted(seen.difference(known))
+        dimensions.append({
+            "code": code,
+            "text": col.get("text", code),
+            "type": col.get("type", "d"),
+            "values": values,
+            "labels": [labels.get(code, {}).get(value, value) for value in values],
+        })
+    return dimensions
+
+
+def to_columnar(response: dict, variables: Optional[list] = None) -> dict:
+    """Dictionary-encoded columns: per-row category indices plus one typed array per measure.
+
+    Symbols that are not numbers (e.g. '..' for missing) are null in 'values' and kept,
+    by row index, in 'status'.
+    """
+    _, measures = split_columns(response)
+    dimensions = _dimensions(response, variables)
+    positions = [{value: i for i, value in enumerate(dim["values"])} for dim in dimensions]
+    rows = response.get("data", [])
+
+    keys = {dim["code"]: [] for dim in dimensions}
+    values = {col.get("code"): [] for col in measures}
+    status = {}
+    for row_index, row in enumerate(rows):
+        for dim, position, key in zip(dimensions, positions, row["key"]):
+            keys[dim["code"]].append(position[key])
+        for col, raw in zip(measures, row.get("values", [])):
+            value = parse_value(raw)
+            values[col.get("code")].append(value)
+            if value is None and raw is not None:
+                status.setdefault(col.get("code"), {})[str(row_index)] = raw
+
+    result = {
+        "format": "columnar",
+        "rows": len(rows),
+        "dimensions": dimensions,
+        "measures": [{"code": col.get("code"), "text": col.get("text", "")} for col in measures],
+        "keys": keys,
+        "values": values,
+        "comments": response.get("comments", []),
+    }
+    if status:
+        result["status"] = status
+    return result
+
+
+def to_json_stat2(response: dict, variables: Optional[list] = None, label: str = "") -> dict:
+    """JSON-stat 2.0 dataset; measures form the last dimension, as in PxWeb's own json-stat2"""
+    _, measures = split_columns(response)
+    dimensions = _dimensions(response, variables)
+    if measures:
+        dimensions.append({
+            "code": CONTENTS_CODE,
+            "text": CONTENTS_CODE,
+            "type": "c",
+            "values": [col.get("code") for col in measures],
+            "labels": [col.get("text", col.get("code")) for col in measures],
+        })
+
+    sizes = [len(dim["values"]) for dim in dimensions]
+    strides = []
+    stride = 1
+    for size in reversed(sizes):
+        strides.insert(0, stride)
+        stride *= size
+    cells = stride if dimensions else 0
+
+    positions = [{value: i for i, value in enumerate(dim["values"])} for dim in dimensions]
+    values = [None] * cells
+    status = {}
+    for row in response.get("data", []):
+        offset = sum(positions[i][key] * strides[i] for i, key in enumerate(row["key"]))
+        for m, raw in enumerate(row.get("values", [])):
+            index = offset + m * strides[-1] if measures else offset
+            value = parse_value(raw)
+            values[index] = value
+            if value is None and raw is not None:
+                status[str(index)] = raw
+
+    dataset = {
+        "version": "2.0",
+        "class": "dataset",
+        "label": label,
+        "id": [dim["code"] for dim in dimensions],
+        "size": sizes,
+        "dimension": {
+            dim["code"]: {
+                "label": dim["text"],
+                "category": {
+                    "index": {value: i for i, value in enumerate(dim["values"])},
+                    "label": dict(zip(dim["values"], dim["labels"])),
+                },
+            }
+            for dim in dimensions
+        },
+        "value": values,
+    }
+    if status:
+        dataset["status"] = status
+    time_codes = [dim["code"] for dim in dimensions if dim["type"] == "t"]
+    if time_codes or measures:
+        dataset["role"] = {}
+        if time_codes:
+            dataset["role"]["time"] = time_codes
+        if measures:
+            dataset["role"]["metric"] = [CONTENTS_CODE]
+    if response.get("comments"):
+        dataset["note"] = [comment.get("comment", str(comment)) if isinstance(comment, dict) else str(comment)
+                           for comment in response["comments"]]
+    return dataset
+
+
+def format_response(response: dict, format: str = "json", variables: Optional[list] = None,
+                    label: str = "") -> dict:
+    """Convert a (merged) PxWeb JSON response to the requested format"""
+    if format == "columnar":
+        return to_columnar(response, variables)
+    if format == "json-stat2":
+        return to_json_stat2(response, variables, label)
+    if format != "json":
+        raise ValueError(f"Unknown format '{format}'. Available: {', '.join(FORMATS)}")
+    return response
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+HTTP caching helpers: ETags from response content, If-None-Match checks and Cache-Control
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+# Tool results are read-only views of SCB data, so clients and proxies may reuse them briefly
+DEFAULT_MAX_AGE = 300
+
+
+def strong_etag(body: bytes) -> str:
+    """Strong ETag derived from the exact response bytes"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as RFC 9110 specifies for GET"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in (_opaque(tag) for tag in if_none_match.split(","))
+
+
+def get_max_age() -> int:
+    """Cache-Control max-age for tool results, from SCB_HTTP_CACHE_MAX_AGE"""
+    try:
+        value = int(os.environ.get("SCB_HTTP_CACHE_MAX_AGE", DEFAULT_MAX_AGE))
+    except ValueError:
+        return DEFAULT_MAX_AGE
+    return max(0, value)
+
+
+def tool_cache_control(result) -> str:
+    """Cache-Control for a tool result; failed calls are not stored"""
+    if isinstance(result, dict) and "error" in result:
+        return "no-store"
+    return f"public, max-age={get_max_age()}"
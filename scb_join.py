@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Server-side join of PxWeb responses from several tables
+Rows are aligned on shared dimensions (e.g. Region and Tid) through a dict keyed by the
+join values; dimensions a table does not share are pivoted into separate value columns
+"""
+
+from typing import Optional
+
+from scb_format import parse_value, split_columns, value_labels
+
+JOIN_TYPES = ("inner", "outer")
+
+
+def _key_codes(response: dict) -> list:
+    return [col.get("code") for col in split_columns(response)[0]]
+
+
+def shared_dimensions(responses: list) -> list:
+    """Dimension codes present in every response, in the order of the first"""
+    if not responses:
+        return []
+    shared = _key_codes(responses[0])
+    for response in responses[1:]:
+        codes = set(_key_codes(response))
+        shared = [code for code in shared if code in codes]
+    return shared
+
+
+def join_responses(tables: list, on: Optional[list] = None, how: str = "inner") -> dict:
+    """Join PxWeb responses on shared dimensions.
+
+    'tables' holds dicts with table_id, response and optionally variables (table
+    metadata, for labels). Returns a columnar result: the join key values per row, and
+    one value array per table measure and combination of non-shared dimension values.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unknown join type '{how}'. Available: {', '.join(JOIN_TYPES)}")
+    responses = [table["response"] for table in tables]
+    on = list(on) if on else shared_dimensions(responses)
+    if not on:
+        raise ValueError("The tables share no dimensions to join on; pass 'on' explicitly")
+
+    columns = []
+    column_index = {}
+    rows = {}
+    seen_in = {}
+    labels = {code: {} for code in on}
+
+    for table_number, table in enumerate(tables):
+        response = table["response"]
+        key_cols, measures = split_columns(response)
+        keys = [col.get("code") for col in key_cols]
+        missing = [code for code in on if code not in keys]
+        if missing:
+            raise ValueError(f"Table {table['table_id']} has no dimension {', '.join(missing)}")
+        join_positions = [keys.index(code) for code in on]
+        extra_positions = [i for i, code in enumerate(keys) if code not in on]
+        table_labels = value_labels(table.get("variables"))
+
+        for row in response.get("data", []):
+            key = tuple(row["key"][i] for i in join_positions)
+            extra = tuple((keys[i], row["key"][i]) for i in extra_positions)
+
+            values = rows.get(key)
+            if values is None:
+                values = rows[key] = {}
+                for code, value in zip(on, key):
+                    labels[code].setdefault(value, table_labels.get(code, {}).get(value, value))
+            seen_in.setdefault(key, set()).add(table_number)
+
+            for measure, raw in zip(measures, row.get("values", [])):
+                name_key = (table_number, measure.get("code"), extra)
+                index = column_index.get(name_key)
+                if index is None:
+                    index = column_index[name_key] = len(columns)
+                    name = f"{table['table_id']}.{measure.get('code')}"
+                    if extra:
+                        name += "[" + ",".join(f"{code}={value}" for code, value in extra) + "]"
+                    columns.append({
+                        "name": name,
+                        "table_id": table["table_id"],
+                        "measure": measure.get("code"),
+                        "text": measure.get("text", ""),
+                        "filter": dict(extra),
+                    })
+                values[index] = parse_value(raw)
+
+    if how == "inner":
+        keys_out = [key for key in rows if len(seen_in[key]) == len(tables)]
+    else:
+        keys_out = list(rows)
+
+    return {
+        "on": on,
+        "how": how,
+        "rows": len(keys_out),
+        "keys": {code: [key[i] for key in keys_out] for i, code in enumerate(on)},
+        "labels": {code: {value: labels[code][value] for value in dict.fromkeys(key[i] for key in keys_out)}
+                   for i, code in enumerate(on)},
+        "columns": columns,
+        "values": {column["name"]: [rows[key].get(i) for key in keys_out] for i, column in enumerate(columns)},
+    }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Response encoding for the SCB servers
+Compact JSON by default, with orjson as a fast path when it is installed
+"""
+
+import importlib.util
+import json
+import logging
+import os
+from typing import Any, Optional
+
+logger = logging.getLogger("scb-json")
+
+ENCODERS = ("auto", "orjson", "json")
+
+
+def orjson_available() -> bool:
+    return importlib.util.find_spec("orjson") is not None
+
+
+class JsonEncoder:
+    """Standard library encoder; indent=None gives compact separators"""
+
+    name = "json"
+
+    def __init__(self, indent: Optional[int] = None):
+        self.indent = indent or None
+        self.separators = None if self.indent else (",", ":")
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.dumps_str(obj).encode("utf-8")
+
+    def dumps_str(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=self.indent, separators=self.separators, default=str)
+
+
+class OrjsonEncoder(JsonEncoder):
+    """orjson encoder; orjson only indents by two spaces, so any indent means two"""
+
+    name = "orjson"
+
+    def __init__(self, indent: Optional[int] = None):
+        super().__init__(indent)
+        import orjson
+        self._orjson = orjson
+        self.option = orjson.OPT_INDENT_2 if self.indent else 0
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._orjson.dumps(obj, option=self.option, default=str)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the standard library handles anything JSON can
+            return JsonEncoder.dumps_str(self, obj).encode("utf-8")
+
+    def dumps_str(self, obj: Any) -> str:
+        return self.dumps(obj).decode("utf-8")
+
+
+def make_encoder(name: str = "auto", indent: Optional[int] = None) -> JsonEncoder:
+    """Build an encoder by name; 'auto' uses orjson when it is installed"""
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown JSON encoder '{name}'. Available: {', '.join(ENCODERS)}")
+    if name == "orjson" or (name == "auto" and orjson_available()):
+        try:
+            return OrjsonEncoder(indent)
+        except ImportError:
+            logger.warning("orjson is not installed, using the standard json encoder")
+    return JsonEncoder(indent)
+
+
+_encoder: Optional[JsonEncoder] = None
+
+
+def get_encoder() -> JsonEncoder:
+    """Get the process-wide encoder, configured from SCB_JSON_ENCODER and SCB_JSON_INDENT"""
+    global _encoder
+    if _encoder is None:
+        name = os.environ.get("SCB_JSON_ENCODER", "auto").lower()
+        try:
+            indent = int(os.environ.get("SCB_JSON_INDENT", "0"))
+        except ValueError:
+            indent = 0
+        try:
+            _encoder = make_encoder(name, indent)
+        except ValueError as e:
+            logger.warning(f"{e}; using 'auto'")
+            _encoder = make_encoder("auto", indent)
+    return _encoder
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as UTF-8 JSON bytes"""
+    return get_encoder().dumps(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    """Encode obj as a JSON string"""
+    return get_encoder().dumps_str(obj)
+
+
+def wrap_result(encoded: bytes, success: bool = True) -> bytes:
+    """Build {"success": ..., "result": ...} around an already encoded result without re-encoding it"""
+    return b'{"success":' + (b"true" if success else b"false") + b',"result":' + encoded + b"}"
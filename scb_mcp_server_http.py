@@ -6,151 +6,77 @@ Exposes the server over HTTP using JSON-RPC style endpoints for external AI assi
 
 import json
 import logging
-from typing import Any
-from pyscbwrapper import SCB
+from typing import Any, Optional
+import scb_metrics
+import scb_tools
+import scb_tracing
+from scb_compression import CompressionMiddleware, compression_options
+from scb_http_cache import etag_matches, strong_etag, tool_cache_control
+from scb_json import dumps, wrap_result
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import asyncio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("scb-mcp-http-server")
 
-# Initialize FastAPI
-api = FastAPI(title="SCB MCP Server", version="1.0.0")
-
-# Initialize SCB clients for both languages
-scb_sv = SCB("sv")  # Swedish
-scb_en = SCB("en")  # English
-
-
-def get_scb_client(lang: str = "sv") -> SCB:
-    """Get SCB client for specified language"""
-    return scb_en if lang.lower() == "en" else scb_sv
-
-
-# Tool implementation functions
-async def browse_metadata(path: str = "", language: str = "sv") -> dict:
-    """Browse SCB metadata tree"""
-    scb = get_scb_client(language)
-
-    try:
-        if path:
-            result = scb.go_down(path)
-        else:
-            result = scb.info()
-
-        metadata = {
-            "path": path or "root",
-            "language": language,
-            "items": []
-        }
-
-        if isinstance(result, list):
-            for item in result:
-                metadata["items"].append({
-                    "id": item.get("id", ""),
-                    "text": item.get("text", ""),
-                    "type": item.get("type", ""),
-                })
-
-        return metadata
-
-    except Exception as e:
-        return {"error": str(e), "path": path, "language": language}
-
-
-async def search_tables(query: str, language: str = "sv") -> dict:
-    """Search for tables matching query"""
-    scb = get_scb_client(language)
-
-    try:
-        root = scb.info()
-        results = {
-            "query": query,
-            "language": language,
-            "matches": []
-        }
-
-        query_lower = query.lower()
-        for item in root:
-            text = item.get("text", "").lower()
-            if query_lower in text:
-                results["matches"].append({
-                    "id": item.get("id", ""),
-                    "text": item.get("text", ""),
-                    "type": item.get("type", ""),
-                })
-
-        return results
-
-    except Exception as e:
-        return {"error": str(e), "query": query, "language": language}
-
-
-async def get_table_metadata(table_id: str, language: str = "sv") -> dict:
-    """Get detailed metadata for a table"""
-    scb = get_scb_client(language)
 
-    try:
-        scb.set_table(table_id)
-        variables = scb.get_variables()
 
-        metadata = {
-            "table_id": table_id,
-            "language": language,
-            "variables": variables
-        }
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start shared SCB state, and close it on shutdown"""
+    await scb_tools.startup()
+    yield
+    await scb_tools.shutdown()
 
-        return metadata
 
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "language": language}
+# Streaming responses for scb_fetch_data are newline-delimited JSON
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
 
-async def fetch_data(table_id: str, query: dict, language: str = "sv") -> dict:
-    """Fetch data from a table"""
-    scb = get_scb_client(language)
+class EncodedJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured (compact, orjson when available) encoder"""
 
-    try:
-        scb.set_table(table_id)
-        scb_query = scb.get_query()
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
 
-        for var_name, values in query.items():
-            if "*" in values:
-                scb_query[var_name] = scb_query[var_name]["values"]
-            else:
-                scb_query[var_name] = values
 
-        data = scb.get_data(scb_query)
+def conditional_response(request: Request, body: bytes, cache_control: str) -> Response:
+    """JSON response with a content ETag, or 304 Not Modified if the client already has it"""
+    etag = strong_etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-        return {
-            "table_id": table_id,
-            "language": language,
-            "query": query,
-            "data": data
-        }
 
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "query": query, "language": language}
+async def ndjson_events(events):
+    """Encode stream_fetch_data events as NDJSON: one line per data row, framed by meta/progress/end lines.
 
+    Each sub-query chunk is sent as one block, so compression works on whole chunks rather than
+    being flushed after every row.
+    """
+    async for event in events:
+        lines = []
+        if event["type"] == "rows":
+            if "columns" in event:
+                # The following rows' values belong to these columns rather than the meta line's
+                lines.append(dumps({"type": "columns", "columns": event["columns"]}))
+            lines.extend(dumps(row) for row in event["data"])
+            event = {key: value for key, value in event.items() if key not in ("data", "columns")}
+            event["type"] = "progress"
+        lines.append(dumps(event))
+        yield b"\n".join(lines) + b"\n"
 
-async def get_table_info(table_id: str, language: str = "sv") -> dict:
-    """Get general information about a table"""
-    scb = get_scb_client(language)
 
-    try:
-        scb.set_table(table_id)
-
-        return {
-            "table_id": table_id,
-            "language": language,
-            "url": scb.get_url(),
-            "info": "Table found and accessible"
-        }
+# Initialize FastAPI
+api = FastAPI(title="SCB MCP Server", version="1.0.0", lifespan=lifespan, default_response_class=EncodedJSONResponse)
 
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "language": language}
+# Compress responses the client accepts compressed (zstd, brotli or gzip)
+if compression_options() is not None:
+    api.add_middleware(CompressionMiddleware, **compression_options())
 
 
 # FastAPI endpoints
@@ -165,12 +91,20 @@ async def root():
         "endpoints": {
             "tools": "/tools",
             "call_tool": "/call_tool",
-            "health": "/health"
+            "call_tools": "/call_tools",
+            "jsonrpc": "/jsonrpc",
+            "health": "/health",
+            "metrics": "/metrics"
         },
         "usage": {
             "list_tools": "GET /tools",
             "call_tool": "POST /call_tool with {name: string, arguments: object}",
-            "health_check": "GET /health"
+            "call_tool_get": "GET /call_tool/{name}?arguments=<JSON object>, cacheable by proxies",
+            "call_tools": "POST /call_tools with {calls: [{name, arguments}, ...]}",
+            "jsonrpc": "POST /jsonrpc with a JSON-RPC 2.0 request or batch (methods tools/list, tools/call)",
+            "stream_data": "POST /call_tool with {name: 'scb_fetch_data', arguments: object, stream: true}",
+            "health_check": "GET /health",
+            "metrics": "GET /metrics (Prometheus text format)"
         }
     }
 
@@ -178,142 +112,32 @@ async def root():
 @api.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "scb-mcp-server"}
+    return {"status": "healthy", "service": "scb-mcp-server", "upstream": scb_tools.upstream_stats()}
+
+
+@api.get("/metrics")
+async def metrics():
+    """Tool and upstream metrics in the Prometheus text format"""
+    return Response(content=scb_metrics.render(), media_type=scb_metrics.CONTENT_TYPE)
 
 
 @api.get("/tools")
-async def list_tools():
-    """List available SCB data tools"""
-    return {
-        "tools": [
-            {
-                "name": "scb_browse_metadata",
-                "description": (
-                    "Browse SCB metadata tree to discover available statistical tables. "
-                    "Start from root or navigate to specific paths. "
-                    "Returns metadata including table IDs, titles, and navigation options. "
-                    "Supports both Swedish (sv) and English (en)."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "path": {
-                            "type": "string",
-                            "description": "Path in metadata tree (e.g., 'AM/AM0401' or empty for root)",
-                            "default": "",
-                        },
-                        "language": {
-                            "type": "string",
-                            "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                            "enum": ["sv", "en"],
-                            "default": "sv",
-                        },
-                    },
-                },
-            },
-            {
-                "name": "scb_search_tables",
-                "description": (
-                    "Search for statistical tables in SCB database using keywords. "
-                    "Returns matching tables with their IDs, titles, and descriptions. "
-                    "Supports both Swedish and English search."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "Search query (e.g., 'befolkning', 'population', 'arbetslöshet', 'unemployment')",
-                        },
-                        "language": {
-                            "type": "string",
-                            "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                            "enum": ["sv", "en"],
-                            "default": "sv",
-                        },
-                    },
-                    "required": ["query"],
-                },
-            },
-            {
-                "name": "scb_get_table_metadata",
-                "description": (
-                    "Get detailed metadata for a specific SCB table including available variables, "
-                    "dimensions, time periods, and value codes. This is essential before fetching data."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "table_id": {
-                            "type": "string",
-                            "description": "SCB table ID (e.g., 'TAB638', 'BE0101N1')",
-                        },
-                        "language": {
-                            "type": "string",
-                            "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                            "enum": ["sv", "en"],
-                            "default": "sv",
-                        },
-                    },
-                    "required": ["table_id"],
-                },
-            },
-            {
-                "name": "scb_fetch_data",
-                "description": (
-                    "Fetch actual statistical data from an SCB table. "
-                    "Requires table_id and query specification with variables and their values. "
-                    "Returns data in structured JSON format."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "table_id": {
-                            "type": "string",
-                            "description": "SCB table ID",
-                        },
-                        "query": {
-                            "type": "object",
-                            "description": (
-                                "Query specification with variables and selected values. "
-                                "Example: {'Region': ['*'], 'Tid': ['2023', '2024']}"
-                            ),
-                        },
-                        "language": {
-                            "type": "string",
-                            "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                            "enum": ["sv", "en"],
-                            "default": "sv",
-                        },
-                    },
-                    "required": ["table_id", "query"],
-                },
-            },
-            {
-                "name": "scb_get_table_info",
-                "description": (
-                    "Get comprehensive information about a specific table including its location path, "
-                    "full URL, and basic metadata. Useful for understanding table context."
-                ),
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "table_id": {
-                            "type": "string",
-                            "description": "SCB table ID",
-                        },
-                        "language": {
-                            "type": "string",
-                            "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                            "enum": ["sv", "en"],
-                            "default": "sv",
-                        },
-                    },
-                    "required": ["table_id"],
-                },
-            },
-        ]
-    }
+async def list_tools(request: Request):
+    """List available SCB data tools; clients revalidate with If-None-Match"""
+    return conditional_response(request, dumps({"tools": scb_tools.TOOL_DEFINITIONS}), "public, no-cache")
+
+
+async def run_tool(request: Request, name: str, arguments: Any) -> Response:
+    """Run a tool and answer with an ETag and Cache-Control, honouring If-None-Match.
+
+    Tools only read SCB data, so repeating a call is safe and a matching ETag gets 304.
+    """
+    with scb_tracing.trace(f"{request.method} {request.url.path}", server="http", **{"tool.name": name}) as span:
+        # The result arrives encoded, so coalesced calls share one serialization
+        result, encoded = await scb_tools.call_tool_encoded(name, arguments)
+        response = conditional_response(request, wrap_result(encoded), tool_cache_control(result))
+        span.set("http.status_code", response.status_code)
+        return response
 
 
 @api.post("/call_tool")
@@ -325,74 +149,100 @@ async def call_tool(request: Request):
         arguments = body.get("arguments", {})
 
         if not name:
-            return JSONResponse(
+            return EncodedJSONResponse(
                 status_code=400,
                 content={"error": "Missing 'name' field in request"}
             )
 
         logger.info(f"Tool called: {name} with args: {arguments}")
 
-        # Route to the appropriate tool
-        if name == "scb_browse_metadata":
-            result = await browse_metadata(
-                path=arguments.get("path", ""),
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_search_tables":
-            if "query" not in arguments:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": "Missing required argument 'query'"}
-                )
-            result = await search_tables(
-                query=arguments["query"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_get_table_metadata":
-            if "table_id" not in arguments:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": "Missing required argument 'table_id'"}
-                )
-            result = await get_table_metadata(
-                table_id=arguments["table_id"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_fetch_data":
-            if "table_id" not in arguments or "query" not in arguments:
-                return JSONResponse(
+        # Stream large data results row by row instead of building one JSON document
+        stream = body.get("stream", False)
+        if stream or (name == "scb_fetch_data" and NDJSON_MEDIA_TYPE in request.headers.get("accept", "")):
+            if name != "scb_fetch_data":
+                return EncodedJSONResponse(
                     status_code=400,
-                    content={"error": "Missing required arguments 'table_id' and/or 'query'"}
+                    content={"error": "Streaming is only supported for scb_fetch_data"}
                 )
-            result = await fetch_data(
-                table_id=arguments["table_id"],
-                query=arguments["query"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_get_table_info":
-            if "table_id" not in arguments:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": "Missing required argument 'table_id'"}
-                )
-            result = await get_table_info(
-                table_id=arguments["table_id"],
-                language=arguments.get("language", "sv")
-            )
-        else:
-            return JSONResponse(
-                status_code=404,
-                content={"error": f"Unknown tool: {name}"}
+            kwargs = scb_tools.prepare_stream_arguments(arguments)
+            return StreamingResponse(
+                ndjson_events(scb_tools.stream_fetch_data(**kwargs)),
+                media_type=NDJSON_MEDIA_TYPE
             )
 
-        return JSONResponse(content={
-            "success": True,
-            "result": result
-        })
+        return await run_tool(request, name, arguments)
+
+    except scb_tools.ToolError as e:
+        return EncodedJSONResponse(
+            status_code=e.status_code,
+            content={"error": str(e)}
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        return EncodedJSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "error": str(e)
+            }
+        )
+
+
+@api.get("/call_tool/{name}")
+async def call_tool_get(request: Request, name: str, arguments: str = "{}"):
+    """Call a tool with JSON-encoded arguments in the query string, so HTTP caches can store the result"""
+    try:
+        try:
+            arguments = json.loads(arguments)
+        except ValueError:
+            raise scb_tools.ToolError("'arguments' must be a JSON object")
+        if not isinstance(arguments, dict):
+            raise scb_tools.ToolError("'arguments' must be a JSON object")
+
+        logger.info(f"Tool called (GET): {name} with args: {arguments}")
+        return await run_tool(request, name, arguments)
+
+    except scb_tools.ToolError as e:
+        return EncodedJSONResponse(
+            status_code=e.status_code,
+            content={"error": str(e)}
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        return EncodedJSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "error": str(e)
+            }
+        )
+
+
+@api.post("/call_tools")
+async def call_tools(request: Request):
+    """Call several tools concurrently; results come back in request order with per-call errors"""
+    try:
+        body = await request.json()
+        calls = body.get("calls") if isinstance(body, dict) else body
+        if not isinstance(calls, list):
+            raise scb_tools.ToolError("Expected {calls: [...]} or an array of calls")
+
+        logger.info(f"Batch of {len(calls)} tool calls")
+        with scb_tracing.trace("POST /call_tools", server="http", calls=len(calls)):
+            results = await scb_tools.call_tools(calls)
+        return EncodedJSONResponse(content={"success": True, "results": results})
+
+    except scb_tools.ToolError as e:
+        return EncodedJSONResponse(
+            status_code=e.status_code,
+            content={"error": str(e)}
+        )
 
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
-        return JSONResponse(
+        return EncodedJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -401,6 +251,74 @@ async def call_tool(request: Request):
         )
 
 
+# JSON-RPC 2.0 error codes
+JSONRPC_PARSE_ERROR = -32700
+JSONRPC_INVALID_REQUEST = -32600
+JSONRPC_METHOD_NOT_FOUND = -32601
+JSONRPC_INVALID_PARAMS = -32602
+JSONRPC_INTERNAL_ERROR = -32603
+
+
+def jsonrpc_error(request_id: Any, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+async def jsonrpc_call(message: Any) -> Optional[dict]:
+    """Answer one JSON-RPC request; notifications (no id) get no response"""
+    if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" or not isinstance(message.get("method"), str):
+        return jsonrpc_error(None, JSONRPC_INVALID_REQUEST, "Invalid Request")
+
+    request_id = message.get("id")
+    notification = "id" not in message
+    method = message["method"]
+    params = message.get("params") or {}
+
+    if method == "tools/list":
+        response = {"jsonrpc": "2.0", "id": request_id, "result": {"tools": scb_tools.TOOL_DEFINITIONS}}
+    elif method == "tools/call":
+        if not isinstance(params, dict) or not params.get("name"):
+            response = jsonrpc_error(request_id, JSONRPC_INVALID_PARAMS, "params.name is required")
+        else:
+            with scb_tracing.trace("POST /jsonrpc", server="http", **{"tool.name": str(params["name"])}):
+                outcome = (await scb_tools.call_tools([params]))[0]
+            if outcome["success"]:
+                response = {"jsonrpc": "2.0", "id": request_id, "result": outcome["result"]}
+            elif outcome["status"] == 404:
+                response = jsonrpc_error(request_id, JSONRPC_METHOD_NOT_FOUND, outcome["error"])
+            elif outcome["status"] == 400:
+                response = jsonrpc_error(request_id, JSONRPC_INVALID_PARAMS, outcome["error"])
+            else:
+                response = jsonrpc_error(request_id, JSONRPC_INTERNAL_ERROR, outcome["error"])
+    else:
+        response = jsonrpc_error(request_id, JSONRPC_METHOD_NOT_FOUND, f"Method not found: {method}")
+
+    return None if notification else response
+
+
+@api.post("/jsonrpc")
+async def jsonrpc(request: Request):
+    """JSON-RPC 2.0 endpoint; a batch (array) runs its calls concurrently and answers in order"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return EncodedJSONResponse(content=jsonrpc_error(None, JSONRPC_PARSE_ERROR, "Parse error"))
+
+    if not isinstance(body, list):
+        response = await jsonrpc_call(body)
+        return EncodedJSONResponse(content=response) if response is not None else Response(status_code=204)
+
+    if not body:
+        return EncodedJSONResponse(content=jsonrpc_error(None, JSONRPC_INVALID_REQUEST, "Invalid Request"))
+    if len(body) > scb_tools.MAX_BATCH_CALLS:
+        return EncodedJSONResponse(content=jsonrpc_error(
+            None, JSONRPC_INVALID_REQUEST, f"Batch has {len(body)} calls (limit {scb_tools.MAX_BATCH_CALLS})"
+        ))
+
+    logger.info(f"JSON-RPC batch of {len(body)} requests")
+    responses = [r for r in await asyncio.gather(*(jsonrpc_call(m) for m in body)) if r is not None]
+    return EncodedJSONResponse(content=responses) if responses else Response(status_code=204)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -409,6 +327,7 @@ if __name__ == "__main__":
     logger.info("Available endpoints:")
     logger.info("  - GET  /         - Server info")
     logger.info("  - GET  /health   - Health check")
+    logger.info("  - GET  /metrics  - Prometheus metrics")
     logger.info("  - GET  /tools    - List available tools")
     logger.info("  - POST /call_tool - Call a tool")
 
@@ -8,13 +8,19 @@ import json
 import logging
 import asyncio
 from typing import Any
-from pyscbwrapper import SCB
+import scb_metrics
+import scb_tools
+import scb_tracing
+from scb_compression import CompressionMiddleware, compression_options
+from scb_json import dumps_str
 from mcp.server import Server
 from mcp.server.sse import SseServerTransport
 from mcp.types import Tool, TextContent
+from contextlib import asynccontextmanager
 from starlette.applications import Starlette
+from starlette.middleware import Middleware
 from starlette.routing import Route
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 import uvicorn
 
 # Configure logging
@@ -24,140 +30,12 @@ logger = logging.getLogger("scb-mcp-sse-server")
 # Initialize the MCP server
 mcp_server = Server("scb-statistics")
 
-# Initialize SCB clients for both languages
-scb_sv = SCB("sv")
-scb_en = SCB("en")
-
-
-def get_scb_client(lang: str = "sv") -> SCB:
-    """Get SCB client for specified language"""
-    return scb_en if lang.lower() == "en" else scb_sv
-
 
 # MCP Tool definitions
 @mcp_server.list_tools()
 async def list_tools() -> list[Tool]:
     """List available SCB data tools"""
-    return [
-        Tool(
-            name="scb_browse_metadata",
-            description=(
-                "Browse SCB metadata tree to discover available statistical tables. "
-                "Start from root or navigate to specific paths. "
-                "Returns metadata including table IDs, titles, and navigation options. "
-                "Supports both Swedish (sv) and English (en)."
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path in metadata tree (e.g., 'AM/AM0401' or empty for root)",
-                        "default": "",
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                        "enum": ["sv", "en"],
-                        "default": "sv",
-                    },
-                },
-            },
-        ),
-        Tool(
-            name="scb_search_tables",
-            description=(
-                "Search for statistical tables in SCB database using keywords. "
-                "Returns matching tables with their IDs, titles, and descriptions. "
-                "Supports both Swedish and English search."
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query (e.g., 'befolkning', 'population')",
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                        "enum": ["sv", "en"],
-                        "default": "sv",
-                    },
-                },
-                "required": ["query"],
-            },
-        ),
-        Tool(
-            name="scb_get_table_metadata",
-            description=(
-                "Get detailed metadata for a specific SCB table including available variables, "
-                "dimensions, time periods, and value codes. Essential before fetching data."
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "table_id": {
-                        "type": "string",
-                        "description": "SCB table ID (e.g., 'BE0101N1')",
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
-                        "enum": ["sv", "en"],
-                        "default": "sv",
-                    },
-                },
-                "required": ["table_id"],
-            },
-        ),
-        Tool(
-            name="scb_fetch_data",
-            description=(
-                "Fetch actual statistical data from an SCB table. "
-                "Requires table_id and query specification with variables and values."
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "table_id": {
-                        "type": "string",
-                        "description": "SCB table ID",
-                    },
-                    "query": {
-                        "type": "object",
-                        "description": "Query specification. Example: {'Region': ['*'], 'Tid': ['2023']}",
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "Language: 'sv' or 'en'",
-                        "enum": ["sv", "en"],
-                        "default": "sv",
-                    },
-                },
-                "required": ["table_id", "query"],
-            },
-        ),
-        Tool(
-            name="scb_get_table_info",
-            description="Get comprehensive information about a specific table.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "table_id": {
-                        "type": "string",
-                        "description": "SCB table ID",
-                    },
-                    "language": {
-                        "type": "string",
-                        "enum": ["sv", "en"],
-                        "default": "sv",
-                    },
-                },
-                "required": ["table_id"],
-            },
-        ),
-    ]
+    return [Tool(**tool) for tool in scb_tools.TOOL_DEFINITIONS]
 
 
 @mcp_server.call_tool()
@@ -166,160 +44,22 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     try:
         logger.info(f"Tool called: {name} with args: {arguments}")
 
-        if name == "scb_browse_metadata":
-            result = await browse_metadata(
-                path=arguments.get("path", ""),
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_search_tables":
-            result = await search_tables(
-                query=arguments["query"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_get_table_metadata":
-            result = await get_table_metadata(
-                table_id=arguments["table_id"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_fetch_data":
-            result = await fetch_data(
-                table_id=arguments["table_id"],
-                query=arguments["query"],
-                language=arguments.get("language", "sv")
-            )
-        elif name == "scb_get_table_info":
-            result = await get_table_info(
-                table_id=arguments["table_id"],
-                language=arguments.get("language", "sv")
-            )
-        else:
-            raise ValueError(f"Unknown tool: {name}")
-
-        return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+        with scb_tracing.trace("mcp call_tool", server="sse", **{"tool.name": name}):
+            _, encoded = await scb_tools.call_tool_encoded(name, arguments)
+            return [TextContent(type="text", text=encoded.decode("utf-8"))]
 
     except Exception as e:
         logger.error(f"Error in {name}: {str(e)}", exc_info=True)
         return [TextContent(
             type="text",
-            text=json.dumps({
+            text=dumps_str({
                 "error": str(e),
                 "tool": name,
                 "arguments": arguments
-            }, indent=2, ensure_ascii=False)
+            })
         )]
 
 
-# Tool implementations
-async def browse_metadata(path: str = "", language: str = "sv") -> dict:
-    """Browse SCB metadata tree"""
-    scb = get_scb_client(language)
-    try:
-        if path:
-            result = scb.go_down(path)
-        else:
-            result = scb.info()
-
-        metadata = {
-            "path": path or "root",
-            "language": language,
-            "items": []
-        }
-
-        if isinstance(result, list):
-            for item in result:
-                metadata["items"].append({
-                    "id": item.get("id", ""),
-                    "text": item.get("text", ""),
-                    "type": item.get("type", ""),
-                })
-
-        return metadata
-    except Exception as e:
-        return {"error": str(e), "path": path, "language": language}
-
-
-async def search_tables(query: str, language: str = "sv") -> dict:
-    """Search for tables matching query"""
-    scb = get_scb_client(language)
-    try:
-        root = scb.info()
-        results = {
-            "query": query,
-            "language": language,
-            "matches": []
-        }
-
-        query_lower = query.lower()
-        for item in root:
-            text = item.get("text", "").lower()
-            if query_lower in text:
-                results["matches"].append({
-                    "id": item.get("id", ""),
-                    "text": item.get("text", ""),
-                    "type": item.get("type", ""),
-                })
-
-        return results
-    except Exception as e:
-        return {"error": str(e), "query": query, "language": language}
-
-
-async def get_table_metadata(table_id: str, language: str = "sv") -> dict:
-    """Get detailed metadata for a table"""
-    scb = get_scb_client(language)
-    try:
-        scb.set_table(table_id)
-        variables = scb.get_variables()
-
-        return {
-            "table_id": table_id,
-            "language": language,
-            "variables": variables
-        }
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "language": language}
-
-
-async def fetch_data(table_id: str, query: dict, language: str = "sv") -> dict:
-    """Fetch data from a table"""
-    scb = get_scb_client(language)
-    try:
-        scb.set_table(table_id)
-        scb_query = scb.get_query()
-
-        for var_name, values in query.items():
-            if "*" in values:
-                scb_query[var_name] = scb_query[var_name]["values"]
-            else:
-                scb_query[var_name] = values
-
-        data = scb.get_data(scb_query)
-
-        return {
-            "table_id": table_id,
-            "language": language,
-            "query": query,
-            "data": data
-        }
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "query": query, "language": language}
-
-
-async def get_table_info(table_id: str, language: str = "sv") -> dict:
-    """Get general information about a table"""
-    scb = get_scb_client(language)
-    try:
-        scb.set_table(table_id)
-        return {
-            "table_id": table_id,
-            "language": language,
-            "url": scb.get_url(),
-            "info": "Table found and accessible"
-        }
-    except Exception as e:
-        return {"error": str(e), "table_id": table_id, "language": language}
-
-
 # Starlette app for SSE
 async def handle_sse(request):
     """Handle SSE endpoint"""
@@ -340,14 +80,49 @@ async def handle_messages(request):
     return Response(status_code=200)
 
 
+async def sse_events(events):
+    """Encode stream_fetch_data events as Server-Sent Events named after their type"""
+    async for event in events:
+        yield f"event: {event['type']}\ndata: {dumps_str(event)}\n\n"
+
+
+async def handle_fetch_stream(request):
+    """Stream scb_fetch_data results as SSE events while sub-queries complete"""
+    try:
+        arguments = await request.json()
+        kwargs = scb_tools.prepare_stream_arguments(arguments)
+    except (ValueError, scb_tools.ToolError) as e:
+        return Response(
+            status_code=400,
+            content=json.dumps({"error": str(e)}),
+            media_type="application/json"
+        )
+
+    logger.info(f"Streaming scb_fetch_data with args: {kwargs}")
+    return StreamingResponse(
+        sse_events(scb_tools.stream_fetch_data(**kwargs)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 async def health(request):
     """Health check"""
     return Response(
-        content=json.dumps({"status": "healthy", "service": "scb-mcp-sse-server"}),
+        content=json.dumps({
+            "status": "healthy",
+            "service": "scb-mcp-sse-server",
+            "upstream": scb_tools.upstream_stats()
+        }),
         media_type="application/json"
     )
 
 
+async def metrics(request):
+    """Tool and upstream metrics in the Prometheus text format"""
+    return Response(content=scb_metrics.render(), media_type=scb_metrics.CONTENT_TYPE)
+
+
 async def root(request):
     """Root endpoint"""
     return Response(
@@ -355,21 +130,36 @@ async def root(request):
             "name": "SCB MCP Server",
             "version": "1.0.0",
             "protocol": "MCP over SSE",
-            "sse_endpoint": "/sse"
+            "sse_endpoint": "/sse",
+            "fetch_stream_endpoint": "/fetch_data/stream",
+            "metrics_endpoint": "/metrics"
         }),
         media_type="application/json"
     )
 
 
+@asynccontextmanager
+async def lifespan(app):
+    """Start shared SCB state, and close it on shutdown"""
+    await scb_tools.startup()
+    yield
+    await scb_tools.shutdown()
+
+
 # Create Starlette app
 app = Starlette(
     debug=True,
+    lifespan=lifespan,
     routes=[
         Route("/", root),
         Route("/health", health),
+        Route("/metrics", metrics),
         Route("/sse", handle_sse),
         Route("/messages", handle_messages, methods=["POST"]),
+        Route("/fetch_data/stream", handle_fetch_stream, methods=["POST"]),
     ],
+    # Compress responses and event streams the client accepts compressed
+    middleware=[Middleware(CompressionMiddleware, **compression_options())] if compression_options() is not None else [],
 )
 
 
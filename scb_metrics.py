@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for tool calls and upstream SCB requests
+Each tool call carries a timer in a context variable; the SCB client adds the time spent waiting
+for the rate limiter and for SCB to it, so latency is split into upstream, rate limit,
+serialization and local processing. Rendered in the Prometheus text format at /metrics.
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds: SCB answers in 50 ms - 5 s, large split queries take longer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Response size buckets in bytes, 256 B to 64 MiB
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+# Phases of a tool call; 'local' is what remains of the total after the others
+PHASES = ("upstream", "rate_limit", "serialization", "local")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A metric family with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self) -> list:
+        """(suffix, label values, extra label, value) tuples for rendering"""
+        with self._lock:
+            return [("", key, "", value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.label_names, key, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def add(self, amount: float, *labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; each label set stores bucket counts, sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> list:
+        with self._lock:
+            entries = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        samples = []
+        for key, (counts, total, count) in entries:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                samples.append(("_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append(("_bucket", key, 'le="+Inf"', count))
+            samples.append(("_sum", key, "", total))
+            samples.append(("_count", key, "", count))
+        return samples
+
+
+class Registry:
+    """Ordered collection of metric families"""
+
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+    def clear(self) -> None:
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+tool_calls = registry.register(Counter(
+    "scb_tool_calls_total", "Tool calls by outcome", ("tool", "status")))
+tool_duration = registry.register(Histogram(
+    "scb_tool_duration_seconds", "Tool call latency by phase ('total' is end to end)", ("tool", "phase")))
+tool_response_bytes = registry.register(Histogram(
+    "scb_tool_response_bytes", "Size of encoded tool results", ("tool",), SIZE_BUCKETS))
+tool_in_flight = registry.register(Gauge(
+    "scb_tool_in_flight", "Tool calls currently running", ("tool",)))
+upstream_requests = registry.register(Counter(
+    "scb_upstream_requests_total", "PxWeb requests by method and HTTP status ('error' for transport failures)",
+    ("method", "status")))
+upstream_duration = registry.register(Histogram(
+    "scb_upstream_duration_seconds", "PxWeb request latency, excluding rate limiter waits", ("method",)))
+
+
+class CallTimer:
+    """Accumulates phase durations for one tool call.
+
+    Upstream and rate limit time count the wall time during which at least one request is
+    in flight (or waiting for the limiter), so sub-queries that run concurrently are not
+    counted twice.
+    """
+
+    def __init__(self, tool: str):
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.phases = {phase: 0.0 for phase in PHASES}
+        self._active = {}  # phase -> (blocks running, since)
+
+    def phase_started(self, phase: str) -> None:
+        count, since = self._active.get(phase, (0, 0.0))
+        if count == 0:
+            since = time.perf_counter()
+        self._active[phase] = (count + 1, since)
+
+    def phase_finished(self, phase: str) -> None:
+        count, since = self._active[phase]
+        if count == 1:
+            self.phases[phase] += time.perf_counter() - since
+        self._active[phase] = (count - 1, since)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] += seconds
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("scb_call_timer", default=None)
+
+
+def current_call() -> Optional[CallTimer]:
+    """Timer of the tool call running in this context, if any"""
+    return _current.get()
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the duration of the block to a phase of the current tool call"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer = _current.get()
+        if timer is not None:
+            timer.add(phase, time.perf_counter() - started)
+
+
+@contextmanager
+def overlapping(phase: str):
+    """Like timed(), for blocks that run concurrently: only the time any of them is running counts"""
+    timer = _current.get()
+    if timer is not None:
+        timer.phase_started(phase)
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.phase_finished(phase)
+
+
+class ToolCall:
+    """Handle for the tool call being measured; record the result before leaving the block"""
+
+    def __init__(self, timer: CallTimer):
+        self.timer = timer
+        self.status = "ok"
+        self.size: Optional[int] = None
+
+    def done(self, result, encoded: Optional[bytes] = None) -> None:
+        if isinstance(result, dict) and "error" in result:
+            self.status = "error"
+        if encoded is not None:
+            self.size = len(encoded)
+
+
+@contextmanager
+def tool_call(tool: str):
+    """Measure a tool call: count it, track it in flight and record its latency per phase"""
+    timer = CallTimer(tool)
+    token = _current.set(timer)
+    call = ToolCall(timer)
+    tool_in_flight.add(1, tool)
+    try:
+        yield call
+    except BaseException:
+        call.status = "error"
+        raise
+    finally:
+        _current.reset(token)
+        tool_in_flight.add(-1, tool)
+        total = time.perf_counter() - timer.started
+        tool_calls.inc(tool, call.status)
+        tool_duration.observe(total, tool, "total")
+        accounted = 0.0
+        for phase in PHASES[:-1]:
+            tool_duration.observe(timer.phases[phase], tool, phase)
+            accounted += timer.phases[phase]
+        tool_duration.observe(max(0.0, total - accounted), tool, "local")
+        if call.size is not None:
+            tool_response_bytes.observe(call.size, tool)
+
+
+@contextmanager
+def upstream_request(method: str):
+    """Measure one PxWeb request; set .status on the yielded dict to the HTTP status code"""
+    timer = _current.get()
+    outcome = {"status": "error"}
+    started = time.perf_counter()
+    if timer is not None:
+        timer.phase_started("upstream")
+    try:
+        yield outcome
+    finally:
+        if timer is not None:
+            timer.phase_finished("upstream")
+        upstream_duration.observe(time.perf_counter() - started, method)
+        upstream_requests.inc(method, outcome["status"])
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return registry.render()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the SCB PxWeb API, for benchmarks and offline runs
+Serves the demo tree and tables from scb_demo_data.py plus a larger synthetic table, answers
+data queries with deterministic generated values, and replays recorded fixtures. Latency
+and 429 responses can be injected to mimic SCB under load.
+
+Usage: python scb_mock_pxweb.py [--port 8081] [--latency 0.05] [--throttle-rate 0.05] [--fixtures FILE ...]
+Point a client at it with transport=httpx.ASGITransport(app=MockPxWeb(...).app), or run it
+standalone and route requests to it.
+"""
+
+import argparse
+import asyncio
+import random
+import zlib
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from scb_cassette import read_cassette, request_key
+from scb_demo_data import (
+    DEMO_TABLE_METADATA,
+    get_demo_root_metadata,
+    get_demo_subcategories,
+    get_demo_table_metadata,
+)
+from scb_json import dumps
+
+# Same path layout as SCB_API_URL, so only the host differs
+API_PREFIX = "/OV0104/v1/doris/{lang}/ssd/"
+DEMO_FOLDER = "BE/BE0101"
+UPDATED = "2024-02-22T08:00:00"
+
+# Larger synthetic table: 290 regions x 2 sexes x 2 measures x 56 years = 64,960 cells
+REGIONS = ["00"] + [f"{i:04d}" for i in range(114, 2585, 9)][:289]
+YEARS = [str(year) for year in range(1968, 2024)]
+SYNTHETIC_TABLES = {
+    "BE0101A9": {
+        "title": "Folkmängd efter region, kön och år (syntetisk)",
+        "variables": [
+            {"code": "Region", "text": "region", "values": REGIONS, "valueTexts": [f"Region {r}" for r in REGIONS],
+             "elimination": True},
+            {"code": "Kon", "text": "kön", "values": ["1", "2"], "valueTexts": ["män", "kvinnor"], "elimination": True},
+            {"code": "ContentsCode", "text": "tabellinnehåll", "values": ["BE0101N1", "BE0101N2"],
+             "valueTexts": ["Folkmängd", "Folkökning"]},
+            {"code": "Tid", "text": "år", "values": YEARS, "valueTexts": YEARS, "time": True},
+        ],
+    },
+}
+
+
+def _demo_table(table_id: str, language: str) -> dict:
+    """Demo table metadata as PxWeb returns it: variables as a list, the year variable marked as time"""
+    table = get_demo_table_metadata(table_id, language)
+    variables = []
+    for var in table.get("variables", {}).values():
+        var = dict(var)
+        if var["code"] in ("Tid", "Time"):
+            var["time"] = True
+        else:
+            var["elimination"] = True
+        variables.append(var)
+    return {"title": table.get("title", table_id), "variables": variables}
+
+
+class MockPxWeb:
+    """PxWeb API stand-in; the ASGI application is available as .app"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 0.0, max_cells: int = 150_000, fixtures: Optional[list] = None,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_cells = max_cells
+        self.random = random.Random(seed)
+        self.fixtures: dict = {}
+        for path in fixtures or []:
+            self.load_fixtures(path)
+        self.requests = 0
+        self.throttled = 0
+        self.app = Starlette(routes=[
+            Route("/OV0104/v1/doris/{lang}/ssd/{path:path}", self.handle, methods=["GET", "POST"]),
+        ])
+
+    def load_fixtures(self, path: str) -> int:
+        """Load recorded exchanges from a cassette (see scb_cassette.py); later entries win"""
+        entries = [entry for entry in read_cassette(path) if "response" in entry]
+        for entry in entries:
+            key = request_key(entry["method"], entry["language"], entry["path"], entry.get("params"), entry.get("body"))
+            self.fixtures[key] = (entry.get("status", 200), entry["response"])
+        return len(entries)
+
+    def tables(self, language: str) -> dict:
+        tables = {table_id: _demo_table(table_id, language) for table_id in DEMO_TABLE_METADATA}
+        tables.update(SYNTHETIC_TABLES)
+        return tables
+
+    def nodes(self, path: str, language: str) -> Optional[list]:
+        if path == "":
+            return get_demo_root_metadata(language)
+        if path == DEMO_FOLDER:
+            return [{"id": table_id, "type": "t", "text": table["title"], "updated": UPDATED}
+                    for table_id, table in self.tables(language).items()]
+        if "/" not in path:
+            return get_demo_subcategories(path, language) or None
+        return None
+
+    def search(self, query: str, language: str) -> list:
+        query = query.lower()
+        return [
+            {"id": table_id, "path": "/" + DEMO_FOLDER, "title": table["title"], "score": 1.0, "published": UPDATED}
+            for table_id, table in self.tables(language).items()
+            if query in table_id.lower() or query in table["title"].lower()
+        ]
+
+    def data(self, table_id: str, table: dict, body: dict) -> tuple:
+        """Generate a PxWeb JSON response for a query; the same cell always gets the same value"""
+        selection = {item["code"]: item["selection"]["values"] for item in body.get("query", [])}
+        by_code = {var["code"]: var for var in table["variables"]}
+        for code, values in selection.items():
+            if code not in by_code:
+                return 400, {"error": f"Unknown variable {code}"}
+            unknown = set(values) - set(by_code[code]["values"])
+            if unknown:
+                return 400, {"error": f"Unknown value {sorted(unknown)[0]} for {code}"}
+
+        keys = [var for var in table["variables"] if var["code"] in selection and var["code"] != "ContentsCode"]
+        contents = selection.get("ContentsCode") or [table_id]
+        cells = len(contents)
+        for var in keys:
+            cells *= len(selection[var["code"]])
+        if cells > self.max_cells:
+            return 403, {"error": f"Too many cells selected ({cells})"}
+
+        columns = [{"code": var["code"], "text": var.get("text", var["code"]), "type": "t" if var.get("time") else "d"}
+                   for var in keys]
+        columns += [{"code": code, "text": code, "type": "c"} for code in contents]
+        data = []
+        rows = [[]]
+        for var in keys:
+            rows = [row + [value] for row in rows for value in selection[var["code"]]]
+        for key in rows:
+            seed = "|".join([table_id] + key)
+            data.append({"key": key,
+                         "values": [str(zlib.crc32(f"{seed}|{code}".encode("utf-8")) % 100_000) for code in contents]})
+        return 200, {"columns": columns, "comments": [], "data": data}
+
+    async def handle(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            self.throttled += 1
+            return Response(status_code=429, headers={"Retry-After": str(self.retry_after)})
+
+        body = await request.json() if request.method == "POST" else None
+        status, content = self.respond(request.method, request.path_params["lang"], request.path_params["path"],
+                                       dict(request.query_params), body)
+        return Response(content=dumps(content), status_code=status, media_type="application/json")
+
+    def respond(self, method: str, language: str, path: str, params: Optional[dict] = None, body=None) -> tuple:
+        """Status and JSON content for a PxWeb request, without injected latency or throttling"""
+        path = path.strip("/")
+        params = params or {}
+        fixture = self.fixtures.get(request_key(method, language, path, params, body))
+        if fixture is not None:
+            return fixture
+        if method == "GET" and "query" in params:
+            return 200, self.search(params["query"], language)
+        table_id = path.rsplit("/", 1)[-1]
+        table = self.tables(language).get(table_id) if path.startswith(DEMO_FOLDER + "/") else None
+        if table is None:
+            nodes = self.nodes(path, language)
+            return (200, nodes) if nodes is not None else (404, {"error": "Not found"})
+        if method == "GET":
+            return 200, table
+        return self.data(table_id, table, body or {})
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "throttled": self.throttled, "fixtures": len(self.fixtures)}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--fixtures", nargs="*", default=[], help="Cassettes (scb_cassette.py) to replay")
+    args = parser.parse_args()
+
+    mock = MockPxWeb(latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+                     retry_after=args.retry_after, fixtures=args.fixtures)
+    uvicorn.run(mock.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
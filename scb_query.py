@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+PxWeb query planning
+Expands '*' selections from table metadata, counts result cells, and splits queries that
+exceed SCB's per-request cell limit into compliant sub-queries whose responses are merged
+"""
+
+import logging
+import math
+import os
+
+logger = logging.getLogger("scb-query")
+
+# SCB rejects data requests returning more than this many cells
+DEFAULT_MAX_CELLS = 150_000
+# Upper bound on sub-queries for one fetch; each costs one rate-limited request
+DEFAULT_MAX_CHUNKS = 50
+# PxWeb's contents variable comes back as value columns ("type": "c"), not as a key column
+CONTENTS_CODE = "ContentsCode"
+
+
+def get_max_cells() -> int:
+    try:
+        value = int(os.environ.get("SCB_MAX_CELLS", DEFAULT_MAX_CELLS))
+    except ValueError:
+        return DEFAULT_MAX_CELLS
+    return value if value > 0 else DEFAULT_MAX_CELLS
+
+
+def get_max_chunks() -> int:
+    try:
+        value = int(os.environ.get("SCB_MAX_CHUNKS", DEFAULT_MAX_CHUNKS))
+    except ValueError:
+        return DEFAULT_MAX_CHUNKS
+    return value if value > 0 else DEFAULT_MAX_CHUNKS
+
+
+class TableSchema:
+    """Compiled table metadata for validating and expanding queries without upstream calls.
+
+    Holds the variable order, a value code -> position map per variable and the
+    elimination flags, so a query is checked with dictionary lookups and its cell
+    count is computed from value counts alone.
+    """
+
+    __slots__ = ("title", "variables", "codes", "positions", "eliminable")
+
+    def __init__(self, table: dict):
+        self.title = table.get("title", "")
+        self.variables = table.get("variables", [])
+        self.codes = [var.get("code") for var in self.variables]
+        self.positions = {
+            var.get("code"): {value: i for i, value in enumerate(var.get("values", []))}
+            for var in self.variables
+        }
+        # PxWeb lists "elimination": true for variables that may be left out of a query
+        self.eliminable = {var.get("code"): bool(var.get("elimination", False)) for var in self.variables}
+
+    def _values(self, code: str, values) -> list:
+        if isinstance(values, str):
+            values = [values]
+        positions = self.positions[code]
+        if "*" in values:
+            return list(positions)
+        unknown = [value for value in values if value not in positions]
+        if unknown:
+            sample = ", ".join(list(positions)[:10])
+            raise ValueError(f"Unknown value '{unknown[0]}' for variable '{code}'. Available: {sample}"
+                             + (", ..." if len(positions) > 10 else ""))
+        return list(values)
+
+    def _check_codes(self, query: dict) -> None:
+        for code in query:
+            if code not in self.positions:
+                raise ValueError(f"Unknown variable '{code}'. Available: {', '.join(self.codes)}")
+
+    def check_elimination(self, query: dict) -> None:
+        """Reject a query that leaves out a variable PxWeb cannot eliminate"""
+        for code in self.codes:
+            if code not in query and not self.eliminable[code]:
+                raise ValueError(f"Variable '{code}' must be selected; this table cannot leave it out")
+
+    def expand(self, query: dict, partial: bool = False) -> dict:
+        """Turn {variable_code: [values]} into explicit value lists, in table variable order.
+
+        Unknown variables and value codes are rejected, and so are omitted variables that
+        cannot be eliminated, unless 'partial' (the caller completes the query later).
+        """
+        self._check_codes(query)
+        if not partial:
+            self.check_elimination(query)
+        return {code: self._values(code, query[code]) for code in self.codes if code in query}
+
+    def count_cells(self, query: dict) -> int:
+        """Cells a (validated) query returns, without expanding '*' into value lists"""
+        self._check_codes(query)
+        cells = 1
+        for code, values in query.items():
+            if isinstance(values, str):
+                values = [values]
+            cells *= len(self.positions[code]) if "*" in values else len(values)
+        return cells
+
+
+def count_cells(selection: dict) -> int:
+    """Number of cells a selection returns; unselected variables are eliminated"""
+    return math.prod(len(values) for values in selection.values())
+
+
+def split_query(selection: dict, max_cells: int, contents: str = CONTENTS_CODE) -> list:
+    """Split a selection along its largest dimensions until every part fits in max_cells.
+
+    The contents variable is split only when no other variable has more than one value
+    left, since its values become columns and parts split on it must be merged by row key.
+    """
+    cells = count_cells(selection)
+    if cells <= max_cells or not selection:
+        return [selection]
+
+    candidates = [c for c in selection if c != contents and len(selection[c]) > 1] or list(selection)
+    code = max(candidates, key=lambda c: len(selection[c]))
+    values = selection[code]
+    cells_per_value = cells // len(values)
+    if cells_per_value > max_cells:
+        # Even one value of this dimension is too big: split it fully, then split the rest
+        parts = []
+        for value in values:
+            parts.extend(split_query({**selection, code: [value]}, max_cells, contents))
+        return parts
+
+    step = max(1, max_cells // cells_per_value)
+    return [{**selection, code: values[i:i + step]} for i in range(0, len(values), step)]
+
+
+def selection_to_body(selection: dict) -> dict:
+    """Build a PxWeb query body from explicit value lists"""
+    return {
+        "query": [
+            {"code": code, "selection": {"filter": "item", "values": values}}
+            for code, values in selection.items()
+        ],
+        "response": {"format": "json"},
+    }
+
+
+def merge_responses(responses: list) -> dict:
+    """Merge PxWeb JSON responses for sub-queries of one query"""
+    if len(responses) == 1:
+        return responses[0]
+
+    merged = {key: value for key, value in responses[0].items() if key not in ("data", "comments")}
+    comments = []
+    for response in responses:
+        for comment in response.get("comments", []):
+            if comment not in comments:
+                comments.append(comment)
+    if all(response.get("columns") == merged.get("columns") for response in responses):
+        merged["data"] = [row for response in responses for row in response.get("data", [])]
+    else:
+        merged["columns"], merged["data"] = _merge_by_key(responses)
+    merged["comments"] = comments
+    return merged
+
+
+def _merge_by_key(responses: list) -> tuple:
+    """Join parts that were split on the contents variable: rows by key, union of value columns"""
+    key_columns = [col for col in responses[0].get("columns", []) if col.get("type") != "c"]
+    measures: dict = {}
+    rows: dict = {}
+    for response in responses:
+        codes = [col["code"] for col in response.get("columns", []) if col.get("type") == "c"]
+        for col in response.get("columns", []):
+            if col.get("type") == "c":
+                measures.setdefault(col["code"], col)
+        for row in response.get("data", []):
+            rows.setdefault(tuple(row["key"]), {}).update(zip(codes, row.get("values", [])))
+    data = [{"key": list(key), "values": [values.get(code, "..") for code in measures]}
+            for key, values in rows.items()]
+    return key_columns + list(measures.values()), data
+
+
+def plan_selection(selection: dict, max_cells: int = None, max_chunks: int = None, cells: int = None) -> list:
+    """Return the PxWeb bodies needed to fetch an expanded selection; 'cells' may be passed
+    when it is already known (see TableSchema.count_cells)"""
+    max_cells = max_cells or get_max_cells()
+    max_chunks = max_chunks or get_max_chunks()
+    cells = count_cells(selection) if cells is None else cells
+    if cells <= max_cells:
+        return [selection_to_body(selection)]
+    parts = split_query(selection, max_cells)
+    if len(parts) > max_chunks:
+        raise ValueError(
+            f"Query selects {cells} cells and would need {len(parts)} requests "
+            f"(limit {max_chunks}); narrow the selection"
+        )
+    logger.info(f"Splitting {cells}-cell query into {len(parts)} sub-queries")
+    return [selection_to_body(part) for part in parts]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Process-wide rate limiter for upstream SCB calls
+SCB allows a fixed number of requests per IP within a sliding window (10 per 10 seconds),
+so every PxWeb request waits for a token here before it is sent
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("scb-rate-limit")
+
+# SCB's documented quota
+DEFAULT_MAX_REQUESTS = 10
+DEFAULT_PERIOD = 10.0
+
+# Backoff for 429/503 responses without a usable Retry-After header
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+class RateLimiter:
+    """Token bucket where each spent token returns exactly one period after it was used.
+
+    This keeps any sliding window of 'period' seconds at or below 'max_requests',
+    which a continuously refilling bucket would not. Waiters are served in arrival
+    order, and a 429/503 from upstream pauses the whole bucket for the backoff delay.
+    """
+
+    def __init__(self, max_requests: int = DEFAULT_MAX_REQUESTS, period: float = DEFAULT_PERIOD):
+        if max_requests < 1 or period <= 0:
+            raise ValueError("max_requests must be at least 1 and period must be positive")
+        self.max_requests = max_requests
+        self.period = period
+        self._spent: deque = deque()
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Counters exposed through stats()
+        self.queue_depth = 0
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def _next_delay(self, now: float) -> float:
+        while self._spent and now - self._spent[0] >= self.period:
+            self._spent.popleft()
+        delay = self._blocked_until - now
+        if len(self._spent) >= self.max_requests:
+            delay = max(delay, self._spent[0] + self.period - now)
+        return delay
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the time spent waiting in seconds"""
+        start = time.monotonic()
+        self.queue_depth += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, and the holder sleeps while
+            # holding it, so callers get tokens in the order they arrived
+            async with self._get_lock():
+                while True:
+                    delay = self._next_delay(time.monotonic())
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self._spent.append(time.monotonic())
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - start
+        self.requests += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def backoff(self, delay: float) -> None:
+        """Pause all upstream requests for 'delay' seconds after a 429/503"""
+        self.throttled += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def stats(self) -> dict:
+        """Current queue depth and wait times"""
+        return {
+            "max_requests": self.max_requests,
+            "period_seconds": self.period,
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "avg_wait_seconds": round(self.total_wait / self.requests, 4) if self.requests else 0.0,
+            "max_wait_seconds": round(self.max_wait, 4),
+            "paused_for_seconds": round(max(self._blocked_until - time.monotonic(), 0.0), 4),
+        }
+
+
+def retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Delay before retrying a 429/503, honouring Retry-After when present"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+    return delay + random.uniform(0, delay / 2)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide limiter, configured from SCB_RATE_LIMIT_REQUESTS / SCB_RATE_LIMIT_PERIOD"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        try:
+            max_requests = int(os.environ.get("SCB_RATE_LIMIT_REQUESTS", DEFAULT_MAX_REQUESTS))
+            period = float(os.environ.get("SCB_RATE_LIMIT_PERIOD", DEFAULT_PERIOD))
+            _rate_limiter = RateLimiter(max_requests, period)
+        except ValueError:
+            logger.warning("Invalid rate limit settings, using SCB defaults")
+            _rate_limiter = RateLimiter()
+    return _rate_limiter
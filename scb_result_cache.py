@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Persistent result cache for scb_fetch_data
+Results are stored on disk as gzipped JSON, addressed by the hash of a canonical query, and
+evicted least recently used first once the cache exceeds its size budget. An entry is valid
+while the table's 'updated' timestamp from the search index is unchanged.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from scb_executor import run_blocking
+from scb_json import dumps
+
+logger = logging.getLogger("scb-result-cache")
+
+DEFAULT_RESULT_CACHE_DIR = "scb_result_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Lifetime of entries for tables whose 'updated' timestamp is not known (index not built yet)
+DEFAULT_TTL = 24 * 3600.0
+
+SUFFIX = ".json.gz"
+
+
+def result_key(table_path: str, language: str, selection: dict, source: str = "scb") -> str:
+    """Canonical key for an expanded selection from a data source: variables sorted, '*' already expanded"""
+    canonical = {code: list(selection[code]) for code in sorted(selection)}
+    return f"data:{source}:{language}:{table_path}:" + json.dumps(canonical, separators=(",", ":"), ensure_ascii=False)
+
+
+class ResultCache:
+    """Size-bounded on-disk cache of data responses, validated by the table's 'updated' timestamp"""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._files: Optional[OrderedDict] = None  # digest -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        # Set when the directory cannot be created or scanned; the cache then stays off
+        self.disabled = False
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + SUFFIX)
+
+    def _scan(self) -> None:
+        """Build the LRU order from the files on disk, oldest modification time first"""
+        if self._files is not None:
+            return
+        entries = []
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(SUFFIX):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len(SUFFIX)], stat.st_size))
+        self._files = OrderedDict((digest, size) for _, digest, size in sorted(entries))
+        self._size = sum(self._files.values())
+
+    def _remove(self, digest: str) -> None:
+        self._size -= self._files.pop(digest, 0)
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _get(self, key: str, updated: Optional[str]) -> Optional[Any]:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._scan()
+            known = digest in self._files
+            if not known:
+                self.misses += 1
+        if not known:
+            return None
+
+        # The file is read and parsed outside the lock, so hits on different entries run in parallel;
+        # entries are replaced atomically, so a concurrent write never shows a partial file
+        path = self._path(digest)
+        try:
+            with gzip.open(path, "rb") as f:
+                entry = json.loads(f.read())
+        except FileNotFoundError:
+            # Evicted meanwhile
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError):
+            with self._lock:
+                self._remove(digest)
+                self.misses += 1
+            return None
+
+        if entry.get("key") != key:
+            with self._lock:
+                self.misses += 1
+            return None
+        if updated:
+            valid = entry.get("updated") == updated
+        else:
+            valid = entry.get("stored_at", 0) + self.ttl > time.time()
+        if not valid:
+            with self._lock:
+                self._remove(digest)
+                self.stale += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if digest in self._files:
+                self._files.move_to_end(digest)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def _set(self, key: str, value: Any, updated: Optional[str]) -> None:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        data = gzip.compress(dumps({"key": key, "updated": updated, "stored_at": time.time(), "value": value}), 6)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._scan()
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._size -= self._files.pop(digest, 0)
+            self._files[digest] = len(data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._files:
+                oldest = next(iter(self._files))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _failed(self, action: str, error: OSError) -> None:
+        if self._files is None:
+            self.disabled = True
+            logger.warning(f"Result cache directory {self.directory} is unusable, disabling the cache: {error}")
+        else:
+            logger.warning(f"Could not {action} result cache entry: {error}")
+
+    async def get(self, key: str, updated: Optional[str] = None) -> Optional[Any]:
+        """Return the cached value, or None if missing or stored for another 'updated' timestamp"""
+        if self.disabled:
+            return None
+        try:
+            return await run_blocking(self._get, key, updated)
+        except OSError as e:
+            self._failed("read", e)
+            return None
+
+    async def set(self, key: str, value: Any, updated: Optional[str] = None) -> None:
+        if self.disabled:
+            return
+        try:
+            await run_blocking(self._set, key, value, updated)
+        except OSError as e:
+            self._failed("write", e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "dir": self.directory,
+            "disabled": self.disabled,
+            "entries": len(self._files) if self._files is not None else None,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache(backend: Optional[str] = None) -> Optional[ResultCache]:
+    """Get the process-wide result cache from SCB_RESULT_CACHE_* variables; None when disabled.
+
+    A local data backend (SCB_BACKEND) keeps its entries in a subdirectory named after it.
+    """
+    global _result_cache
+    directory = os.environ.get("SCB_RESULT_CACHE_DIR", DEFAULT_RESULT_CACHE_DIR)
+    if _result_cache is None and directory:
+        if backend:
+            directory = os.path.join(directory, backend)
+        try:
+            max_bytes = int(os.environ.get("SCB_RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            ttl = float(os.environ.get("SCB_RESULT_CACHE_TTL", DEFAULT_TTL))
+        except ValueError:
+            logger.warning("Invalid result cache settings, using defaults")
+            max_bytes, ttl = DEFAULT_MAX_BYTES, DEFAULT_TTL
+        _result_cache = ResultCache(directory, max_bytes=max_bytes, ttl=ttl)
+    return _result_cache
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Offline search index over the full SCB table tree
+A background crawler walks every folder for sv and en, and an inverted index over table
+titles, IDs and folder paths answers scb_search_tables without upstream calls.
+Later refreshes are incremental: subtrees whose 'updated' timestamp is unchanged are not recrawled
+"""
+
+import asyncio
+import bisect
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Optional
+
+from scb_executor import run_blocking
+
+logger = logging.getLogger("scb-search-index")
+
+LANGUAGES = ("sv", "en")
+INDEX_VERSION = 2
+
+DEFAULT_INDEX_PATH = "scb_search_index.json.gz"
+DEFAULT_MAX_AGE = 7 * 24 * 3600.0
+# Pause between crawler requests so the crawl uses at most part of SCB's quota
+DEFAULT_CRAWL_DELAY = 2.0
+# Longest wait before retrying a crawl that failed or found no tables
+MAX_RETRY_DELAY = 3600.0
+
+# Relative weight of a token depending on where it occurs
+FIELD_WEIGHTS = {"id": 3.0, "text": 2.0, "path": 0.5}
+# Score multiplier for a query token that only matches as a prefix
+PREFIX_WEIGHT = 0.5
+MIN_STEM_LENGTH = 3
+
+TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+# Suffixes after diacritic folding, longest first
+SUFFIXES = {
+    "sv": sorted([
+        "heterna", "hetens", "heten", "heter", "arnas", "ernas", "ornas", "andet", "arna", "erna",
+        "orna", "ande", "ende", "aste", "het", "ens", "ade", "are", "ast", "ad", "ar", "er", "or",
+        "en", "et", "na", "a", "e", "s",
+    ], key=len, reverse=True),
+    "en": sorted([
+        "ations", "ation", "ments", "ment", "ings", "ing", "ies", "ied", "ness", "ly", "ed", "es", "s",
+    ], key=len, reverse=True),
+}
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics, so 'Arbetslöshet' and 'arbetsloshet' compare equal"""
+    decomposed = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token: str, language: str = "sv") -> str:
+    """Strip one inflectional suffix, keeping at least MIN_STEM_LENGTH characters"""
+    if not token.isalpha():
+        return token
+    for suffix in SUFFIXES.get(language, SUFFIXES["sv"]):
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            if language == "en" and suffix in ("ies", "ied"):
+                return token[:-len(suffix)] + "y"
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str, language: str = "sv") -> list:
+    """Split text into folded, stemmed tokens"""
+    return [stem(token, language) for token in TOKEN_RE.findall(fold(text))]
+
+
+class SearchIndex:
+    """Inverted index of SCB tables per language"""
+
+    def __init__(self, documents: Optional[dict] = None, built_at: float = 0.0, folders: Optional[dict] = None,
+                 source: str = "scb"):
+        # Data backend the documents were crawled from ("scb" for the live API)
+        self.source = source
+        self.documents = {language: [] for language in LANGUAGES}
+        # Folder path -> {"updated": ...} per language, used for incremental refresh
+        self.folders = {language: {} for language in LANGUAGES}
+        self.folders.update(folders or {})
+        self.built_at = built_at
+        self._postings = {}
+        self._vocabulary = {}
+        self._by_path = {}
+        for language, docs in (documents or {}).items():
+            self.set_documents(language, docs)
+
+    def set_documents(self, language: str, docs: list) -> None:
+        """Replace the documents for a language and rebuild its postings"""
+        postings = defaultdict(dict)
+        for doc_id, doc in enumerate(docs):
+            fields = {
+                "id": [fold(doc.get("id", ""))] + tokenize(doc.get("id", ""), language),
+                "text": tokenize(doc.get("text", ""), language),
+                "path": tokenize(" ".join(doc.get("path_text", [])), language) + tokenize(doc.get("path", ""), language),
+            }
+            for field, tokens in fields.items():
+                for token in tokens:
+                    weight = postings[token].get(doc_id, 0.0)
+                    postings[token][doc_id] = max(weight, FIELD_WEIGHTS[field])
+
+        self.documents[language] = docs
+        self._postings[language] = dict(postings)
+        self._vocabulary[language] = sorted(postings)
+        self._by_path[language] = {doc.get("path"): doc for doc in docs}
+
+    def table_updated(self, path: str, language: str = "sv") -> Optional[str]:
+        """The 'updated' timestamp of a table, if it is in the index"""
+        doc = self._by_path.get(language, {}).get(path)
+        return doc.get("updated") or None if doc else None
+
+    def is_empty(self, language: Optional[str] = None) -> bool:
+        languages = [language] if language else LANGUAGES
+        return not any(self.documents.get(lang) for lang in languages)
+
+    def _prefix_tokens(self, token: str, language: str) -> list:
+        vocabulary = self._vocabulary.get(language, [])
+        start = bisect.bisect_left(vocabulary, token)
+        matches = []
+        for candidate in vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            if candidate != token:
+                matches.append(candidate)
+        return matches
+
+    def search(self, query: str, language: str = "sv", limit: int = 20, offset: int = 0) -> tuple:
+        """Return (total, ranked results) for a free-text query"""
+        docs = self.documents.get(language, [])
+        postings = self._postings.get(language, {})
+        query_tokens = list(dict.fromkeys(tokenize(query, language)))
+        if not docs or not query_tokens:
+            return 0, []
+
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for token in query_tokens:
+            candidates = [(token, 1.0)] + [(t, PREFIX_WEIGHT) for t in self._prefix_tokens(token, language)]
+            best = {}
+            for candidate, factor in candidates:
+                entries = postings.get(candidate)
+                if not entries:
+                    continue
+                idf = math.log(1 + len(docs) / len(entries))
+                for doc_id, weight in entries.items():
+                    best[doc_id] = max(best.get(doc_id, 0.0), weight * factor * idf)
+            for doc_id, score in best.items():
+                scores[doc_id] += score
+                matched[doc_id] += 1
+
+        # Exact table ID match always ranks first
+        exact_id = fold(query).strip()
+        for doc_id in postings.get(exact_id, {}):
+            if fold(docs[doc_id].get("id", "")) == exact_id:
+                scores[doc_id] += 100.0
+                matched[doc_id] = max(matched[doc_id], len(query_tokens))
+
+        ranked = sorted(scores, key=lambda doc_id: (-matched[doc_id], -scores[doc_id], docs[doc_id].get("id", "")))
+        results = []
+        for doc_id in ranked[offset:offset + limit]:
+            result = dict(docs[doc_id])
+            result.pop("path_text", None)
+            result["score"] = round(scores[doc_id], 3)
+            results.append(result)
+        return len(ranked), results
+
+    def stats(self) -> dict:
+        return {
+            "tables": {language: len(self.documents.get(language, [])) for language in LANGUAGES},
+            "tokens": {language: len(self._vocabulary.get(language, [])) for language in LANGUAGES},
+            "built_at": self.built_at or None,
+        }
+
+    def save(self, path: str) -> None:
+        """Write the documents to a gzipped JSON file; postings are rebuilt on load"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "built_at": self.built_at,
+                "source": self.source,
+                "documents": self.documents,
+                "folders": self.folders,
+            }, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source: str = "scb") -> Optional["SearchIndex"]:
+        """Load a saved index, or None if it is missing, from another version or crawled from another backend"""
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            if os.path.exists(path):
+                logger.warning(f"Could not read search index {path}: {e}")
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("source", "scb") != source:
+            return None
+        return cls(documents=data.get("documents", {}), built_at=data.get("built_at", 0.0),
+                   folders=data.get("folders", {}), source=source)
+
+
+def new_report(mode: str) -> dict:
+    """Counters describing one crawl"""
+    return {
+        "mode": mode,
+        "folders_visited": 0,
+        "folders_skipped": 0,
+        "tables_added": 0,
+        "tables_updated": 0,
+        "tables_removed": 0,
+        "errors": 0,
+        "started_at": time.time(),
+        "duration_seconds": 0.0,
+    }
+
+
+async def crawl_tree(client, language: str, delay: float = DEFAULT_CRAWL_DELAY,
+                     previous: Optional[SearchIndex] = None, report: Optional[dict] = None) -> tuple:
+    """Walk the PxWeb tree for a language and return (table documents, folders, changed table paths).
+
+    With a previous index, a folder whose listing entry carries the same 'updated' value
+    as last time is not listed again: its tables and subfolders are copied over instead.
+    """
+    report = report if report is not None else new_report("full" if previous is None else "incremental")
+    old_docs = previous.documents.get(language, []) if previous else []
+    old_folders = previous.folders.get(language, {}) if previous else {}
+    old_by_path = {doc["path"]: doc for doc in old_docs}
+    docs, folders, changed = [], {}, []
+
+    def reuse_subtree(prefix: str) -> int:
+        nested = prefix + "/" if prefix else ""
+        docs.extend(doc for doc in old_docs if doc["path"].startswith(nested))
+        subfolders = {path: info for path, info in old_folders.items() if path.startswith(nested)}
+        folders.update(subfolders)
+        return len(subfolders)
+
+    stack = [("", [])]
+    while stack:
+        path, path_text = stack.pop()
+        try:
+            nodes = await client.list_nodes(path, language, refresh=True)
+        except Exception as e:
+            logger.warning(f"Skipping '{path}' ({language}) during crawl: {e}")
+            report["errors"] += 1
+            # Keep what we knew about the subtree (the whole tree for the root) rather than dropping it
+            reuse_subtree(path)
+            if delay:
+                await asyncio.sleep(delay)
+            continue
+        report["folders_visited"] += 1
+
+        for node in nodes:
+            node_id = node.get("id", "")
+            node_path = f"{path}/{node_id}".strip("/")
+            updated = node.get("updated", "")
+
+            if node.get("type") == "l":
+                folders[node_path] = {"updated": updated}
+                previous_folder = old_folders.get(node_path)
+                if updated and previous_folder and previous_folder.get("updated") == updated:
+                    report["folders_skipped"] += 1 + reuse_subtree(node_path)
+                    continue
+                stack.append((node_path, path_text + [node.get("text", "")]))
+
+            elif node.get("type") == "t":
+                docs.append({
+                    "id": node_id,
+                    "text": node.get("text", ""),
+                    "type": "t",
+                    "path": node_path,
+                    "path_text": path_text,
+                    "updated": updated,
+                })
+                old = old_by_path.get(node_path)
+                if previous is None:
+                    continue
+                if old is None:
+                    report["tables_added"] += 1
+                elif old.get("updated") != updated:
+                    report["tables_updated"] += 1
+                    changed.append(node_path)
+
+        if delay:
+            await asyncio.sleep(delay)
+
+    if previous is not None:
+        new_paths = {doc["path"] for doc in docs}
+        removed = [doc["path"] for doc in old_docs if doc["path"] not in new_paths]
+        report["tables_removed"] += len(removed)
+        changed.extend(removed)
+
+    return docs, folders, changed
+
+
+async def crawl_tables(client, language: str, delay: float = DEFAULT_CRAWL_DELAY) -> list:
+    """Walk the whole PxWeb tree for a language and return one document per table"""
+    docs, _, _ = await crawl_tree(client, language, delay)
+    return docs
+
+
+class SearchIndexService:
+    """Owns the shared index: loads it from disk and keeps it fresh in the background"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_INDEX_PATH, max_age: float = DEFAULT_MAX_AGE,
+                 crawl_delay: float = DEFAULT_CRAWL_DELAY, source: str = "scb"):
+        self.path = path
+        self.max_age = max_age
+        self.crawl_delay = crawl_delay
+        self.source = source
+        self.index = SearchIndex(source=source)
+        self.state = "empty"
+        self.task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        self.last_report: Optional[dict] = None
+
+    def is_stale(self) -> bool:
+        return self.index.is_empty() or time.time() - self.index.built_at > self.max_age
+
+    async def load(self) -> bool:
+        """Load the persisted index, if any"""
+        if not self.path:
+            return False
+        index = await run_blocking(SearchIndex.load, self.path, self.source)
+        if index is None:
+            return False
+        self.index = index
+        self.state = "ready"
+        logger.info(f"Loaded search index from {self.path}: {index.stats()['tables']}")
+        return True
+
+    async def rebuild(self, client, languages=LANGUAGES, incremental: bool = False) -> dict:
+        """Crawl the tree and replace the index; returns the crawl report.
+
+        An incremental rebuild skips unchanged subtrees and drops cached metadata
+        for tables that were updated or removed upstream. A crawl that hit errors and
+        found fewer tables than the current index raises instead of replacing it.
+        """
+        previous = self.index if incremental and not self.index.is_empty() else None
+        report = new_report("full" if previous is None else "incremental")
+        self.state = "building" if self.index.is_empty() else "refreshing"
+
+        documents, folders, changed = {}, {}, {}
+        for language in languages:
+            errors = report["errors"]
+            documents[language], folders[language], changed[language] = await crawl_tree(
+                client, language, self.crawl_delay, previous, report
+            )
+            logger.info(f"Crawled {len(documents[language])} tables ({language})")
+            known = len(self.index.documents.get(language, []))
+            if report["errors"] > errors and len(documents[language]) < known:
+                report["duration_seconds"] = round(time.time() - report["started_at"], 3)
+                self.last_report = report
+                self.state = "ready" if not self.index.is_empty() else "empty"
+                raise RuntimeError(f"Crawl ({language}) had {report['errors'] - errors} errors and found "
+                                   f"{len(documents[language])} of {known} tables; keeping the current index")
+
+        for language in languages:
+            for table_path in changed[language]:
+                await client.invalidate_table(table_path, language)
+
+        report["duration_seconds"] = round(time.time() - report["started_at"], 3)
+        logger.info(f"Search index {report['mode']} crawl: {report}")
+
+        index = SearchIndex(documents=documents, built_at=time.time(), folders=folders, source=self.source)
+        self.index = index
+        self.state = "ready"
+        self.last_report = report
+        if self.path:
+            await run_blocking(index.save, self.path)
+        return report
+
+    async def refresh(self, client, languages=LANGUAGES) -> dict:
+        """Incremental rebuild, or a full one if there is no index yet"""
+        return await self.rebuild(client, languages, incremental=True)
+
+    async def _run_background(self, client) -> None:
+        """Refresh whenever the index reaches max_age, backing off after failed or empty crawls"""
+        retry_delay = min(self.max_age, MAX_RETRY_DELAY)
+        while True:
+            wait = 0.0 if self.index.is_empty() else self.index.built_at + self.max_age - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.refresh(client)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Search index crawl failed: {e}", exc_info=True)
+                self.last_error = str(e)
+                self.state = "ready" if not self.index.is_empty() else "failed"
+                await asyncio.sleep(retry_delay)
+                continue
+            if self.index.is_empty():
+                logger.warning(f"Search index crawl found no tables, retrying in {retry_delay:.0f} s")
+                await asyncio.sleep(retry_delay)
+
+    async def start(self, client, crawl: bool = True) -> None:
+        """Load from disk and, if allowed, keep the index refreshed in the background"""
+        await self.load()
+        if crawl and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._run_background(client))
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def search(self, query: str, language: str = "sv", limit: int = 20, offset: int = 0) -> tuple:
+        return self.index.search(query, language, limit, offset)
+
+    def table_updated(self, path: str, language: str = "sv") -> Optional[str]:
+        return self.index.table_updated(path, language)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "path": self.path,
+            "last_error": self.last_error,
+            "last_refresh": self.last_report,
+            **self.index.stats(),
+        }
+
+
+_search_service: Optional[SearchIndexService] = None
+
+
+def get_search_service(backend: Optional[str] = None) -> SearchIndexService:
+    """Get the process-wide index service, configured from SCB_SEARCH_INDEX_* variables.
+
+    A local data backend (SCB_BACKEND) gets its own index file, e.g. scb_search_index.demo.json.gz,
+    so its tables never show up in a live server's index.
+    """
+    global _search_service
+    if _search_service is None:
+        try:
+            max_age = float(os.environ.get("SCB_SEARCH_INDEX_MAX_AGE", DEFAULT_MAX_AGE))
+            crawl_delay = float(os.environ.get("SCB_SEARCH_INDEX_CRAWL_DELAY", DEFAULT_CRAWL_DELAY))
+        except ValueError:
+            logger.warning("Invalid search index settings, using defaults")
+            max_age, crawl_delay = DEFAULT_MAX_AGE, DEFAULT_CRAWL_DELAY
+        path = os.environ.get("SCB_SEARCH_INDEX_PATH", DEFAULT_INDEX_PATH) or None
+        if path and backend:
+            directory, name = os.path.split(path)
+            stem, dot, suffix = name.partition(".")
+            path = os.path.join(directory, f"{stem}.{backend}{dot}{suffix}")
+        _search_service = SearchIndexService(path=path, max_age=max_age, crawl_delay=crawl_delay,
+                                             source=backend or "scb")
+    return _search_service
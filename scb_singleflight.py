@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Request coalescing (single-flight) for identical concurrent calls
+The first caller for a key starts the work; callers arriving while it runs await the same result
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger("scb-singleflight")
+
+
+def call_key(name: str, arguments: dict) -> str:
+    """Stable key for a call, independent of argument order"""
+    return name + ":" + json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SingleFlight:
+    """Share one in-flight task between concurrent callers with the same key.
+
+    The work runs as its own task, so a caller that is cancelled (e.g. a client
+    disconnecting) does not cancel it for the others. Callers receive the same
+    result object and must not mutate it.
+    """
+
+    def __init__(self):
+        self._tasks: dict = {}
+        self.executed = 0
+        self.shared = 0
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the call already in flight"""
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+            self.executed += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "executed": self.executed, "shared": self.shared}
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Opt-in local replicas of frequently used SCB tables
+Each configured table is downloaded once (split within SCB's cell limit) into a float64 cube on
+disk, one axis per variable, and opened with numpy.memmap. A parallel int16 cube records how
+each cell was written (its decimals, or a symbol such as '..'), so answers match SCB's text.
+scb_fetch_data queries are answered by slicing the cubes; a replica is refreshed when the
+search index reports the table updated.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from scb_client import normalize_language, normalize_path
+from scb_executor import run_blocking
+from scb_format import parse_value
+from scb_query import CONTENTS_CODE, TableSchema
+from scb_singleflight import SingleFlight
+
+logger = logging.getLogger("scb-table-store")
+
+DEFAULT_STORE_DIR = "scb_table_store"
+# Full-table downloads may need many more sub-queries than an interactive fetch
+DEFAULT_MAX_CHUNKS = 500
+# Seconds before a table without a replica is looked for on disk again
+MISSING_TTL = 60.0
+# Backoff after a failed refresh: doubles per consecutive failure, up to the maximum
+REFRESH_BACKOFF = 60.0
+REFRESH_BACKOFF_MAX = 3600.0
+
+MISSING = ".."
+# Cells are numbers with up to this many decimals; other statuses are negative symbol indexes
+MAX_SYMBOLS = 2 ** 15
+
+
+def _format_cell(value: float, status: int, symbols: list) -> str:
+    """Render a stored cell exactly as PxWeb sent it: a number with its decimals, or a symbol"""
+    if status < 0:
+        return symbols[-status - 1]
+    return f"{value:.{status}f}"
+
+
+def _encode_cell(raw: str, symbols: dict) -> tuple:
+    """Value and status for a PxWeb cell; text that does not survive as a number becomes a symbol"""
+    value = parse_value(raw)
+    if value is not None and isinstance(raw, str):
+        decimals = len(raw) - raw.index(".") - 1 if "." in raw else 0
+        if f"{float(value):.{decimals}f}" == raw:
+            return float(value), decimals
+    raw = str(raw)
+    if raw not in symbols:
+        if len(symbols) >= MAX_SYMBOLS:
+            raise ValueError(f"Table has more than {MAX_SYMBOLS} distinct non-numeric cells")
+        symbols[raw] = len(symbols)
+    return np.nan, -symbols[raw] - 1
+
+
+class Replica:
+    """One stored table: dimension dictionaries plus a memory-mapped value cube"""
+
+    def __init__(self, directory: str, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self.dimensions = meta["dimensions"]
+        self.schema = TableSchema(meta)
+        self.positions = [{value: i for i, value in enumerate(dim["values"])} for dim in self.dimensions]
+        shape = tuple(len(dim["values"]) for dim in self.dimensions)
+        self.values = np.memmap(os.path.join(directory, meta["values_file"]), dtype=np.float64, mode="r", shape=shape)
+        self.status = np.memmap(os.path.join(directory, meta["status_file"]), dtype=np.int16, mode="r", shape=shape)
+        self.symbols = meta["symbols"]
+        self._matched: Optional[list] = None
+
+    @property
+    def updated(self) -> Optional[str]:
+        return self.meta.get("updated")
+
+    def matches(self, variables: list) -> bool:
+        """Whether live table metadata has the variables and values this replica was stored with"""
+        if variables is self._matched:
+            return True
+        stored = [(var.get("code"), var.get("values")) for var in self.meta["variables"]]
+        if stored != [(var.get("code"), var.get("values")) for var in variables]:
+            return False
+        # Schemas are cached, so the same list is usually checked again
+        self._matched = variables
+        return True
+
+    def query(self, selection: dict) -> Optional[dict]:
+        """Answer an expanded selection as a PxWeb response, or None if it needs elimination.
+
+        Contiguous value ranges are sliced as views of the memory map; other selections are
+        gathered with np.take. Only the selected cells are read from disk.
+        """
+        view = self.values
+        status = self.status
+        picked = []
+        for axis, (dim, positions) in enumerate(zip(self.dimensions, self.positions)):
+            values = selection.get(dim["code"])
+            if values is None:
+                if len(dim["values"]) != 1:
+                    # PxWeb would eliminate this variable; only SCB knows how
+                    return None
+                values = dim["values"]
+            index = [positions[value] for value in values]
+            picked.append(values)
+            if index == list(range(index[0], index[0] + len(index))):
+                part = (slice(None),) * axis + (slice(index[0], index[0] + len(index)),)
+                view, status = view[part], status[part]
+            else:
+                view, status = np.take(view, index, axis=axis), np.take(status, index, axis=axis)
+
+        key_dims = [dim for dim in self.dimensions if dim["kind"] != "c"]
+        contents = picked[-1]
+        measures = {col["code"]: col for col in self.meta["content_columns"]}
+        data = []
+        for index in np.ndindex(view.shape[:-1]):
+            data.append({
+                "key": [picked[axis][i] for axis, i in enumerate(index)],
+                "values": [_format_cell(cell, int(code), self.symbols)
+                           for cell, code in zip(view[index].tolist(), status[index])],
+            })
+        columns = [{"code": dim["code"], "text": dim["text"], "type": dim["kind"]} for dim in key_dims]
+        columns += [measures[code] for code in contents]
+        response = dict(self.meta.get("extra", {}))
+        response.update({"columns": columns, "comments": self.meta.get("comments", []), "data": data})
+        return response
+
+
+class TableStore:
+    """Directory of replicas, keyed by language and table path"""
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR, tables: Optional[list] = None,
+                 languages: tuple = ("sv",), max_chunks: int = DEFAULT_MAX_CHUNKS):
+        self.directory = directory
+        self.tables = list(tables or [])
+        self.languages = tuple(languages)
+        self.max_chunks = max_chunks
+        self._replicas: dict = {}
+        self._missing: dict = {}
+        self._failures: dict = {}
+        self._refreshing: set = set()
+        self._downloads = SingleFlight()
+        self._tasks: set = set()
+        self.task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.fallbacks = 0
+        self.downloads = 0
+        self.last_error: Optional[str] = None
+
+    def _table_dir(self, table_path: str, language: str) -> str:
+        digest = hashlib.sha256(normalize_path(table_path).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, normalize_language(language), digest)
+
+    def _open(self, table_path: str, language: str) -> Optional[Replica]:
+        key = (normalize_language(language), normalize_path(table_path))
+        replica = self._replicas.get(key)
+        if replica is None:
+            if time.monotonic() < self._missing.get(key, 0.0):
+                return None
+            directory = self._table_dir(table_path, language)
+            try:
+                with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                replica = Replica(directory, meta)
+            except (OSError, ValueError, KeyError):
+                self._missing[key] = time.monotonic() + MISSING_TTL
+                return None
+            self._replicas[key] = replica
+        return replica
+
+    def has(self, table_path: str, language: str = "sv") -> bool:
+        return self._open(table_path, language) is not None
+
+    def is_current(self, table_path: str, language: str, updated: Optional[str],
+                   variables: Optional[list] = None) -> bool:
+        """A replica is current unless the index knows a different 'updated' timestamp or the
+        live 'variables' (when given) differ from the stored ones"""
+        replica = self._open(table_path, language)
+        if replica is None or (updated and replica.updated != updated):
+            return False
+        return variables is None or replica.matches(variables)
+
+    def metadata(self, table_path: str, language: str = "sv") -> Optional[dict]:
+        """Table metadata (title and variables) as stored with the replica"""
+        replica = self._open(table_path, language)
+        if replica is None:
+            return None
+        return {"title": replica.meta["title"], "variables": replica.meta["variables"]}
+
+    def stored_tables(self, language: str = "sv") -> list:
+        """Path, title and 'updated' of every replica on disk for a language"""
+        root = os.path.join(self.directory, normalize_language(language))
+        tables = []
+        for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            try:
+                with open(os.path.join(root, name, "meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if meta.get("path"):
+                tables.append({"path": meta["path"], "title": meta.get("title", ""), "updated": meta.get("updated")})
+        return tables
+
+    def lookup(self, table_path: str, language: str, query: dict) -> Optional[dict]:
+        """Answer a query from the replica, or None when there is none or it cannot answer"""
+        replica = self._open(table_path, language)
+        if replica is None:
+            return None
+        try:
+            response = replica.query(replica.schema.expand(query))
+        except ValueError:
+            # A value SCB has added since the replica was stored
+            response = None
+        if response is None:
+            self.fallbacks += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def download(self, client, table_path: str, language: str = "sv", updated: Optional[str] = None) -> None:
+        """Fetch a full table into a new cube file and switch the replica to it"""
+        key = f"{normalize_language(language)}:{normalize_path(table_path)}"
+        await self._downloads.do(key, lambda: self._download(client, table_path, language, updated))
+
+    async def _download(self, client, table_path: str, language: str, updated: Optional[str]) -> None:
+        started = time.time()
+        await client.invalidate_table(table_path, language)
+        table = await client.get_table_metadata(table_path, language)
+        variables = table["variables"]
+        query = {var["code"]: ["*"] for var in variables}
+        directory = self._table_dir(table_path, language)
+        os.makedirs(directory, exist_ok=True)
+        values_file = f"values.{int(started * 1000)}.f8"
+        status_file = f"status.{int(started * 1000)}.i2"
+
+        cube = None
+        meta = None
+        measures: dict = {}
+        # Cells that are not plain numbers; the first one also marks cells SCB did not return
+        symbols: dict = {MISSING: 0}
+        async for _, _, response in client.iter_data(table_path, query, language, variables,
+                                                     max_chunks=self.max_chunks):
+            if cube is None:
+                meta = self._layout(variables, response, values_file, updated, table.get("title", ""),
+                                    normalize_path(table_path))
+                meta["status_file"] = status_file
+                shape = tuple(len(dim["values"]) for dim in meta["dimensions"])
+                cube, status = await run_blocking(self._create_cube, os.path.join(directory, values_file),
+                                                  os.path.join(directory, status_file), shape)
+                positions = [{value: i for i, value in enumerate(dim["values"])} for dim in meta["dimensions"]]
+            for col in response.get("columns", []):
+                if col.get("type") == "c":
+                    measures.setdefault(col["code"], col)
+            await run_blocking(self._fill, cube, status, positions, response, symbols)
+
+        # Chunks split on the contents variable each carry only some of the value columns
+        meta["content_columns"] = [measures.get(code) or {"code": code, "text": code, "type": "c"}
+                                   for code in meta["dimensions"][-1]["values"]]
+        meta["symbols"] = list(symbols)
+        await run_blocking(self._commit, directory, cube, status, meta)
+        key = (normalize_language(language), normalize_path(table_path))
+        self._replicas.pop(key, None)
+        self._missing.pop(key, None)
+        self.downloads += 1
+        logger.info(f"Stored {table_path} ({language}): {cube.size} cells in {time.time() - started:.1f}s")
+
+    @staticmethod
+    def _layout(variables: list, response: dict, values_file: str, updated: Optional[str], title: str,
+                path: str) -> dict:
+        """Describe the cube: response key columns in order, then the contents axis"""
+        by_code = {var["code"]: var for var in variables}
+        key_columns = [col for col in response.get("columns", []) if col.get("type") != "c"]
+        content_columns = [col for col in response.get("columns", []) if col.get("type") == "c"]
+        dimensions = [
+            {"code": col["code"], "text": col.get("text", col["code"]), "kind": col.get("type", "d"),
+             "values": list(by_code[col["code"]]["values"])}
+            for col in key_columns
+        ]
+        content_var = [var for var in variables if var["code"] not in {col["code"] for col in key_columns}]
+        dimensions.append({
+            "code": content_var[0]["code"] if content_var else CONTENTS_CODE,
+            "text": content_var[0].get("text", "") if content_var else "",
+            "kind": "c",
+            # The whole table is requested, so every value of the contents variable is a column
+            "values": list(content_var[0]["values"]) if content_var else [col["code"] for col in content_columns],
+        })
+        return {
+            "path": path,
+            "title": title,
+            "updated": updated,
+            "stored_at": time.time(),
+            "values_file": values_file,
+            "variables": variables,
+            "dimensions": dimensions,
+            "content_columns": content_columns,
+            "comments": response.get("comments", []),
+            "extra": {k: v for k, v in response.items() if k not in ("columns", "data", "comments")},
+        }
+
+    @staticmethod
+    def _create_cube(values_path: str, status_path: str, shape: tuple) -> tuple:
+        cube = np.memmap(values_path, dtype=np.float64, mode="w+", shape=shape)
+        cube[...] = np.nan
+        status = np.memmap(status_path, dtype=np.int16, mode="w+", shape=shape)
+        status[...] = -1  # MISSING
+        return cube, status
+
+    @staticmethod
+    def _fill(cube: np.memmap, status: np.memmap, positions: list, response: dict, symbols: dict) -> None:
+        key_positions = positions[:-1]
+        measures = [positions[-1][col["code"]] for col in response.get("columns", []) if col.get("type") == "c"]
+        for row in response.get("data", []):
+            index = tuple(pos[key] for pos, key in zip(key_positions, row["key"]))
+            for m, raw in zip(measures, row.get("values", [])):
+                cube[index + (m,)], status[index + (m,)] = _encode_cell(raw, symbols)
+
+    @staticmethod
+    def _commit(directory: str, cube: np.memmap, status: np.memmap, meta: dict) -> None:
+        """Flush the cubes, then atomically point meta.json at them and drop older cube files"""
+        cube.flush()
+        status.flush()
+        tmp_path = os.path.join(directory, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+        for name in os.listdir(directory):
+            if name.startswith(("values.", "status.")) and name not in (meta["values_file"], meta["status_file"]):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def refresh_later(self, client, table_path: str, language: str, updated: Optional[str]) -> None:
+        """Re-download a stale replica in the background; queries use SCB meanwhile.
+
+        Only one refresh per table runs at a time, and after a failed one the table is
+        not retried until its backoff has passed.
+        """
+        key = (normalize_language(language), normalize_path(table_path))
+        failures, retry_at = self._failures.get(key, (0, 0.0))
+        if key in self._refreshing or time.monotonic() < retry_at:
+            return
+
+        async def run():
+            try:
+                await self.download(client, table_path, language, updated)
+                self._failures.pop(key, None)
+            except Exception as e:
+                delay = min(REFRESH_BACKOFF * 2 ** failures, REFRESH_BACKOFF_MAX)
+                logger.error(f"Refreshing stored table {table_path} failed, retrying in {delay:.0f}s: {e}")
+                self._failures[key] = (failures + 1, time.monotonic() + delay)
+                self.last_error = str(e)
+            finally:
+                self._refreshing.discard(key)
+
+        self._refreshing.add(key)
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def sync(self, client, resolve: Callable, table_updated: Callable) -> None:
+        """Download configured tables that are missing or out of date"""
+        for table_id in self.tables:
+            for language in self.languages:
+                try:
+                    table_path = await resolve(table_id, language)
+                    updated = table_updated(table_path, language)
+                    if not self.is_current(table_path, language, updated):
+                        await self.download(client, table_path, language, updated)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Storing table {table_id} ({language}) failed: {e}", exc_info=True)
+                    self.last_error = str(e)
+
+    async def start(self, client, resolve: Callable, table_updated: Callable, download: bool = True) -> None:
+        """Download missing or stale configured tables in the background"""
+        if download and self.tables and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.sync(client, resolve, table_updated))
+
+    async def stop(self) -> None:
+        for task in [self.task, *self._tasks]:
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.task = None
+
+    def stats(self) -> dict:
+        return {
+            "dir": self.directory,
+            "tables": self.tables,
+            "languages": list(self.languages),
+            "open_replicas": len(self._replicas),
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "downloads": self.downloads,
+            "failed_refreshes": {f"{lang}:{path}": count for (lang, path), (count, _) in self._failures.items()},
+            "last_error": self.last_error,
+        }
+
+
+_table_store: Optional[TableStore] = None
+
+
+def get_table_store() -> Optional[TableStore]:
+    """Get the process-wide store from SCB_TABLE_STORE_* variables; None unless tables are configured"""
+    global _table_store
+    tables = [t.strip() for t in os.environ.get("SCB_TABLE_STORE_TABLES", "").split(",") if t.strip()]
+    if _table_store is None and tables:
+        languages = [normalize_language(lang.strip()) for lang in
+                     os.environ.get("SCB_TABLE_STORE_LANGUAGES", "sv").split(",") if lang.strip()]
+        try:
+            max_chunks = int(os.environ.get("SCB_TABLE_STORE_MAX_CHUNKS", DEFAULT_MAX_CHUNKS))
+        except ValueError:
+            max_chunks = DEFAULT_MAX_CHUNKS
+        _table_store = TableStore(
+            directory=os.environ.get("SCB_TABLE_STORE_DIR", DEFAULT_STORE_DIR) or DEFAULT_STORE_DIR,
+            tables=tables,
+            languages=tuple(dict.fromkeys(languages)) or ("sv",),
+            max_chunks=max_chunks,
+        )
+    return _table_store
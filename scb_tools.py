@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+SCB tool definitions and implementations shared by the stdio, HTTP and SSE servers
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+import scb_metrics as metrics
+import scb_tracing as tracing
+from scb_aggregate import AGGREGATES, aggregate_response, push_down
+from scb_backend import get_backend
+from scb_cache import get_metadata_cache
+from scb_cassette import get_cassette, warm_cache
+from scb_client import ScbClient, normalize_language
+from scb_executor import run_blocking
+from scb_format import FORMATS, format_response
+from scb_join import JOIN_TYPES, join_responses
+from scb_json import dumps
+from scb_result_cache import get_result_cache
+from scb_search_index import fold, get_search_service
+from scb_singleflight import SingleFlight, call_key
+from scb_table_store import get_table_store
+
+logger = logging.getLogger("scb-tools")
+
+# In-process stand-in for the SCB API selected by SCB_BACKEND, or None for the live API
+backend = get_backend()
+# Local backends persist their index and caches separately from the live API's
+backend_name = backend.name if backend is not None else None
+
+# Shared stateless SCB client; language, path and table are passed per call
+scb_client = ScbClient(
+    transport=backend,
+    rate_limiter=backend.rate_limiter if backend is not None else None,
+    cache=get_metadata_cache(backend_name),
+    result_cache=get_result_cache(backend_name),
+    cassette=get_cassette(),
+)
+
+# Offline index over the full table tree, used by scb_search_tables
+search_service = get_search_service(backend_name)
+# Local replicas of the tables listed in SCB_TABLE_STORE_TABLES, or None
+table_store = get_table_store()
+
+# Identical concurrent tool calls share one execution
+tool_flight = SingleFlight()
+
+MAX_SEARCH_LIMIT = 100
+# Upper bound on calls in one batch request
+MAX_BATCH_CALLS = 50
+# Upper bound on tables joined by scb_join_tables
+MAX_JOIN_TABLES = 5
+
+LANGUAGE_PROPERTY = {
+    "type": "string",
+    "description": "Language for results: 'sv' (Swedish) or 'en' (English)",
+    "enum": ["sv", "en"],
+    "default": "sv",
+}
+
+TOOL_DEFINITIONS = [
+    {
+        "name": "scb_browse_metadata",
+        "description": (
+            "Browse SCB metadata tree to discover available statistical tables. "
+            "Start from root or navigate to specific paths. "
+            "Returns metadata including table IDs, titles, and navigation options. "
+            "Supports both Swedish (sv) and English (en)."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path in metadata tree (e.g., 'AM/AM0401' or empty for root)",
+                    "default": "",
+                },
+                "language": LANGUAGE_PROPERTY,
+            },
+        },
+    },
+    {
+        "name": "scb_search_tables",
+        "description": (
+            "Search for statistical tables in SCB database using keywords. "
+            "Searches titles, IDs and folder names of every table, ranked by relevance. "
+            "Returns matching tables with their IDs, titles, and paths. "
+            "Supports both Swedish and English search."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Search query (e.g., 'befolkning', 'population', 'arbetslöshet', 'unemployment')",
+                },
+                "language": LANGUAGE_PROPERTY,
+                "limit": {
+                    "type": "integer",
+                    "description": f"Maximum number of matches to return (1-{MAX_SEARCH_LIMIT})",
+                    "default": 20,
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Number of matches to skip, for pagination",
+                    "default": 0,
+                },
+            },
+            "required": ["query"],
+        },
+    },
+    {
+        "name": "scb_get_table_metadata",
+        "description": (
+            "Get detailed metadata for a specific SCB table including available variables, "
+            "dimensions, time periods, and value codes. This is essential before fetching data."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "table_id": {
+                    "type": "string",
+                    "description": "SCB table ID (e.g., 'TAB638', 'BE0101N1')",
+                },
+                "language": LANGUAGE_PROPERTY,
+            },
+            "required": ["table_id"],
+        },
+    },
+    {
+        "name": "scb_fetch_data",
+        "description": (
+            "Fetch actual statistical data from an SCB table. "
+            "Requires table_id and query specification with variables and their values. "
+            "Returns data in structured JSON format; use format 'columnar' or 'json-stat2' "
+            "for a much smaller payload on large selections."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "table_id": {
+                    "type": "string",
+                    "description": "SCB table ID",
+                },
+                "query": {
+                    "type": "object",
+                    "description": (
+                        "Query specification with variables and selected values. "
+                        "Example: {'Region': ['*'], 'Tid': ['2023', '2024']}"
+                    ),
+                },
+                "language": LANGUAGE_PROPERTY,
+                "format": {
+                    "type": "string",
+                    "description": (
+                        "Result format: 'json' (PxWeb rows with keys), 'columnar' (category "
+                        "dictionaries plus flat value arrays) or 'json-stat2'"
+                    ),
+                    "enum": list(FORMATS),
+                    "default": "json",
+                },
+                "group_by": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": (
+                        "Variable codes to group by; other variables are aggregated away. "
+                        "Example: ['Region'] for totals per region"
+                    ),
+                },
+                "aggregate": {
+                    "type": "string",
+                    "description": "Aggregate applied per group_by group",
+                    "enum": list(AGGREGATES),
+                    "default": "sum",
+                },
+                "filter": {
+                    "type": "object",
+                    "description": (
+                        "Row filter: a variable code maps to allowed values (also narrows the upstream "
+                        "query), a measure code to comparisons. Example: "
+                        "{'Kon': ['1'], 'BE0101N1': {'gte': 10000}}; operators eq, ne, gt, gte, lt, lte"
+                    ),
+                },
+                "top_n": {
+                    "type": "integer",
+                    "description": "Keep only the N rows (groups) with the largest value of the first measure",
+                },
+            },
+            "required": ["table_id", "query"],
+        },
+    },
+    {
+        "name": "scb_join_tables",
+        "description": (
+            "Fetch data from several SCB tables at once and join them on shared dimensions "
+            "(e.g. Region and Tid), returning one compact table with a value column per table "
+            "measure. Use it to compare series across tables without fetching each one separately."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "tables": {
+                    "type": "array",
+                    "description": (
+                        f"2-{MAX_JOIN_TABLES} tables to join, each {{'table_id': ..., 'query': {{...}}}} "
+                        "with the same query format as scb_fetch_data"
+                    ),
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "table_id": {"type": "string"},
+                            "query": {"type": "object"},
+                        },
+                        "required": ["table_id", "query"],
+                    },
+                },
+                "on": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Dimension codes to join on (default: every dimension the tables share)",
+                },
+                "how": {
+                    "type": "string",
+                    "description": "'inner' keeps rows present in every table; 'outer' keeps all rows",
+                    "enum": list(JOIN_TYPES),
+                    "default": "inner",
+                },
+                "language": LANGUAGE_PROPERTY,
+            },
+            "required": ["tables"],
+        },
+    },
+    {
+        "name": "scb_get_table_info",
+        "description": (
+            "Get comprehensive information about a specific table including its location path, "
+            "full URL, and basic metadata. Useful for understanding table context."
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "table_id": {
+                    "type": "string",
+                    "description": "SCB table ID",
+                },
+                "language": LANGUAGE_PROPERTY,
+            },
+            "required": ["table_id"],
+        },
+    },
+]
+
+
+class ToolError(ValueError):
+    """Invalid tool call; status_code is used by the HTTP server"""
+    status_code = 400
+
+
+class UnknownToolError(ToolError):
+    """Tool name not in TOOL_DEFINITIONS"""
+    status_code = 404
+
+
+async def startup(crawl: bool = True) -> None:
+    """Load shared state when a server starts; crawl=False skips the background index crawl and table downloads"""
+    warm_from = os.environ.get("SCB_CACHE_WARM_FROM")
+    if warm_from and scb_client.cache is not None:
+        try:
+            logger.info(f"Warmed metadata cache with {await warm_cache(scb_client.cache, warm_from)} entries")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not warm metadata cache from {warm_from}: {e}")
+    await search_service.start(scb_client, crawl=crawl)
+    if table_store is not None:
+        await table_store.start(scb_client, resolve_table, search_service.table_updated, download=crawl)
+
+
+async def shutdown() -> None:
+    """Release shared resources when a server stops"""
+    await search_service.stop()
+    if table_store is not None:
+        await table_store.stop()
+    await scb_client.aclose()
+
+
+def upstream_stats() -> dict:
+    """Runtime statistics for the shared upstream layers"""
+    return {
+        "backend": backend.stats() if backend is not None else {"backend": "scb", "url": scb_client.api_url},
+        "rate_limiter": scb_client.rate_limiter.stats(),
+        "metadata_cache": scb_client.cache.stats() if scb_client.cache else None,
+        "metadata_index": scb_client.schema_stats(),
+        "result_cache": scb_client.result_cache.stats() if scb_client.result_cache else None,
+        "search_index": search_service.stats(),
+        "table_store": table_store.stats() if table_store is not None else None,
+        "coalescing": {"tools": tool_flight.stats(), "upstream": scb_client.inflight.stats()},
+        "cassette": scb_client.cassette.stats() if scb_client.cassette is not None else None,
+        "tracing": tracing.get_tracer().stats() if tracing.get_tracer() is not None else None,
+    }
+
+
+def get_tool_definition(name: str) -> dict:
+    """Get a tool definition by name"""
+    for tool in TOOL_DEFINITIONS:
+        if tool["name"] == name:
+            return tool
+    raise UnknownToolError(f"Unknown tool: {name}")
+
+
+def prepare_arguments(name: str, arguments: Any) -> dict:
+    """Validate arguments against the tool schema and fill in defaults"""
+    schema = get_tool_definition(name)["inputSchema"]
+    arguments = arguments or {}
+
+    missing = [arg for arg in schema.get("required", []) if arg not in arguments]
+    if len(missing) == 1:
+        raise ToolError(f"Missing required argument '{missing[0]}'")
+    if missing:
+        raise ToolError(f"Missing required arguments {' and '.join(repr(arg) for arg in missing)}")
+
+    kwargs = normalize_arguments(schema, arguments)
+    if kwargs.get("format", "json") not in FORMATS:
+        raise ToolError(f"Unknown format '{kwargs['format']}'. Available: {', '.join(FORMATS)}")
+    return kwargs
+
+
+def prepare_stream_arguments(arguments: Any) -> dict:
+    """Prepare scb_fetch_data arguments for streaming, which sends rows as they arrive"""
+    kwargs = prepare_arguments("scb_fetch_data", arguments)
+    if kwargs.pop("format", "json") != "json":
+        raise ToolError("Streaming only supports format 'json'")
+    kwargs.pop("aggregate", None)
+    if any(kwargs.get(arg) is not None for arg in ("group_by", "filter", "top_n")):
+        raise ToolError("Streaming does not support group_by, filter or top_n")
+    return kwargs
+
+
+async def run_handler(name: str, kwargs: dict, scheduled: float) -> dict:
+    """Run a tool handler in its own span; 'scheduled' is when its task was created"""
+    with tracing.span("execute", **{"tool.name": name}) as span:
+        span.set("event_loop.queue_ms", round((time.perf_counter() - scheduled) * 1000, 3))
+        result = await TOOL_HANDLERS[name](**kwargs)
+        if isinstance(result, dict) and "error" in result:
+            span.error(str(result["error"]))
+        return result
+
+
+async def call_tool(name: str, arguments: Any) -> dict:
+    """Validate arguments and run a tool"""
+    with tracing.trace(f"tool {name}", **{"tool.name": name}):
+        kwargs = prepare_arguments(name, arguments)
+        scheduled = time.perf_counter()
+        with metrics.tool_call(name) as call:
+            result = await tool_flight.do(call_key(name, kwargs), lambda: run_handler(name, kwargs, scheduled))
+            call.done(result)
+            return result
+
+
+async def call_tool_encoded(name: str, arguments: Any) -> tuple:
+    """Run a tool and return (result, result encoded as JSON).
+
+    Identical concurrent calls share both the execution and the encoded bytes, so a
+    large result is serialized once however many clients asked for it.
+    """
+    with tracing.trace(f"tool {name}", **{"tool.name": name}) as span:
+        kwargs = prepare_arguments(name, arguments)
+        key = call_key(name, kwargs)
+        scheduled = time.perf_counter()
+
+        async def run_and_encode():
+            result = await tool_flight.do(key, lambda: run_handler(name, kwargs, scheduled))
+            with metrics.timed("serialization"), tracing.span("serialize") as serialize:
+                encoded = dumps(result)
+                serialize.set("response.bytes", len(encoded))
+            return result, encoded
+
+        with metrics.tool_call(name) as call:
+            result, encoded = await tool_flight.do("encoded:" + key, run_and_encode)
+            call.done(result, encoded)
+            span.set("response.bytes", len(encoded))
+            return result, encoded
+
+
+async def call_tools(calls: list) -> list:
+    """Run several tool calls concurrently and return one outcome per call, in order.
+
+    Upstream requests are still paced by the shared rate limiter, and identical calls in
+    the batch run once. Each outcome is {"success": True, "result": ...} or
+    {"success": False, "status": <HTTP status>, "error": ...}.
+    """
+    if len(calls) > MAX_BATCH_CALLS:
+        raise ToolError(f"Batch has {len(calls)} calls (limit {MAX_BATCH_CALLS})")
+
+    async def run(call) -> dict:
+        if not isinstance(call, dict) or not call.get("name"):
+            return {"success": False, "status": 400, "error": "Each call needs a 'name' field"}
+        try:
+            return {"success": True, "result": await call_tool(call["name"], call.get("arguments", {}))}
+        except ToolError as e:
+            return {"success": False, "status": e.status_code, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Error in batched {call.get('name')}: {e}", exc_info=True)
+            return {"success": False, "status": 500, "error": str(e)}
+
+    return list(await asyncio.gather(*(run(call) for call in calls)))
+
+
+def normalize_arguments(schema: dict, arguments: dict) -> dict:
+    """Keep known arguments and fill in defaults, so equivalent calls compare equal"""
+    kwargs = {}
+    for key, prop in schema["properties"].items():
+        if key in arguments:
+            kwargs[key] = arguments[key]
+        elif "default" in prop:
+            kwargs[key] = prop["default"]
+    if "language" in kwargs:
+        kwargs["language"] = normalize_language(kwargs["language"])
+    return kwargs
+
+
+async def resolve_table(table_id: str, language: str = "sv") -> str:
+    """Resolve a table ID to its tree path, from the search index when possible"""
+    if "/" not in table_id:
+        total, matches = search_service.search(table_id, normalize_language(language), limit=1)
+        if matches and fold(matches[0]["id"]) == fold(table_id):
+            return matches[0]["path"]
+    return await scb_client.find_table(table_id, language)
+
+
+async def browse_metadata(path: str = "", language: str = "sv") -> dict:
+    """Browse SCB metadata tree"""
+    try:
+        result = await scb_client.list_nodes(path, language)
+
+        metadata = {
+            "path": path or "root",
+            "language": language,
+            "items": []
+        }
+
+        if isinstance(result, list):
+            for item in result:
+                metadata["items"].append({
+                    "id": item.get("id", ""),
+                    "text": item.get("text", ""),
+                    "type": item.get("type", ""),
+                })
+
+        return metadata
+
+    except Exception as e:
+        return {"error": str(e), "path": path, "language": language}
+
+
+async def search_tables(query: str, language: str = "sv", limit: int = 20, offset: int = 0) -> dict:
+    """Search for tables matching query"""
+    try:
+        limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+        offset = max(0, int(offset))
+        results = {
+            "query": query,
+            "language": language,
+            "limit": limit,
+            "offset": offset,
+            "matches": []
+        }
+
+        if not search_service.index.is_empty(language):
+            total, matches = search_service.search(query, language, limit, offset)
+            results.update({"total": total, "matches": matches, "source": "index"})
+            return results
+
+        # Index not built yet: fall back to the top-level categories
+        root = await scb_client.list_nodes("", language)
+        query_lower = query.lower()
+        for item in root:
+            text = item.get("text", "").lower()
+            if query_lower in text:
+                results["matches"].append({
+                    "id": item.get("id", ""),
+                    "text": item.get("text", ""),
+                    "type": item.get("type", ""),
+                })
+        results.update({"total": len(results["matches"]), "source": "root", "index_state": search_service.state})
+        return results
+
+    except Exception as e:
+        return {"error": str(e), "query": query, "language": language}
+
+
+async def get_table_metadata(table_id: str, language: str = "sv") -> dict:
+    """Get detailed metadata for a table"""
+    try:
+        table_path = await resolve_table(table_id, language)
+        table = await scb_client.get_table_metadata(table_path, language)
+
+        return {
+            "table_id": table_id,
+            "language": language,
+            "title": table.get("title", ""),
+            "variables": table.get("variables", [])
+        }
+
+    except Exception as e:
+        return {"error": str(e), "table_id": table_id, "language": language}
+
+
+async def fetch_table(table_id: str, query: dict, language: str = "sv", filter: dict = None) -> dict:
+    """Resolve a table and fetch a query, returning its path, metadata and PxWeb response.
+
+    Value lists in 'filter' are pushed down into the query, so they are never fetched.
+    Tables with a current local replica are answered from it without calling SCB.
+    """
+    with tracing.span("resolve_table", **{"table.id": table_id}):
+        table_path = await resolve_table(table_id, language)
+    with tracing.span("metadata", **{"table.path": table_path}):
+        schema = await scb_client.get_table_schema(table_path, language)
+        # A filter may add variables the query left out, so elimination is checked after it
+        query = schema.expand(query, partial=True)
+        if filter:
+            query = push_down(schema.variables, query, filter)
+        schema.check_elimination(query)
+    updated = search_service.table_updated(table_path, language)
+    response = None
+    if table_store is not None and table_store.has(table_path, language):
+        if table_store.is_current(table_path, language, updated, schema.variables):
+            with tracing.span("table_store.lookup") as span:
+                response = await run_blocking(table_store.lookup, table_path, language, query)
+                span.set("hit", response is not None)
+        else:
+            table_store.refresh_later(scb_client, table_path, language, updated)
+    if response is None:
+        with tracing.span("get_data", **{"table.path": table_path}) as span:
+            response = await scb_client.get_data(table_path, query, language, updated=updated, schema=schema)
+            span.set("rows", len(response.get("data", [])))
+    return {"table_id": table_id, "path": table_path, "title": schema.title,
+            "variables": schema.variables, "response": response}
+
+
+async def fetch_data(table_id: str, query: dict, language: str = "sv", format: str = "json",
+                     group_by: list = None, aggregate: str = "sum", filter: dict = None,
+                     top_n: int = None) -> dict:
+    """Fetch data from a table, optionally filtered and aggregated server-side"""
+    try:
+        table = await fetch_table(table_id, query, language, filter)
+        data = table["response"]
+        if group_by is not None or filter or top_n is not None:
+            with tracing.span("aggregate"):
+                data = await run_blocking(aggregate_response, data, group_by, aggregate, filter, top_n)
+        with tracing.span("format", format=format):
+            formatted = format_response(data, format, table["variables"], table["title"])
+
+        return {
+            "table_id": table_id,
+            "language": language,
+            "query": query,
+            "format": format,
+            "data": formatted
+        }
+
+    except Exception as e:
+        return {"error": str(e), "table_id": table_id, "query": query, "language": language}
+
+
+async def join_tables(tables: list, on: list = None, how: str = "inner", language: str = "sv") -> dict:
+    """Fetch several tables concurrently and join them on shared dimensions"""
+    try:
+        if not isinstance(tables, list) or not 2 <= len(tables) <= MAX_JOIN_TABLES:
+            raise ValueError(f"'tables' must list 2-{MAX_JOIN_TABLES} tables")
+        for table in tables:
+            if not isinstance(table, dict) or "table_id" not in table or "query" not in table:
+                raise ValueError("Each table needs 'table_id' and 'query'")
+
+        fetched = await asyncio.gather(*(
+            fetch_table(table["table_id"], table["query"], language) for table in tables
+        ))
+        joined = join_responses(fetched, on, how)
+
+        return {
+            "language": language,
+            "tables": [{"table_id": t["table_id"], "path": t["path"], "title": t["title"]} for t in fetched],
+            **joined,
+        }
+
+    except Exception as e:
+        return {"error": str(e), "tables": tables, "language": language}
+
+
+async def get_table_info(table_id: str, language: str = "sv") -> dict:
+    """Get general information about a table"""
+    try:
+        table_path = await resolve_table(table_id, language)
+        table = await scb_client.get_table_metadata(table_path, language)
+
+        return {
+            "table_id": table_id,
+            "language": language,
+            "path": table_path,
+            "title": table.get("title", ""),
+            "url": scb_client.get_table_url(table_path, language),
+            "info": "Table found and accessible"
+        }
+
+    except Exception as e:
+        return {"error": str(e), "table_id": table_id, "language": language}
+
+
+async def stream_fetch_data(table_id: str, query: dict, language: str = "sv"):
+    """Fetch data from a table as a stream of events, one chunk of rows at a time.
+
+    Yields {"type": "meta", ...} once the first chunk arrives, then
+    {"type": "rows", "chunk", "completed", "chunks", "data"} per sub-query in completion
+    order (with "columns" when a chunk's columns differ from the meta event's), and finally {"type": "end", "rows", "comments"}; failures yield {"type": "error"}.
+    """
+    rows = 0
+    comments = []
+    try:
+        table_path = await resolve_table(table_id, language)
+        completed = 0
+        columns = None
+        async for index, chunks, response in scb_client.iter_data(table_path, query, language):
+            if completed == 0:
+                columns = response.get("columns", [])
+                yield {
+                    "type": "meta",
+                    "table_id": table_id,
+                    "language": language,
+                    "query": query,
+                    "chunks": chunks,
+                    "columns": columns,
+                }
+            completed += 1
+            data = response.get("data", [])
+            rows += len(data)
+            for comment in response.get("comments", []):
+                if comment not in comments:
+                    comments.append(comment)
+            event = {"type": "rows", "chunk": index, "completed": completed, "chunks": chunks, "data": data}
+            if response.get("columns", []) != columns:
+                # Split on the contents variable: this chunk's rows hold other value columns
+                event["columns"] = response.get("columns", [])
+            yield event
+
+        yield {"type": "end", "rows": rows, "comments": comments}
+
+    except Exception as e:
+        logger.error(f"Error streaming {table_id}: {e}", exc_info=True)
+        yield {"type": "error", "error": str(e), "table_id": table_id, "rows": rows}
+
+
+TOOL_HANDLERS = {
+    "scb_browse_metadata": browse_metadata,
+    "scb_search_tables": search_tables,
+    "scb_get_table_metadata": get_table_metadata,
+    "scb_fetch_data": fetch_data,
+    "scb_join_tables": join_tables,
+    "scb_get_table_info": get_table_info,
+}
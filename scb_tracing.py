@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Opt-in tracing of tool calls, with a sampling profiler for slow calls
+Spans follow the OpenTelemetry data model and are exported as OTLP/JSON, one trace per line,
+to a file (readable by the collector's otlpjsonfile receiver) and/or an OTLP/HTTP endpoint.
+Calls slower than a threshold can also dump folded stacks for flame graphs. Traces start at
+server and tool entry points (trace()); spans opened outside one (span()) are not recorded.
+"""
+
+import contextvars
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+from scb_json import dumps
+
+logger = logging.getLogger("scb-tracing")
+
+SERVICE_NAME = "scb-mcp"
+DEFAULT_TRACE_FILE = "scb_traces.jsonl"
+DEFAULT_PROFILE_DIR = "scb_profiles"
+DEFAULT_PROFILE_INTERVAL = 0.005
+# Finished traces waiting for the exporter thread; more are dropped rather than queued
+DEFAULT_EXPORT_QUEUE = 1000
+
+# OTLP span status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _attribute(key: str, value) -> dict:
+    """OTLP/JSON key-value; ints are strings in OTLP's JSON mapping"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """One timed operation; children share the trace of their parent"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes)
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def error(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.message = message
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """Spans of one root operation, exported together when the root ends"""
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: list = []
+        self.exported = False
+        self.samples: Optional[Counter] = None
+
+
+class _NullSpan:
+    """Stand-in yielded when tracing is off or the trace was not sampled"""
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def error(self, message: str) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+_current: contextvars.ContextVar = contextvars.ContextVar("scb_span", default=None)
+
+
+class StackSampler:
+    """Samples the event loop thread's stack while slow-call candidates are running.
+
+    All coroutines share the event loop thread, so a call's samples include work done
+    for calls running at the same time.
+    """
+
+    def __init__(self, interval: float = DEFAULT_PROFILE_INTERVAL):
+        self.interval = interval
+        self._active: dict = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def start(self, trace: Trace) -> None:
+        with self._lock:
+            trace.samples = Counter()
+            self._active[trace.trace_id] = trace.samples
+            self._target = threading.get_ident()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="scb-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, trace: Trace) -> Counter:
+        with self._lock:
+            return self._active.pop(trace.trace_id, None) or Counter()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                frame = sys._current_frames().get(self._target)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                folded = ";".join(reversed(stack))
+                for samples in self._active.values():
+                    samples[folded] += 1
+
+
+class Tracer:
+    """Creates spans and exports finished traces"""
+
+    def __init__(self, path: Optional[str] = None, endpoint: Optional[str] = None, sample_rate: float = 1.0,
+                 profile_threshold: Optional[float] = None, profile_dir: str = DEFAULT_PROFILE_DIR,
+                 profile_interval: float = DEFAULT_PROFILE_INTERVAL, queue_size: int = DEFAULT_EXPORT_QUEUE):
+        self.path = path
+        self.endpoint = endpoint
+        self.sample_rate = sample_rate
+        self.profile_threshold = profile_threshold
+        self.profile_dir = profile_dir
+        self.sampler = StackSampler(profile_interval) if profile_threshold is not None else None
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._exporter: Optional[threading.Thread] = None
+        self._exporter_lock = threading.Lock()
+        self.traces = 0
+        self.profiles = 0
+        self.dropped = 0
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes):
+        """Time a block as a span of the running trace; outside any trace, a 'root' block
+        starts a new (sampled) trace and any other block is not traced"""
+        parent = _current.get()
+        if parent is NULL_SPAN or (parent is None and not root):
+            yield NULL_SPAN
+            return
+        if parent is None:
+            if random.random() >= self.sample_rate:
+                # Not sampled: blocks inside this one are not traced either
+                token = _current.set(NULL_SPAN)
+                try:
+                    yield NULL_SPAN
+                finally:
+                    _current.reset(token)
+                return
+            trace = Trace()
+            if self.sampler is not None:
+                self.sampler.start(trace)
+        else:
+            trace = parent.trace
+        span = Span(trace, name, parent.span_id if parent else None, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+            trace.spans.append(span)
+            if parent is None:
+                self._finish(trace, span)
+            elif trace.exported:
+                # A span outliving its root (e.g. a background refresh) goes out on its own
+                self._export([span])
+
+    def _finish(self, trace: Trace, root: Span) -> None:
+        trace.exported = True
+        self.traces += 1
+        if self.sampler is not None:
+            samples = self.sampler.stop(trace)
+            if root.duration >= self.profile_threshold and samples:
+                path = os.path.join(self.profile_dir, f"{trace.trace_id}.folded")
+                root.set("profile.path", path)
+                self.profiles += 1
+                self._submit(self._write_profile, path, samples)
+        self._export(trace.spans)
+
+    def _export(self, spans: list) -> None:
+        body = dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        })
+        self._submit(self._send, body)
+
+    def _submit(self, func, *args) -> None:
+        """Hand work to the exporter thread, or drop it when the queue is full.
+
+        Exports run on their own thread rather than the shared worker pool, so a slow or
+        unreachable collector cannot hold up cache, aggregation or table store work.
+        """
+        with self._exporter_lock:
+            if self._exporter is None or not self._exporter.is_alive():
+                self._exporter = threading.Thread(target=self._run_exporter, name="scb-trace-exporter", daemon=True)
+                self._exporter.start()
+        try:
+            self._queue.put_nowait((func, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run_exporter(self) -> None:
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Wait until every queued export has been written or sent"""
+        self._queue.join()
+
+    def _send(self, body: bytes) -> None:
+        """Write and/or post one OTLP/JSON export request (runs on the exporter thread)"""
+        try:
+            if self.path:
+                with open(self.path, "ab") as f:
+                    f.write(body + b"\n")
+            if self.endpoint:
+                httpx.post(self.endpoint, content=body, headers={"Content-Type": "application/json"}, timeout=5.0)
+        except (OSError, httpx.HTTPError) as e:
+            logger.warning(f"Could not export trace: {e}")
+
+    def _write_profile(self, path: str, samples: Counter) -> None:
+        """Folded stacks ('frame;frame;frame count'), the input format of flamegraph.pl and speedscope"""
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning(f"Could not write profile {path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "file": self.path,
+            "endpoint": self.endpoint,
+            "sample_rate": self.sample_rate,
+            "traces": self.traces,
+            "dropped": self.dropped,
+            "profile_threshold_seconds": self.profile_threshold,
+            "profiles": self.profiles,
+        }
+
+
+_tracer: Optional[Tracer] = None
+_configured = False
+
+
+def _env_float(name: str) -> Optional[float]:
+    try:
+        value = float(os.environ.get(name, ""))
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Get the process-wide tracer from SCB_TRACE_* / SCB_PROFILE_* variables; None when tracing is off"""
+    global _tracer, _configured
+    if not _configured:
+        _configured = True
+        path = os.environ.get("SCB_TRACE_FILE") or None
+        endpoint = os.environ.get("SCB_TRACE_ENDPOINT") or None
+        if os.environ.get("SCB_TRACING", "0") == "1" and not (path or endpoint):
+            path = DEFAULT_TRACE_FILE
+        if os.environ.get("SCB_TRACING", "0") == "1":
+            sample_rate = _env_float("SCB_TRACE_SAMPLE_RATE")
+            slow_ms = _env_float("SCB_PROFILE_SLOW_MS")
+            interval_ms = _env_float("SCB_PROFILE_INTERVAL_MS")
+            _tracer = Tracer(
+                path=path,
+                endpoint=endpoint,
+                sample_rate=1.0 if sample_rate is None else min(sample_rate, 1.0),
+                profile_threshold=slow_ms / 1000 if slow_ms else None,
+                profile_dir=os.environ.get("SCB_PROFILE_DIR") or DEFAULT_PROFILE_DIR,
+                profile_interval=interval_ms / 1000 if interval_ms else DEFAULT_PROFILE_INTERVAL,
+            )
+            logger.info(f"Tracing to {path or endpoint}")
+    return _tracer
+
+
+def configure(tracer: Optional[Tracer]) -> None:
+    """Replace the process-wide tracer (None turns tracing off)"""
+    global _tracer, _configured
+    _tracer = tracer
+    _configured = True
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace a block inside the running trace; otherwise a no-op that yields a null span"""
+    tracer = get_tracer()
+    if tracer is None or _current.get() is None:
+        yield NULL_SPAN
+        return
+    with tracer.span(name, **attributes) as current:
+        yield current
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Like span(), but a block outside any trace starts one; for server and tool entry points"""
+    tracer = get_tracer()
+    if tracer is None:
+        yield NULL_SPAN
+        return
+    with tracer.span(name, root=True, **attributes) as current:
+        yield current
+
+
+def current_span():
+    """The span of the running block, or the null span"""
+    return _current.get() or NULL_SPAN
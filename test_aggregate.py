@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for server-side filtering and aggregation of scb_fetch_data results
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import scb_tools
+from scb_aggregate import aggregate_response, push_down
+
+RESPONSE = {
+    "columns": [
+        {"code": "Region", "text": "region", "type": "d"},
+        {"code": "Kon", "text": "kön", "type": "d"},
+        {"code": "Tid", "text": "år", "type": "t"},
+        {"code": "BE0101N1", "text": "Folkmängd", "type": "c"},
+    ],
+    "comments": [],
+    "data": [
+        {"key": ["0114", "1", "2023"], "values": ["25000"]},
+        {"key": ["0114", "2", "2023"], "values": ["26000"]},
+        {"key": ["0115", "1", "2023"], "values": ["24000"]},
+        {"key": ["0115", "2", "2023"], "values": [".."]},
+        {"key": ["0180", "1", "2023"], "values": ["490000"]},
+        {"key": ["0180", "2", "2023"], "values": ["500000"]},
+    ],
+}
+
+
+def rows(result):
+    return [(row["key"], row["values"]) for row in result["data"]]
+
+
+def test_group_by_sum_skips_missing_values():
+    result = aggregate_response(RESPONSE, group_by=["Region"])
+    assert [col["code"] for col in result["columns"]] == ["Region", "BE0101N1"]
+    assert result["columns"][1]["text"] == "Folkmängd (sum)"
+    assert rows(result) == [(["0114"], [51000]), (["0115"], [24000]), (["0180"], [990000])]
+
+
+@pytest.mark.parametrize("aggregate, expected", [
+    ("mean", [25500, 24000, 495000]),
+    ("min", [25000, 24000, 490000]),
+    ("max", [26000, 24000, 500000]),
+    ("count", [2, 1, 2]),
+])
+def test_other_aggregates(aggregate, expected):
+    result = aggregate_response(RESPONSE, group_by=["Region"], aggregate=aggregate)
+    assert [values[0] for _, values in rows(result)] == expected
+
+
+def test_group_by_nothing_gives_grand_total():
+    assert rows(aggregate_response(RESPONSE, group_by=[])) == [([], [1065000])]
+
+
+def test_filter_and_top_n():
+    result = aggregate_response(RESPONSE, filter={"Kon": ["2"], "BE0101N1": {"lt": 100000}})
+    assert rows(result) == [(["0114", "2", "2023"], [26000])]
+
+    result = aggregate_response(RESPONSE, group_by=["Region"], top_n=2)
+    assert [key for key, _ in rows(result)] == [["0180"], ["0114"]]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        aggregate_response(RESPONSE, group_by=["Alder"])
+    with pytest.raises(ValueError):
+        aggregate_response(RESPONSE, aggregate="median")
+    with pytest.raises(ValueError):
+        aggregate_response(RESPONSE, filter={"BE0101N1": {"between": 1}})
+    with pytest.raises(ValueError):
+        aggregate_response(RESPONSE, top_n=0)
+
+
+def test_push_down_narrows_and_adds_variables():
+    variables = [{"code": "Region"}, {"code": "Kon"}, {"code": "Tid"}]
+    selection = {"Region": ["0114", "0115", "0180"], "Tid": ["2023"]}
+    assert push_down(variables, selection, {"Kon": "2", "Region": ["0180", "9999"]}) == \
+        {"Region": ["0180"], "Kon": ["2"], "Tid": ["2023"]}
+    with pytest.raises(ValueError):
+        push_down(variables, selection, {"Region": ["9999"]})
+
+
+def test_fetch_data_aggregates_and_pushes_filters_upstream(mock_scb):
+    posted = []
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            posted.append(json.loads(request.content))
+            return httpx.Response(200, json=RESPONSE)
+        return httpx.Response(200, json={"title": "Folkmängd", "variables": [
+            {"code": "Region", "values": ["0114", "0115", "0180"]},
+            {"code": "Kon", "values": ["1", "2"]},
+            {"code": "Tid", "values": ["2023"]},
+        ]})
+
+    mock_scb(pxweb)
+    result = asyncio.run(scb_tools.call_tool("scb_fetch_data", {
+        "table_id": "BE/BE0101/BE0101N1",
+        "query": {"Region": ["*"], "Kon": ["*"], "Tid": ["2023"]},
+        "filter": {"Region": ["0114", "0180"]},
+        "group_by": ["Region"],
+        "format": "columnar",
+    }))
+
+    selection = {q["code"]: q["selection"]["values"] for q in posted[0]["query"]}
+    assert selection["Region"] == ["0114", "0180"]
+    assert result["data"]["keys"] == {"Region": [0, 1]}
+    assert result["data"]["values"] == {"BE0101N1": [51000, 990000]}
+
+
+def test_streaming_rejects_aggregation():
+    with pytest.raises(scb_tools.ToolError):
+        scb_tools.prepare_stream_arguments({"table_id": "T", "query": {}, "group_by": ["Region"]})
+
+
+def test_value_filter_on_contents_variable_is_applied_upstream_only(mock_scb):
+    posted = []
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            posted.append(json.loads(request.content))
+            return httpx.Response(200, json=RESPONSE)
+        return httpx.Response(200, json={"title": "Folkmängd", "variables": [
+            {"code": "Region", "values": ["0114", "0115", "0180"]},
+            {"code": "Kon", "values": ["1", "2"]},
+            {"code": "ContentsCode", "values": ["BE0101N1", "BE0101N2"]},
+            {"code": "Tid", "values": ["2023"]},
+        ]})
+
+    mock_scb(pxweb)
+    result = asyncio.run(scb_tools.call_tool("scb_fetch_data", {
+        "table_id": "BE/BE0101/BE0101N1",
+        "query": {"Region": ["*"], "Kon": ["*"], "ContentsCode": ["*"], "Tid": ["2023"]},
+        "filter": {"ContentsCode": ["BE0101N1"]},
+    }))
+
+    assert "error" not in result
+    selection = {q["code"]: q["selection"]["values"] for q in posted[0]["query"]}
+    assert selection["ContentsCode"] == ["BE0101N1"]
+    assert len(result["data"]["data"]) == 6
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process demo and snapshot backends
+"""
+
+import asyncio
+
+import httpx
+
+import scb_backend
+import scb_result_cache
+import scb_search_index
+import scb_tools
+from scb_backend import DemoBackend, SnapshotBackend, get_backend
+from scb_cassette import Cassette
+from scb_client import ScbClient
+from scb_demo_data import get_demo_root_metadata
+from scb_mock_pxweb import MockPxWeb
+from scb_rate_limit import RateLimiter
+from scb_result_cache import result_key
+from scb_search_index import SearchIndex
+from scb_table_store import TableStore
+
+QUERY = {"Region": ["00", "0114"], "Kon": ["2"], "ContentsCode": ["BE0101N2"], "Tid": ["2020", "2023"]}
+
+
+def local_client(backend):
+    return ScbClient(transport=backend, rate_limiter=backend.rate_limiter)
+
+
+def test_demo_backend_serves_demo_tree_through_the_tools(monkeypatch):
+    backend = DemoBackend()
+
+    async def run():
+        client = local_client(backend)
+        root = await client.list_nodes("", "en")
+        path = await client.find_table("BE0101N1")
+        data = await client.get_data(path, {"Region": ["00"], "Tid": ["2023"]})
+        await client.aclose()
+        return root, path, data
+
+    root, path, data = asyncio.run(run())
+    assert root == get_demo_root_metadata("en")
+    assert path == "BE/BE0101/BE0101N1"
+    assert [row["key"] for row in data["data"]] == [["00", "2023"]]
+
+    monkeypatch.setattr(scb_tools, "scb_client", local_client(backend))
+    result = asyncio.run(scb_tools.call_tool("scb_fetch_data", {"table_id": "BE0101A9", "query": QUERY}))
+    assert "error" not in result
+    assert backend.stats()["requests"] >= 5 and backend.stats()["misses"] == 0
+
+
+def test_snapshot_backend_serves_recordings_and_replicas(tmp_path):
+    mock = MockPxWeb()
+    table_path = "BE/BE0101/BE0101A9"
+
+    async def snapshot():
+        client = ScbClient(transport=httpx.ASGITransport(app=mock.app), rate_limiter=RateLimiter(1000, 1),
+                           cassette=Cassette(str(tmp_path / "metadata.jsonl.gz"), "record"))
+        await client.list_nodes("BE/BE0101")
+        await TableStore(str(tmp_path)).download(client, table_path)
+        expected = await client.get_data(table_path, QUERY)
+        await client.aclose()
+        return expected
+
+    expected = asyncio.run(snapshot())
+    requests_before = mock.stats()["requests"]
+    backend = SnapshotBackend(str(tmp_path))
+
+    async def run():
+        client = local_client(backend)
+        nodes = await client.list_nodes("BE/BE0101")
+        data = await client.get_data(table_path, {**QUERY, "Tid": ["1999"]})
+        try:
+            await client.list_nodes("AM")
+        except httpx.HTTPStatusError as e:
+            missing = e.response.status_code
+        await client.aclose()
+        return nodes, data, missing
+
+    nodes, data, missing = asyncio.run(run())
+    assert {node["id"] for node in nodes} == {"BE0101N1", "BE0101A9"}
+    # Not recorded, answered from the replica with the values the mock generates
+    assert data["data"] == MockPxWeb().data("BE0101A9", mock.tables("sv")["BE0101A9"], {"query": [
+        {"code": code, "selection": {"filter": "item", "values": values}}
+        for code, values in {**QUERY, "Tid": ["1999"]}.items()]})[1]["data"]
+    assert expected["data"][0]["key"] == ["00", "2", "2020"]
+    assert missing == 404
+    assert backend.stats()["table_store"]["hits"] == 1
+    assert mock.stats()["requests"] == requests_before
+
+
+def test_get_backend_reads_environment(monkeypatch):
+    monkeypatch.setattr(scb_backend, "_backend", None)
+    monkeypatch.setenv("SCB_BACKEND", "scb")
+    assert get_backend() is None
+    monkeypatch.setenv("SCB_BACKEND", "nope")
+    assert get_backend() is None
+    monkeypatch.setenv("SCB_BACKEND", "demo")
+    assert isinstance(get_backend(), DemoBackend)
+
+
+def test_snapshot_resolves_table_ids_from_stored_replicas(tmp_path, monkeypatch):
+    mock = MockPxWeb()
+
+    async def snapshot():
+        client = ScbClient(transport=httpx.ASGITransport(app=mock.app), rate_limiter=RateLimiter(1000, 1))
+        await TableStore(str(tmp_path)).download(client, "BE/BE0101/BE0101N1")
+        await client.aclose()
+
+    asyncio.run(snapshot())
+    backend = SnapshotBackend(str(tmp_path))
+    monkeypatch.setattr(scb_tools, "scb_client", local_client(backend))
+    result = asyncio.run(scb_tools.call_tool("scb_fetch_data", {
+        "table_id": "BE0101N1", "query": {"Region": ["00"], "Alder": ["*"], "Kon": ["*"], "Tid": ["2023"]}}))
+
+    assert "error" not in result
+    assert result["data"]["data"][0]["key"][0] == "00"
+    assert backend.stats()["stored_tables"] == {"sv": 1, "en": 0}
+
+
+def test_local_backends_persist_apart_from_the_live_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(scb_result_cache, "_result_cache", None)
+    monkeypatch.setattr(scb_search_index, "_search_service", None)
+    monkeypatch.setenv("SCB_RESULT_CACHE_DIR", str(tmp_path / "results"))
+    monkeypatch.setenv("SCB_SEARCH_INDEX_PATH", str(tmp_path / "index.json.gz"))
+    cache = scb_result_cache.get_result_cache("demo")
+    service = scb_search_index.get_search_service("demo")
+    assert cache.directory == str(tmp_path / "results" / "demo")
+    assert service.path == str(tmp_path / "index.demo.json.gz")
+
+    # A demo index saved where the live server looks is not loaded by it
+    SearchIndex(documents={"sv": [{"id": "T", "path": "BE/T"}]}, source="demo").save(str(tmp_path / "index.json.gz"))
+    assert SearchIndex.load(str(tmp_path / "index.json.gz")) is None
+    assert SearchIndex.load(str(tmp_path / "index.json.gz"), "demo").stats()["tables"]["sv"] == 1
+
+    assert local_client(DemoBackend()).source == "demo"
+    assert result_key("BE/T", "sv", {"Tid": ["2023"]}, "demo") != result_key("BE/T", "sv", {"Tid": ["2023"]})
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for batched tool calls: POST /call_tools and JSON-RPC batches on /jsonrpc
+"""
+
+import asyncio
+
+import scb_tools
+
+
+def fake_table_info(monkeypatch):
+    """Replace scb_get_table_info with a tool that sleeps, and record peak concurrency"""
+    state = {"running": 0, "peak": 0}
+
+    async def table_info(table_id, language="sv"):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.05)
+        state["running"] -= 1
+        return {"table_id": table_id, "language": language}
+
+    monkeypatch.setitem(scb_tools.TOOL_HANDLERS, "scb_get_table_info", table_info)
+    return state
+
+
+def test_call_tools_runs_concurrently_and_keeps_order(monkeypatch, api_client):
+    state = fake_table_info(monkeypatch)
+    calls = [{"name": "scb_get_table_info", "arguments": {"table_id": f"T{i}"}} for i in range(15)]
+    calls.insert(3, {"name": "scb_get_table_info", "arguments": {}})
+    calls.insert(5, {"name": "no_such_tool", "arguments": {}})
+
+    response = api_client("POST", "/call_tools", json={"calls": calls})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 17
+    assert results[3] == {"success": False, "status": 400, "error": "Missing required argument 'table_id'"}
+    assert results[5]["status"] == 404
+    ok = [r["result"]["table_id"] for r in results if r["success"]]
+    assert ok == [f"T{i}" for i in range(15)]
+    assert state["peak"] == 15
+
+
+def test_call_tools_accepts_bare_array_and_limits_size(monkeypatch, api_client):
+    fake_table_info(monkeypatch)
+    response = api_client("POST", "/call_tools", json=[{"name": "scb_get_table_info", "arguments": {"table_id": "T"}}])
+    assert response.json()["results"][0]["success"]
+
+    too_many = [{"name": "scb_get_table_info", "arguments": {"table_id": "T"}}] * (scb_tools.MAX_BATCH_CALLS + 1)
+    assert api_client("POST", "/call_tools", json={"calls": too_many}).status_code == 400
+    assert api_client("POST", "/call_tools", json={"calls": "nope"}).status_code == 400
+
+
+def test_jsonrpc_batch(monkeypatch, api_client):
+    fake_table_info(monkeypatch)
+    response = api_client("POST", "/jsonrpc", json=[
+        {"jsonrpc": "2.0", "id": 1, "method": "tools/call",
+         "params": {"name": "scb_get_table_info", "arguments": {"table_id": "A"}}},
+        {"jsonrpc": "2.0", "method": "tools/call",
+         "params": {"name": "scb_get_table_info", "arguments": {"table_id": "notification"}}},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "scb_get_table_info", "arguments": {}}},
+        {"jsonrpc": "2.0", "id": 3, "method": "nope"},
+        {"jsonrpc": "2.0", "id": 4, "method": "tools/list"},
+        42,
+    ])
+
+    responses = response.json()
+    assert [r["id"] for r in responses] == [1, 2, 3, 4, None]
+    assert responses[0]["result"] == {"table_id": "A", "language": "sv"}
+    assert responses[1]["error"]["code"] == -32602
+    assert responses[2]["error"]["code"] == -32601
+    assert len(responses[3]["result"]["tools"]) == len(scb_tools.TOOL_DEFINITIONS)
+    assert responses[4]["error"]["code"] == -32600
+
+
+def test_jsonrpc_single_and_edge_cases(api_client):
+    response = api_client("POST", "/jsonrpc", json={"jsonrpc": "2.0", "id": "a", "method": "tools/list"})
+    assert response.json()["id"] == "a"
+    assert api_client("POST", "/jsonrpc", json=[]).json()["error"]["code"] == -32600
+    assert api_client("POST", "/jsonrpc", content=b"{not json").json()["error"]["code"] == -32700
+    assert api_client("POST", "/jsonrpc", json={"jsonrpc": "2.0", "method": "tools/list"}).status_code == 204
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the tiered SCB metadata cache
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from scb_cache import MemoryCache, TieredCache
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    expires_at = time.time() + 60
+    cache.set("a", 1, expires_at)
+    cache.set("b", 2, expires_at)
+    assert cache.get("a") == 1
+    cache.set("c", 3, expires_at)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache()
+    cache.set("a", 1, time.time() - 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    async def run():
+        first = TieredCache(directory=str(tmp_path))
+        await first.set("table:sv:BE/BE0101/BE0101A/BefolkningNy", {"title": "Folkmängd"})
+
+        second = TieredCache(directory=str(tmp_path))
+        value = await second.get("table:sv:BE/BE0101/BE0101A/BefolkningNy")
+        assert value == {"title": "Folkmängd"}
+        assert second.stats()["disk_hits"] == 1
+        assert await second.get("table:en:BE/BE0101/BE0101A/BefolkningNy") is None
+        assert second.stats()["misses"] == 1
+
+    asyncio.run(run())
+
+
+def test_client_serves_repeated_metadata_from_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"title": "Folkmängd", "variables": [{"code": "Tid", "values": ["2023"]}]})
+
+    cache = TieredCache()
+    client = ScbClient(transport=httpx.MockTransport(handler), rate_limiter=RateLimiter(100, 1), cache=cache)
+
+    async def run():
+        for _ in range(5):
+            await client.get_table_metadata("BE/BE0101/BE0101A/BefolkningNy", "sv")
+        await client.get_table_metadata("BE/BE0101/BE0101A/BefolkningNy", "en")
+
+    asyncio.run(run())
+
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for recording and replaying upstream PxWeb traffic
+"""
+
+import asyncio
+
+import httpx
+
+from scb_cache import TieredCache, cache_key
+from scb_cassette import Cassette, read_cassette, warm_cache
+from scb_client import ScbClient
+from scb_mock_pxweb import MockPxWeb
+from scb_rate_limit import RateLimiter
+
+QUERY = {"Region": ["00", "0114"], "ContentsCode": ["BE0101N1"], "Tid": ["2023"]}
+
+
+async def exercise(client):
+    path = await client.find_table("BE0101A9")
+    nodes = await client.list_nodes("BE")
+    data = await client.get_data(path, QUERY)
+    await client.aclose()
+    return path, nodes, data
+
+
+def record(path, **mock_options):
+    mock = MockPxWeb(**mock_options)
+    client = ScbClient(transport=httpx.ASGITransport(app=mock.app), rate_limiter=RateLimiter(1000, 1),
+                       cassette=Cassette(path, "record"))
+    return asyncio.run(exercise(client)), mock
+
+
+def test_replay_reproduces_recorded_session_without_network(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    recorded, _ = record(path)
+    entries = read_cassette(path)
+    assert [(e["method"], e["path"]) for e in entries] == [
+        ("GET", ""), ("GET", "BE"), ("GET", "BE/BE0101/BE0101A9"), ("POST", "BE/BE0101/BE0101A9"),
+    ]
+    assert entries[0]["params"] == {"query": "BE0101A9", "filter": "*"}
+
+    def no_network(request):
+        raise AssertionError("replay must not reach the network")
+
+    cassette = Cassette(path, "replay")
+    client = ScbClient(transport=httpx.MockTransport(no_network), rate_limiter=RateLimiter(1000, 1),
+                       cassette=cassette)
+    assert asyncio.run(exercise(client)) == recorded
+    assert cassette.stats()["replayed"] == 4
+
+    async def unknown():
+        try:
+            await ScbClient(rate_limiter=RateLimiter(1000, 1), cassette=cassette).list_nodes("AM")
+        except httpx.TransportError as e:
+            return str(e)
+
+    assert "No recorded response for GET" in asyncio.run(unknown())
+
+
+def test_repeated_requests_replay_in_recorded_order(tmp_path):
+    path = str(tmp_path / "throttled.jsonl.gz")
+    # Some responses are 429s, so the recording holds retries of the same request
+    (_, _, data), mock = record(path, throttle_rate=0.5, seed=1)
+    assert mock.stats()["throttled"] >= 1
+    statuses = [e["status"] for e in read_cassette(path)]
+    assert 429 in statuses
+
+    client = ScbClient(rate_limiter=RateLimiter(1000, 1), cassette=Cassette(path, "replay"))
+    assert asyncio.run(exercise(client))[2] == data
+
+
+def test_cassette_warms_metadata_cache_and_feeds_the_mock(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    (table_path, nodes, data), _ = record(path)
+
+    cache = TieredCache()
+    assert asyncio.run(warm_cache(cache, path)) == 3
+    assert asyncio.run(cache.get(cache_key("nodes", "sv", "BE"))) == nodes
+    assert asyncio.run(cache.get(cache_key("search", "sv", "be0101a9"))) is not None
+
+    mock = MockPxWeb(fixtures=[path])
+    assert len(mock.fixtures) == 4
+
+
+def test_recorded_bodies_are_raw_text_and_replay_is_not_rate_limited(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    record(path)
+    entries = read_cassette(path)
+    assert all(isinstance(e["text"], str) for e in entries)
+    assert entries[-1]["response"]["data"]
+
+    # Without an explicit limiter, replay runs well past SCB's 10 requests per 10 s
+    client = ScbClient(cassette=Cassette(path, "replay"))
+    assert client.rate_limiter.max_requests > 10
+
+    async def replay_many():
+        for _ in range(30):
+            await client.list_nodes("BE", refresh=True)
+        await client.aclose()
+
+    asyncio.run(asyncio.wait_for(replay_many(), 2))
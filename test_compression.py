@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for negotiated response compression
+"""
+
+import asyncio
+import gzip
+import zlib
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from scb_compression import CompressionMiddleware, choose_encoding
+
+BIG = b'{"data":[' + b",".join(b'{"key":["0180","2023"],"values":["984748"]}' for _ in range(500)) + b"]}"
+
+
+async def big(request):
+    return Response(BIG, media_type="application/json")
+
+
+async def small(request):
+    return Response(b'{"status":"healthy"}', media_type="application/json")
+
+
+async def stream(request):
+    async def lines():
+        for i in range(3):
+            yield b'{"row":%d}\n' % i
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+app = Starlette(
+    routes=[Route("/big", big), Route("/small", small), Route("/stream", stream)],
+    middleware=[Middleware(CompressionMiddleware, min_size=1024, encodings=["gzip"])],
+)
+
+
+def get(path, accept_encoding="gzip"):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = client.build_request("GET", path, headers={"Accept-Encoding": accept_encoding})
+            response = await client.send(request, stream=True)
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            await response.aclose()
+            return response, raw
+
+    return asyncio.run(run())
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+    assert choose_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("gzip;q=0", ["gzip"]) is None
+    assert choose_encoding("", ["gzip"]) is None
+
+
+def test_large_response_is_compressed():
+    response, raw = get("/big")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(raw) < len(BIG) / 10
+    assert gzip.decompress(raw) == BIG
+
+
+def test_small_response_and_identity_are_not_compressed():
+    response, raw = get("/small")
+    assert "content-encoding" not in response.headers
+    response, raw = get("/big", accept_encoding="identity")
+    assert "content-encoding" not in response.headers
+    assert raw == BIG
+
+
+def test_streamed_chunks_are_flushed():
+    response, raw = get("/stream")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    # Each chunk is sync-flushed, so the first row decodes before the stream ends
+    partial = zlib.decompressobj(31).decompress(raw[:len(raw) - 8])
+    assert partial.startswith(b'{"row":0}\n')
+    assert gzip.decompress(raw) == b'{"row":0}\n{"row":1}\n{"row":2}\n'
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar and json-stat2 result formats of scb_fetch_data
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import scb_tools
+from scb_format import format_response, parse_value, to_columnar, to_json_stat2
+
+VARIABLES = [
+    {"code": "Region", "text": "region", "values": ["00", "01"], "valueTexts": ["Riket", "Stockholms län"]},
+    {"code": "ContentsCode", "text": "tabellinnehåll", "values": ["BE0101N1", "BE0101N2"],
+     "valueTexts": ["Folkmängd", "Folkökning"]},
+    {"code": "Tid", "text": "år", "values": ["2022", "2023"], "valueTexts": ["2022", "2023"]},
+]
+
+RESPONSE = {
+    "columns": [
+        {"code": "Region", "text": "region", "type": "d"},
+        {"code": "Tid", "text": "år", "type": "t"},
+        {"code": "BE0101N1", "text": "Folkmängd", "type": "c"},
+        {"code": "BE0101N2", "text": "Folkökning", "type": "c"},
+    ],
+    "comments": [],
+    "data": [
+        {"key": ["01", "2023"], "values": ["2454821", ".."]},
+        {"key": ["00", "2022"], "values": ["10521556", "69040"]},
+        {"key": ["00", "2023"], "values": ["10551707", "30151"]},
+        {"key": ["01", "2022"], "values": ["2433285", "18206"]},
+    ],
+}
+
+
+def test_parse_value():
+    assert parse_value("42") == 42
+    assert parse_value("1.5") == 1.5
+    assert parse_value("..") is None
+
+
+def test_columnar_dictionary_encodes_keys():
+    result = to_columnar(RESPONSE, VARIABLES)
+
+    region, tid = result["dimensions"]
+    assert region["values"] == ["00", "01"]
+    assert region["labels"] == ["Riket", "Stockholms län"]
+    assert tid["values"] == ["2022", "2023"]
+    assert result["keys"] == {"Region": [1, 0, 0, 1], "Tid": [1, 0, 1, 0]}
+    assert result["values"]["BE0101N1"] == [2454821, 10521556, 10551707, 2433285]
+    assert result["values"]["BE0101N2"] == [None, 69040, 30151, 18206]
+    assert result["status"] == {"BE0101N2": {"0": ".."}}
+
+
+def test_json_stat2_is_row_major_with_measures_last():
+    dataset = to_json_stat2(RESPONSE, VARIABLES, "Folkmängd")
+
+    assert dataset["id"] == ["Region", "Tid", "ContentsCode"]
+    assert dataset["size"] == [2, 2, 2]
+    assert dataset["value"] == [10521556, 69040, 10551707, 30151, 2433285, 18206, 2454821, None]
+    assert dataset["status"] == {"7": ".."}
+    assert dataset["role"] == {"time": ["Tid"], "metric": ["ContentsCode"]}
+    assert dataset["dimension"]["Region"]["category"]["label"]["01"] == "Stockholms län"
+
+
+def test_columnar_is_smaller_than_rows():
+    rows = {**RESPONSE, "data": RESPONSE["data"] * 200}
+    assert len(json.dumps(to_columnar(rows, VARIABLES))) < len(json.dumps(rows)) / 2
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        format_response(RESPONSE, "csv")
+    with pytest.raises(scb_tools.ToolError):
+        scb_tools.prepare_arguments("scb_fetch_data", {"table_id": "T", "query": {}, "format": "csv"})
+
+
+def test_fetch_data_with_format(mock_scb):
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(200, json=RESPONSE)
+        return httpx.Response(200, json={"title": "Folkmängd", "variables": VARIABLES})
+
+    mock_scb(pxweb)
+    result = asyncio.run(scb_tools.call_tool("scb_fetch_data", {
+        "table_id": "BE/BE0101/TEST", "query": {"Region": ["*"], "ContentsCode": ["*"], "Tid": ["*"]},
+        "format": "json-stat2",
+    }))
+
+    assert result["format"] == "json-stat2"
+    assert result["data"]["class"] == "dataset"
+    assert result["data"]["label"] == "Folkmängd"
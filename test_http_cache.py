@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for ETag / If-None-Match and Cache-Control on the HTTP server
+"""
+
+import json
+
+import scb_tools
+from scb_http_cache import etag_matches, strong_etag
+
+
+def test_etag_matching():
+    etag = strong_etag(b"{}")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_tools_revalidates_with_304(api_client):
+    response = api_client("GET", "/tools", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, no-cache"
+    etag = response.headers["etag"]
+    assert etag == strong_etag(response.content)
+
+    response = api_client("GET", "/tools", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_compressed_tools_response_has_weak_etag_that_still_matches(api_client):
+    response = api_client("GET", "/tools", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].startswith('W/"')
+
+    response = api_client("GET", "/tools", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+
+def test_tool_calls_are_conditional(monkeypatch, api_client):
+    async def table_info(table_id, language="sv"):
+        if table_id == "missing":
+            return {"error": "Table 'missing' not found", "table_id": table_id, "language": language}
+        return {"table_id": table_id, "language": language, "title": "Folkmängd"}
+
+    monkeypatch.setitem(scb_tools.TOOL_HANDLERS, "scb_get_table_info", table_info)
+    monkeypatch.setenv("SCB_HTTP_CACHE_MAX_AGE", "120")
+
+    call = {"name": "scb_get_table_info", "arguments": {"table_id": "BE0101N1"}}
+    response = api_client("POST", "/call_tool", json=call)
+    assert response.json()["result"]["title"] == "Folkmängd"
+    assert response.headers["cache-control"] == "public, max-age=120"
+    etag = response.headers["etag"]
+
+    assert api_client("POST", "/call_tool", json=call, headers={"If-None-Match": etag}).status_code == 304
+
+    # The GET form returns the same representation, so the ETag carries over
+    arguments = json.dumps(call["arguments"])
+    response = api_client("GET", "/call_tool/scb_get_table_info", params={"arguments": arguments},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = api_client("POST", "/call_tool", json={"name": "scb_get_table_info", "arguments": {"table_id": "missing"}})
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_get_call_requires_json_object_arguments(api_client):
+    response = api_client("GET", "/call_tool/scb_get_table_info", params={"arguments": "[1]"})
+    assert response.status_code == 400
+    response = api_client("GET", "/call_tool/no_such_tool")
+    assert response.status_code == 404
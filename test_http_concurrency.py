@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Load test for SCB MCP HTTP Server
+Fires concurrent /call_tool requests against the app in-process, with a slow stand-in
+for the SCB client, and checks that throughput scales with concurrency and that
+concurrent fetches never see each other's tables
+"""
+
+import asyncio
+import random
+import time
+
+import httpx
+
+import scb_mcp_server_http
+import scb_tools
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+
+# Simulated SCB round trip in seconds
+UPSTREAM_LATENCY = 0.2
+
+
+class SlowClient:
+    """Stand-in for ScbClient that waits like a real network call"""
+
+    async def list_nodes(self, path="", language="sv"):
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        return [{"id": "BE", "text": "Befolkning", "type": "l"}]
+
+
+async def fake_pxweb(request: httpx.Request) -> httpx.Response:
+    """Stand-in for the PxWeb API that answers per table path after a random delay"""
+    await asyncio.sleep(random.uniform(0, 0.02))
+    if request.method == "POST":
+        table_id = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"data": [{"key": ["2023"], "values": [table_id]}]})
+    if "query" in request.url.params:
+        table_id = request.url.params["query"]
+        return httpx.Response(200, json=[{"id": table_id, "path": "/XX", "title": table_id}])
+    if request.url.path.endswith("/ssd/"):
+        return httpx.Response(200, json=[{"id": "XX", "text": "Folder", "type": "l"}])
+    return httpx.Response(200, json={"title": str(request.url), "variables": [{"code": "Tid", "values": ["2023"]}]})
+
+
+async def measure_throughput(concurrency: int, requests_per_worker: int = 2) -> float:
+    """Return completed /call_tool requests per second at the given concurrency"""
+    transport = httpx.ASGITransport(app=scb_mcp_server_http.api)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def worker(n):
+            for i in range(requests_per_worker):
+                # Distinct paths, so identical-call coalescing doesn't flatter the numbers
+                payload = {"name": "scb_browse_metadata", "arguments": {"path": f"BE/{n}/{i}", "language": "sv"}}
+                response = await client.post("/call_tool", json=payload)
+                assert response.status_code == 200
+                assert response.json()["result"]["items"][0]["id"] == "BE"
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return concurrency * requests_per_worker / elapsed
+
+
+def run_load_test(levels=(1, 2, 4, 8)) -> dict:
+    """Measure throughput for each concurrency level; scb_tools.scb_client must be a SlowClient"""
+    return {level: asyncio.run(measure_throughput(level)) for level in levels}
+
+
+def test_throughput_scales_with_concurrency(monkeypatch):
+    monkeypatch.setattr(scb_tools, "scb_client", SlowClient())
+    results = run_load_test(levels=(1, 8))
+    # Eight concurrent clients should be far faster than one when calls don't block the event loop
+    assert results[8] > results[1] * 4
+
+
+def test_concurrent_fetches_do_not_mix_tables(mock_scb):
+    mock_scb(fake_pxweb)
+    table_ids = [f"TAB{i}" for i in range(20)]
+
+    async def fetch_all():
+        return await asyncio.gather(*(
+            scb_tools.fetch_data(table_id, {"Tid": ["*"]}) for table_id in table_ids
+        ))
+
+    results = asyncio.run(fetch_all())
+
+    for table_id, result in zip(table_ids, results):
+        assert result["data"]["data"][0]["values"] == [table_id]
+
+
+def test_client_reuses_pooled_connection():
+    client = ScbClient(transport=httpx.MockTransport(fake_pxweb), rate_limiter=RateLimiter(1000, 1))
+
+    async def run():
+        first = client._http()
+        await client.list_nodes("", "sv")
+        await client.get_table_metadata("XX/TAB1", "en")
+        assert client._http() is first
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_find_table_requires_an_exact_id_match():
+    def search(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=[{"id": "BE0101N1", "path": "/BE/BE0101", "title": "Folkmängd"},
+                                         {"id": "BE0101N2", "path": "/BE/BE0101", "title": "Folkökning"}])
+
+    client = ScbClient(transport=httpx.MockTransport(search), rate_limiter=RateLimiter(1000, 1))
+
+    async def run():
+        found = await client.find_table("be0101n2")
+        try:
+            await client.find_table("BE0101N9")
+        except ValueError as e:
+            return found, str(e)
+
+    assert asyncio.run(run()) == ("BE/BE0101/BE0101N2", "Table 'BE0101N9' not found")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("SCB MCP HTTP Server - Concurrency Load Test")
+    print(f"Simulated upstream latency: {UPSTREAM_LATENCY * 1000:.0f} ms")
+    print("=" * 60)
+
+    scb_tools.scb_client = SlowClient()
+    for level, throughput in run_load_test().items():
+        print(f"  concurrency {level:>3}: {throughput:6.1f} req/s")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for joining tables on shared dimensions (scb_join_tables)
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import scb_tools
+from scb_join import join_responses, shared_dimensions
+
+POPULATION = {
+    "columns": [
+        {"code": "Region", "type": "d"}, {"code": "Kon", "type": "d"}, {"code": "Tid", "type": "t"},
+        {"code": "BE0101N1", "text": "Folkmängd", "type": "c"},
+    ],
+    "data": [
+        {"key": ["01", "1", "2023"], "values": ["1200"]},
+        {"key": ["01", "2", "2023"], "values": ["1250"]},
+        {"key": ["03", "1", "2023"], "values": ["200"]},
+        {"key": ["03", "2", "2023"], "values": ["210"]},
+        {"key": ["05", "1", "2023"], "values": ["230"]},
+    ],
+}
+
+EMPLOYMENT = {
+    "columns": [
+        {"code": "Region", "type": "d"}, {"code": "Tid", "type": "t"},
+        {"code": "AM0207", "text": "Sysselsatta", "type": "c"},
+    ],
+    "data": [
+        {"key": ["03", "2023"], "values": ["190"]},
+        {"key": ["01", "2023"], "values": ["1300"]},
+        {"key": ["04", "2023"], "values": [".."]},
+    ],
+}
+
+TABLES = [
+    {"table_id": "BE0101N1", "response": POPULATION,
+     "variables": [{"code": "Region", "values": ["01", "03"], "valueTexts": ["Stockholms län", "Uppsala län"]}]},
+    {"table_id": "AM0207", "response": EMPLOYMENT},
+]
+
+
+def test_shared_dimensions():
+    assert shared_dimensions([POPULATION, EMPLOYMENT]) == ["Region", "Tid"]
+
+
+def test_inner_join_pivots_unshared_dimensions():
+    joined = join_responses(TABLES)
+
+    assert joined["on"] == ["Region", "Tid"]
+    assert joined["keys"] == {"Region": ["01", "03"], "Tid": ["2023", "2023"]}
+    assert joined["labels"]["Region"] == {"01": "Stockholms län", "03": "Uppsala län"}
+    assert [c["name"] for c in joined["columns"]] == [
+        "BE0101N1.BE0101N1[Kon=1]", "BE0101N1.BE0101N1[Kon=2]", "AM0207.AM0207",
+    ]
+    assert joined["values"]["BE0101N1.BE0101N1[Kon=2]"] == [1250, 210]
+    assert joined["values"]["AM0207.AM0207"] == [1300, 190]
+
+
+def test_outer_join_keeps_all_rows():
+    joined = join_responses(TABLES, how="outer")
+    assert joined["keys"]["Region"] == ["01", "03", "05", "04"]
+    assert joined["values"]["AM0207.AM0207"] == [1300, 190, None, None]
+    assert joined["values"]["BE0101N1.BE0101N1[Kon=2]"] == [1250, 210, None, None]
+
+
+def test_join_on_missing_dimension_fails():
+    with pytest.raises(ValueError):
+        join_responses(TABLES, on=["Kon"])
+
+
+def test_join_tables_tool_fetches_concurrently(mock_scb):
+    responses = {"BE/BE0101/BE0101N1": POPULATION, "AM/AM0207/AM0207": EMPLOYMENT}
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        path = request.url.path.split("/ssd/")[1]
+        response = responses[path]
+        if request.method == "POST":
+            return httpx.Response(200, json=response)
+        variables = [{"code": col["code"], "values": sorted({row["key"][i] for row in response["data"]})}
+                     for i, col in enumerate(c for c in response["columns"] if c["type"] != "c")]
+        return httpx.Response(200, json={"title": path, "variables": variables})
+
+    mock_scb(pxweb)
+    result = asyncio.run(scb_tools.call_tool("scb_join_tables", {"tables": [
+        {"table_id": "BE/BE0101/BE0101N1", "query": {"Region": ["*"], "Kon": ["*"], "Tid": ["2023"]}},
+        {"table_id": "AM/AM0207/AM0207", "query": {"Region": ["*"], "Tid": ["2023"]}},
+    ]}))
+    error = asyncio.run(scb_tools.call_tool("scb_join_tables", {"tables": [
+        {"table_id": "BE/BE0101/BE0101N1", "query": {}},
+    ]}))
+
+    assert result["rows"] == 2
+    assert [t["table_id"] for t in result["tables"]] == ["BE/BE0101/BE0101N1", "AM/AM0207/AM0207"]
+    assert "2-5 tables" in error["error"]
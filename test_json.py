@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the response encoders
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import scb_json
+import scb_tools
+from scb_json import JsonEncoder, make_encoder, orjson_available, wrap_result
+
+PAYLOAD = {"table_id": "BE0101N1", "data": [{"key": ["00", "2023"], "values": ["10551707"]}], "text": "Folkmängd"}
+
+
+def test_compact_encoding_has_no_whitespace():
+    encoded = JsonEncoder().dumps(PAYLOAD)
+    assert b" " not in encoded.replace("Folkmängd".encode(), b"")
+    assert "Folkmängd".encode("utf-8") in encoded
+    assert json.loads(encoded) == PAYLOAD
+
+
+def test_indent_is_optional():
+    assert b"\n  " in JsonEncoder(indent=2).dumps(PAYLOAD)
+
+
+@pytest.mark.skipif(not orjson_available(), reason="orjson not installed")
+def test_orjson_matches_standard_encoder():
+    encoder = make_encoder("auto")
+    assert encoder.name == "orjson"
+    assert encoder.dumps(PAYLOAD) == JsonEncoder().dumps(PAYLOAD)
+    # Values orjson cannot encode fall back to the standard library
+    assert json.loads(encoder.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+
+
+def test_unknown_encoder_is_rejected():
+    with pytest.raises(ValueError):
+        make_encoder("ujson")
+
+
+def test_wrap_result_splices_encoded_result():
+    encoded = scb_json.dumps(PAYLOAD)
+    assert json.loads(wrap_result(encoded)) == {"success": True, "result": PAYLOAD}
+
+
+def test_coalesced_calls_share_encoded_bytes(monkeypatch):
+    calls = []
+
+    async def slow_tool(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        return PAYLOAD
+
+    monkeypatch.setitem(scb_tools.TOOL_HANDLERS, "scb_get_table_info", slow_tool)
+
+    async def run():
+        return await asyncio.gather(*(
+            scb_tools.call_tool_encoded("scb_get_table_info", {"table_id": "BE0101N1"}) for _ in range(5)
+        ))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(encoded is results[0][1] for _, encoded in results)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus /metrics endpoint and per-phase tool timing
+"""
+
+import asyncio
+
+import httpx
+
+import scb_metrics
+import scb_tools
+from scb_rate_limit import RateLimiter
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = scb_metrics.Histogram("h_seconds", "Help", ("tool",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5.0, "a")
+    assert histogram.render().splitlines()[2:] == [
+        'h_seconds_bucket{tool="a",le="0.1"} 1',
+        'h_seconds_bucket{tool="a",le="1"} 2',
+        'h_seconds_bucket{tool="a",le="+Inf"} 3',
+        'h_seconds_sum{tool="a"} 5.55',
+        'h_seconds_count{tool="a"} 3',
+    ]
+
+
+def test_tool_call_splits_upstream_time_and_counts_statuses(api_client, mock_scb):
+    scb_metrics.registry.clear()
+    statuses = iter([429, 200])
+
+    async def pxweb(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        return httpx.Response(next(statuses), json={"title": "T", "variables": []}, headers={"Retry-After": "0"})
+
+    mock_scb(pxweb)
+    response = api_client("POST", "/call_tool", json={"name": "scb_get_table_metadata",
+                                                      "arguments": {"table_id": "BE/BE0101/T"}})
+    assert response.status_code == 200
+
+    tool = "scb_get_table_metadata"
+    assert scb_metrics.tool_calls.value(tool, "ok") == 1
+    assert scb_metrics.upstream_requests.value("GET", "429") == 1
+    assert scb_metrics.upstream_requests.value("GET", "200") == 1
+    assert scb_metrics.tool_in_flight.value(tool) == 0
+    assert scb_metrics.tool_response_bytes.count(tool) == 1
+    for phase in ("total", "upstream", "rate_limit", "serialization", "local"):
+        assert scb_metrics.tool_duration.count(tool, phase) == 1
+    upstream = scb_metrics.tool_duration._values[(tool, "upstream")][1]
+    total = scb_metrics.tool_duration._values[(tool, "total")][1]
+    assert 0.1 <= upstream <= total
+
+    text = api_client("GET", "/metrics").text
+    assert 'scb_tool_calls_total{tool="scb_get_table_metadata",status="ok"} 1' in text
+    assert 'scb_upstream_requests_total{method="GET",status="429"} 1' in text
+    assert "# TYPE scb_tool_duration_seconds histogram" in text
+
+
+def test_failed_tool_call_is_counted_as_error(monkeypatch):
+    scb_metrics.registry.clear()
+
+    async def failing(table_id, language="sv"):
+        return {"error": "boom", "table_id": table_id}
+
+    monkeypatch.setitem(scb_tools.TOOL_HANDLERS, "scb_get_table_info", failing)
+    asyncio.run(scb_tools.call_tool("scb_get_table_info", {"table_id": "X"}))
+    assert scb_metrics.tool_calls.value("scb_get_table_info", "error") == 1
+
+
+def test_rate_limit_waits_of_concurrent_sub_queries_are_not_summed(monkeypatch, mock_scb):
+    scb_metrics.registry.clear()
+    monkeypatch.setenv("SCB_MAX_CELLS", "1")
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(200, json={"columns": [], "comments": [], "data": []})
+        return httpx.Response(200, json={"title": "T", "variables": [
+            {"code": "Tid", "values": ["2020", "2021", "2022", "2023"]}]})
+
+    # Two requests per 0.1 s: the four sub-queries queue behind each other in the limiter
+    mock_scb(pxweb, rate_limiter=RateLimiter(2, 0.1))
+    asyncio.run(scb_tools.call_tool("scb_fetch_data", {"table_id": "BE/M", "query": {"Tid": ["*"]}}))
+
+    tool = "scb_fetch_data"
+    rate_limit = scb_metrics.tool_duration._values[(tool, "rate_limit")][1]
+    total = scb_metrics.tool_duration._values[(tool, "total")][1]
+    assert 0.1 <= rate_limit <= total
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the PxWeb stand-in and the offline server benchmark
+"""
+
+import asyncio
+import json
+
+import httpx
+
+from benchmark_servers import regressions, run_benchmark
+from scb_client import ScbClient
+from scb_cassette import request_key
+from scb_mock_pxweb import MockPxWeb
+from scb_rate_limit import RateLimiter
+
+
+def make_client(mock):
+    return ScbClient(transport=httpx.ASGITransport(app=mock.app), rate_limiter=RateLimiter(1000, 1))
+
+
+def test_mock_serves_demo_tree_and_generated_data():
+    async def run():
+        client = make_client(MockPxWeb())
+        path = await client.find_table("BE0101N1")
+        nodes = await client.list_nodes("BE/BE0101")
+        metadata = await client.get_table_metadata(path)
+        first = await client.get_data(path, {"Region": ["00", "01"], "Tid": ["2023"]})
+        second = await client.get_data("BE/BE0101/BE0101A9", {"Region": ["00"], "ContentsCode": ["*"],
+                                                              "Tid": ["2022", "2023"]})
+        return path, nodes, metadata, first, second
+
+    path, nodes, metadata, first, second = asyncio.run(run())
+    assert path == "BE/BE0101/BE0101N1"
+    assert {node["id"] for node in nodes} == {"BE0101N1", "BE0101A9"}
+    assert [var["code"] for var in metadata["variables"]] == ["Region", "Alder", "Kon", "Tid"]
+    assert [row["key"] for row in first["data"]] == [["00", "2023"], ["01", "2023"]]
+    assert [col["type"] for col in second["columns"]] == ["d", "t", "c", "c"]
+    assert len(second["data"]) == 2 and all(len(row["values"]) == 2 for row in second["data"])
+
+
+def test_mock_replays_fixtures_and_injects_throttling(tmp_path):
+    fixtures = tmp_path / "fixtures.jsonl"
+    fixtures.write_text(json.dumps({"method": "GET", "language": "sv", "path": "AM", "params": {},
+                                    "status": 200, "response": [{"id": "AM0101", "type": "l", "text": "x"}]}) + "\n")
+    mock = MockPxWeb(fixtures=[str(fixtures)], throttle_rate=0.5, seed=3)
+    assert request_key("get", "sv", "/AM/", {}, None) in mock.fixtures
+
+    nodes = asyncio.run(make_client(mock).list_nodes("AM"))
+    assert nodes == [{"id": "AM0101", "type": "l", "text": "x"}]
+    assert mock.stats()["throttled"] >= 1
+    assert mock.stats()["requests"] == mock.stats()["throttled"] + 1
+
+
+def test_benchmark_reports_latency_percentiles_and_flags_regressions():
+    results = asyncio.run(run_benchmark(["http", "stdio"], ["scb_fetch_data"], [1, 4], requests=8))
+    assert [(r["server"], r["concurrency"]) for r in results] == [("http", 1), ("http", 4), ("stdio", 1), ("stdio", 4)]
+    for result in results:
+        assert result["requests"] == 8 and result["errors"] == 0
+        assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["throughput"] > 0
+
+    baseline = [dict(r, p95_ms=r["p95_ms"] / 2) for r in results]
+    assert len(regressions(results, baseline, 0.25)) == 4
+    assert regressions(results, results, 0.25) == []
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for PxWeb query expansion, cell-limit splitting and response merging
+"""
+
+import asyncio
+import itertools
+import json
+
+import httpx
+import pytest
+
+from scb_client import ScbClient
+from scb_query import TableSchema, count_cells, merge_responses, plan_selection, split_query
+from scb_rate_limit import RateLimiter
+
+VARIABLES = [
+    {"code": "Region", "values": [f"{i:04d}" for i in range(290)], "elimination": True},
+    {"code": "Alder", "values": [str(i) for i in range(101)], "elimination": True},
+    {"code": "Kon", "values": ["1", "2"], "elimination": True},
+    {"code": "Tid", "values": [str(year) for year in range(1968, 2024)], "elimination": True},
+]
+SCHEMA = TableSchema({"title": "T", "variables": VARIABLES})
+
+
+def cells_of(parts):
+    for part in parts:
+        yield from itertools.product(*part.values())
+
+
+def test_split_query_covers_every_cell_once():
+    selection = SCHEMA.expand({"Region": ["*"], "Alder": ["*"], "Kon": ["*"], "Tid": ["2020", "2021", "2022"]})
+    parts = split_query(selection, 10_000)
+
+    assert all(count_cells(part) <= 10_000 for part in parts)
+    all_cells = list(cells_of(parts))
+    assert len(all_cells) == len(set(all_cells)) == count_cells(selection)
+
+
+def test_split_query_recurses_when_one_value_is_too_big():
+    selection = SCHEMA.expand({"Region": ["*"], "Alder": ["*"]})
+    parts = split_query(selection, 50)
+
+    assert all(count_cells(part) <= 50 for part in parts)
+    assert sum(count_cells(part) for part in parts) == count_cells(selection)
+
+
+def test_plan_selection_refuses_too_many_chunks():
+    with pytest.raises(ValueError, match="narrow the selection"):
+        plan_selection(SCHEMA.expand({"Region": ["*"], "Alder": ["*"], "Tid": ["*"]}), max_cells=1000, max_chunks=10)
+
+
+def test_merge_responses_concatenates_data():
+    merged = merge_responses([
+        {"columns": ["c"], "comments": [{"x": 1}], "data": [{"key": ["a"], "values": ["1"]}]},
+        {"columns": ["c"], "comments": [{"x": 1}], "data": [{"key": ["b"], "values": ["2"]}]},
+    ])
+    assert merged == {
+        "columns": ["c"],
+        "comments": [{"x": 1}],
+        "data": [{"key": ["a"], "values": ["1"]}, {"key": ["b"], "values": ["2"]}],
+    }
+
+
+def test_client_splits_large_fetch_and_merges_result(monkeypatch):
+    monkeypatch.setenv("SCB_MAX_CELLS", "100")
+    posts = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        posts.append(body)
+        selection = [q["selection"]["values"] for q in body["query"]]
+        return httpx.Response(200, json={
+            "columns": [{"code": q["code"]} for q in body["query"]],
+            "comments": [],
+            "data": [{"key": list(key), "values": ["1"]} for key in itertools.product(*selection)],
+        })
+
+    client = ScbClient(transport=httpx.MockTransport(handler), rate_limiter=RateLimiter(1000, 1))
+    query = {"Region": ["*"], "Tid": ["2022", "2023"]}
+    result = asyncio.run(client.get_data("BE/BE0101/BE0101A/BefolkningNy", query, "sv", variables=VARIABLES))
+
+    assert len(posts) == 6
+    assert len(result["data"]) == 580
+    assert len({tuple(row["key"]) for row in result["data"]}) == 580
+
+
+def test_table_schema_rejects_unknown_values_and_counts_without_expanding():
+    schema = TableSchema({"title": "T", "variables": VARIABLES[:3] + [{**VARIABLES[3], "elimination": False}]})
+    assert schema.count_cells({"Region": ["*"], "Alder": ["*"], "Tid": "2023"}) == 290 * 101
+    assert schema.expand({"Tid": "2023", "Kon": ["*"]}) == {"Kon": ["1", "2"], "Tid": ["2023"]}
+    assert schema.expand({"Kon": ["1"]}, partial=True) == {"Kon": ["1"]}
+
+    for query, message in [({"Year": ["2023"]}, "Unknown variable 'Year'"),
+                           ({"Tid": ["1900"]}, "Unknown value '1900' for variable 'Tid'"),
+                           ({"Kon": ["1"]}, "Variable 'Tid' must be selected")]:
+        with pytest.raises(ValueError, match=message):
+            schema.expand(query)
+
+
+def test_invalid_query_fails_before_any_data_request():
+    requests = []
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        requests.append(request.method)
+        return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+    async def run():
+        client = ScbClient(transport=httpx.MockTransport(pxweb), rate_limiter=RateLimiter(1000, 1))
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Unknown value '3'"):
+                await client.get_data("BE/T", {"Kon": ["3"]})
+        return client
+
+    client = asyncio.run(run())
+    # One metadata request compiles the schema; the second query is rejected from the index
+    assert requests == ["GET"]
+    assert client.schema_stats()["hits"] == 1
+
+
+def contents_handler(posts):
+    """PxWeb stand-in that returns ContentsCode values as value columns, like SCB does"""
+    def handler(request):
+        body = json.loads(request.content)
+        posts.append(body)
+        selection = {q["code"]: q["selection"]["values"] for q in body["query"]}
+        measures = selection.pop("ContentsCode")
+        return httpx.Response(200, json={
+            "columns": [{"code": code, "type": "t" if code == "Tid" else "d"} for code in selection]
+                       + [{"code": code, "type": "c"} for code in measures],
+            "comments": [],
+            "data": [{"key": list(key), "values": [f"{'-'.join(key)}:{code}" for code in measures]}
+                     for key in itertools.product(*selection.values())],
+        })
+    return handler
+
+
+CONTENTS_VARIABLES = [
+    {"code": "Region", "values": ["00", "01", "03"]},
+    {"code": "ContentsCode", "values": [f"M{i}" for i in range(6)]},
+    {"code": "Tid", "values": ["2023"]},
+]
+
+
+def test_split_query_keeps_contents_variable_whole_when_it_is_largest():
+    selection = {"Region": ["00", "01", "03"], "ContentsCode": [f"M{i}" for i in range(6)], "Tid": ["2023"]}
+    parts = split_query(selection, 6)
+    assert [part["Region"] for part in parts] == [["00"], ["01"], ["03"]]
+    assert all(len(part["ContentsCode"]) == 6 for part in parts)
+
+
+def test_client_merges_parts_split_on_contents_by_row_key(monkeypatch):
+    # One region is already 6 cells, so the contents variable itself has to be split
+    monkeypatch.setenv("SCB_MAX_CELLS", "4")
+    posts = []
+    client = ScbClient(transport=httpx.MockTransport(contents_handler(posts)), rate_limiter=RateLimiter(1000, 1))
+    query = {"Region": ["00", "01"], "ContentsCode": ["*"], "Tid": ["2023"]}
+    result = asyncio.run(client.get_data("BE/T", query, "sv", variables=CONTENTS_VARIABLES))
+
+    assert len(posts) == 4
+    assert [col["code"] for col in result["columns"]] == ["Region", "Tid"] + [f"M{i}" for i in range(6)]
+    assert [row["key"] for row in result["data"]] == [["00", "2023"], ["01", "2023"]]
+    assert result["data"][1]["values"] == [f"01-2023:M{i}" for i in range(6)]
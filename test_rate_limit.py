@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the upstream SCB rate limiter and 429/503 retry handling
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter, retry_delay
+
+
+def test_limiter_keeps_sliding_window_under_quota():
+    limiter = RateLimiter(max_requests=3, period=0.3)
+    stamps = []
+
+    async def run():
+        async def call():
+            await limiter.acquire()
+            stamps.append(time.monotonic())
+        await asyncio.gather(*(call() for _ in range(9)))
+
+    asyncio.run(run())
+
+    assert len(stamps) == 9
+    for i in range(len(stamps) - 3):
+        # Any 4 consecutive requests must span at least one full period
+        assert stamps[i + 3] - stamps[i] >= 0.3 - 0.01
+    assert limiter.stats()["requests"] == 9
+    assert limiter.stats()["queue_depth"] == 0
+    assert limiter.stats()["max_wait_seconds"] > 0
+
+
+def test_limiter_serves_waiters_in_arrival_order():
+    limiter = RateLimiter(max_requests=1, period=0.05)
+    order = []
+
+    async def run():
+        async def call(i):
+            await limiter.acquire()
+            order.append(i)
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(call(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_retry_delay_honours_retry_after():
+    assert retry_delay(httpx.Response(429, headers={"Retry-After": "7"}), 0) == 7.0
+    assert 1.0 <= retry_delay(httpx.Response(503), 0) <= 1.5
+    assert 4.0 <= retry_delay(httpx.Response(503), 2) <= 6.0
+
+
+def test_client_retries_after_429():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.05"})
+        return httpx.Response(200, json=[{"id": "BE", "text": "Befolkning", "type": "l"}])
+
+    limiter = RateLimiter(100, 1)
+    client = ScbClient(transport=httpx.MockTransport(handler), rate_limiter=limiter)
+    nodes = asyncio.run(client.list_nodes(""))
+
+    assert nodes[0]["id"] == "BE"
+    assert len(calls) == 2
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_client_gives_up_after_max_retries():
+    client = ScbClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(429, headers={"Retry-After": "0"})),
+        rate_limiter=RateLimiter(100, 1),
+        max_retries=2,
+    )
+    try:
+        asyncio.run(client.list_nodes(""))
+    except httpx.HTTPStatusError as e:
+        assert e.response.status_code == 429
+    else:
+        raise AssertionError("Expected HTTPStatusError")
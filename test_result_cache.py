@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent scb_fetch_data result cache
+"""
+
+import asyncio
+import json
+import os
+
+import httpx
+
+import scb_result_cache
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+from scb_result_cache import ResultCache, result_key
+
+VARIABLES = [
+    {"code": "Region", "values": ["00", "01"]},
+    {"code": "Tid", "values": ["2022", "2023"]},
+]
+
+
+def make_client(tmp_path, posts):
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            posts.append(json.loads(request.content))
+            return httpx.Response(200, json={"columns": [], "comments": [], "data": [{"key": ["00"], "values": ["1"]}]})
+        return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+    return ScbClient(
+        transport=httpx.MockTransport(pxweb),
+        rate_limiter=RateLimiter(1000, 1),
+        result_cache=ResultCache(str(tmp_path)),
+    )
+
+
+def test_result_key_is_canonical():
+    assert result_key("BE/T", "sv", {"Tid": ["2023"], "Region": ["00"]}) == \
+        result_key("BE/T", "sv", {"Region": ["00"], "Tid": ["2023"]})
+
+
+def test_repeated_and_equivalent_queries_hit_the_cache(tmp_path):
+    posts = []
+
+    async def run():
+        client = make_client(tmp_path, posts)
+        first = await client.get_data("BE/T", {"Region": ["*"], "Tid": ["2023"]}, updated="2024-01-01")
+        # '*' expands to the same selection as the explicit list
+        second = await client.get_data("BE/T", {"Tid": "2023", "Region": ["00", "01"]}, updated="2024-01-01")
+        return client, first, second
+
+    client, first, second = asyncio.run(run())
+    assert first == second
+    assert len(posts) == 1
+    assert client.result_cache.stats()["hits"] == 1
+
+
+def test_cache_survives_restart_and_is_invalidated_by_updated(tmp_path):
+    posts = []
+    query = {"Region": ["00"], "Tid": ["2023"]}
+
+    asyncio.run(make_client(tmp_path, posts).get_data("BE/T", query, updated="2024-01-01"))
+    asyncio.run(make_client(tmp_path, posts).get_data("BE/T", query, updated="2024-01-01"))
+    assert len(posts) == 1
+
+    client = make_client(tmp_path, posts)
+    asyncio.run(client.get_data("BE/T", query, updated="2024-02-01"))
+    assert len(posts) == 2
+    assert client.result_cache.stats()["stale"] == 1
+
+
+def test_unknown_updated_uses_ttl(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=0)
+    asyncio.run(cache.set("k", {"data": []}))
+    assert asyncio.run(cache.get("k")) is None
+
+    cache = ResultCache(str(tmp_path), ttl=60)
+    asyncio.run(cache.set("k", {"data": []}))
+    assert asyncio.run(cache.get("k")) == {"data": []}
+
+
+def test_size_based_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1500)
+    # Random hex barely compresses, so a few entries exceed the budget
+    value = {"data": os.urandom(300).hex()}
+
+    async def run():
+        for i in range(5):
+            await cache.set(f"k{i}", {**value, "i": i}, "u")
+            # Touch the first entry so it stays most recently used
+            await cache.get("k0", "u")
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["bytes"] <= 1500
+    assert stats["evictions"] > 0
+    assert asyncio.run(cache.get("k0", "u")) is not None
+    assert asyncio.run(cache.get("k1", "u")) is None
+
+
+def test_entries_are_read_outside_the_lock(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    asyncio.run(cache.set("k", {"data": [1]}))
+    held = []
+    real_open = scb_result_cache.gzip.open
+
+    def checking_open(*args, **kwargs):
+        held.append(cache._lock.locked())
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(scb_result_cache.gzip, "open", checking_open)
+    assert asyncio.run(cache.get("k")) == {"data": [1]}
+    assert held == [False]
+
+
+def test_unusable_cache_directory_disables_the_cache(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("not a directory")
+    posts = []
+    client = make_client(blocker / "cache", posts)
+
+    async def run():
+        query = {"Region": ["00"], "Tid": ["2023"]}
+        return [await client.get_data("BE/T", query, updated="2024-01-01") for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first == second and first["data"]
+    assert len(posts) == 2
+    assert client.result_cache.stats()["disabled"]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline SCB table search index
+"""
+
+import asyncio
+import copy
+import os
+
+import httpx
+import pytest
+
+import scb_tools
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+from scb_cache import TieredCache, cache_key
+from scb_search_index import SearchIndex, SearchIndexService, crawl_tables, tokenize
+
+# A small PxWeb tree: folder path -> child nodes
+TREE = {
+    "": [{"id": "AM", "text": "Arbetsmarknad", "type": "l"},
+         {"id": "BE", "text": "Befolkning", "type": "l"}],
+    "AM": [{"id": "AM0401", "text": "Arbetskraftsundersökningarna (AKU)", "type": "l"}],
+    "AM/AM0401": [
+        {"id": "NAKUArbetslosaM", "text": "Arbetslösa 15-74 år efter kön. Månad", "type": "t", "updated": "2024-01-01"},
+        {"id": "NAKUSysselsattaM", "text": "Sysselsatta 15-74 år efter kön. Månad", "type": "t", "updated": "2024-01-01"},
+    ],
+    "BE": [
+        {"id": "BefolkningNy", "text": "Folkmängden efter region, ålder och kön. År", "type": "t", "updated": "2024-02-01"},
+        {"id": "BE0101N1", "text": "Befolkningen efter region. År", "type": "t", "updated": "2024-02-01"},
+    ],
+}
+
+
+def pxweb_tree(request: httpx.Request) -> httpx.Response:
+    path = request.url.path.split("/ssd/", 1)[1].strip("/")
+    return httpx.Response(200, json=TREE.get(path, []))
+
+
+def build_index() -> SearchIndex:
+    client = ScbClient(transport=httpx.MockTransport(pxweb_tree), rate_limiter=RateLimiter(1000, 1))
+    docs = asyncio.run(crawl_tables(client, "sv", delay=0))
+    return SearchIndex(documents={"sv": docs}, built_at=1.0)
+
+
+def test_tokenize_folds_diacritics_and_stems():
+    assert tokenize("Arbetslöshet", "sv") == tokenize("arbetslösheten", "sv") == ["arbetslos"]
+    assert tokenize("Arbetslösa", "sv") == ["arbetslos"]
+    assert tokenize("unemployment statistics", "en") == tokenize("Unemployment statistic", "en")
+
+
+def test_crawl_finds_tables_in_nested_folders():
+    index = build_index()
+    docs = {doc["id"]: doc for doc in index.documents["sv"]}
+
+    assert set(docs) == {"NAKUArbetslosaM", "NAKUSysselsattaM", "BefolkningNy", "BE0101N1"}
+    assert docs["NAKUArbetslosaM"]["path"] == "AM/AM0401/NAKUArbetslosaM"
+    assert docs["NAKUArbetslosaM"]["path_text"] == ["Arbetsmarknad", "Arbetskraftsundersökningarna (AKU)"]
+
+
+def test_search_ranks_deep_tables():
+    index = build_index()
+
+    total, results = index.search("arbetslöshet", "sv")
+    assert total == 1
+    assert results[0]["id"] == "NAKUArbetslosaM"
+
+    total, results = index.search("be0101n1", "sv")
+    assert results[0]["id"] == "BE0101N1"
+
+    total, results = index.search("befolkning", "sv")
+    assert {r["id"] for r in results} >= {"BefolkningNy", "BE0101N1"}
+
+
+def test_search_paginates():
+    index = build_index()
+    total, first = index.search("kön", "sv", limit=1, offset=0)
+    _, second = index.search("kön", "sv", limit=1, offset=1)
+
+    assert total == 3
+    assert len(first) == len(second) == 1
+    assert first[0]["id"] != second[0]["id"]
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / "index.json.gz")
+    build_index().save(path)
+    loaded = SearchIndex.load(path)
+
+    assert loaded.stats()["tables"]["sv"] == 4
+    assert loaded.search("sysselsatta", "sv")[1][0]["id"] == "NAKUSysselsattaM"
+
+
+def test_search_tool_uses_index(monkeypatch):
+    service = SearchIndexService(path=None)
+    service.index = build_index()
+    monkeypatch.setattr(scb_tools, "search_service", service)
+    result = asyncio.run(scb_tools.call_tool(
+        "scb_search_tables", {"query": "arbetslösa", "language": "sv", "limit": 5}
+    ))
+
+    assert result["source"] == "index"
+    assert result["total"] == 1
+    assert result["matches"][0]["path"] == "AM/AM0401/NAKUArbetslosaM"
+
+
+def test_incremental_refresh_skips_unchanged_subtrees():
+    tree = copy.deepcopy(TREE)
+    tree[""][0]["updated"] = "2024-01-01"
+    tree[""][1]["updated"] = "2024-02-01"
+    tree["AM"][0]["updated"] = "2024-01-01"
+    requested = []
+
+    def handler(request):
+        path = request.url.path.split("/ssd/", 1)[1].strip("/")
+        requested.append(path)
+        return httpx.Response(200, json=tree.get(path, []))
+
+    cache = TieredCache()
+    client = ScbClient(transport=httpx.MockTransport(handler), rate_limiter=RateLimiter(1000, 1), cache=cache)
+    service = SearchIndexService(path=None, crawl_delay=0)
+
+    async def run():
+        full = await service.refresh(client, languages=("sv",))
+        assert full["mode"] == "full"
+        assert full["folders_visited"] == 4
+
+        # Befolkning changes: one table updated, one removed
+        await cache.set(cache_key("table", "sv", "BE/BE0101N1"), {"title": "old", "variables": []})
+        tree[""][1]["updated"] = "2024-03-01"
+        tree["BE"][0]["updated"] = "2024-03-01"
+        del tree["BE"][1]
+        requested.clear()
+
+        return await service.refresh(client, languages=("sv",))
+
+    report = asyncio.run(run())
+
+    assert report["mode"] == "incremental"
+    assert sorted(requested) == ["", "BE"]
+    assert report["folders_visited"] == 2
+    assert report["folders_skipped"] == 2
+    assert report["tables_updated"] == 1
+    assert report["tables_removed"] == 1
+    assert {doc["id"] for doc in service.index.documents["sv"]} == {
+        "NAKUArbetslosaM", "NAKUSysselsattaM", "BefolkningNy"
+    }
+    assert cache.memory.get(cache_key("table", "sv", "BE/BE0101N1")) is None
+    assert service.stats()["last_refresh"]["folders_skipped"] == 2
+
+
+class FailingClient:
+    """Client whose folder listings always fail, like SCB during an outage"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def list_nodes(self, path, language, refresh=False):
+        self.calls += 1
+        raise httpx.ConnectError("unreachable")
+
+    async def invalidate_table(self, table_path, language):
+        pass
+
+
+def test_failed_crawl_keeps_the_index_and_backs_off(tmp_path):
+    path = str(tmp_path / "index.json.gz")
+    service = SearchIndexService(path=path, crawl_delay=0)
+    service.index = build_index()
+    client = FailingClient()
+
+    with pytest.raises(RuntimeError, match="found 0 of 4 tables"):
+        asyncio.run(service.rebuild(client, languages=("sv",)))
+    assert service.index.stats()["tables"]["sv"] == 4
+    assert not os.path.exists(path)
+
+    # An incremental refresh reuses the previous documents when the root listing fails
+    asyncio.run(service.refresh(client, languages=("sv",)))
+    assert service.index.stats()["tables"]["sv"] == 4
+
+    async def run():
+        empty = SearchIndexService(path=None, crawl_delay=0)
+        client.calls = 0
+        await empty.start(client)
+        await asyncio.sleep(0.05)
+        await empty.stop()
+        return empty
+
+    empty = asyncio.run(run())
+    # One listing per language, then the loop waits instead of crawling again
+    assert client.calls == 2
+    assert empty.index.is_empty()
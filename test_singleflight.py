@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for request coalescing of identical concurrent calls
+"""
+
+import asyncio
+
+import scb_tools
+from scb_singleflight import SingleFlight, call_key
+
+
+def test_call_key_ignores_argument_order():
+    assert call_key("t", {"a": 1, "b": [1, 2]}) == call_key("t", {"b": [1, 2], "a": 1})
+    assert call_key("t", {"a": 1}) != call_key("t", {"a": 2})
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    runs = []
+
+    async def work(key):
+        runs.append(key)
+        await asyncio.sleep(0.05)
+        return {"key": key}
+
+    async def run():
+        return await asyncio.gather(
+            *(flight.do("a", lambda: work("a")) for _ in range(10)),
+            flight.do("b", lambda: work("b")),
+        )
+
+    results = asyncio.run(run())
+
+    assert runs == ["a", "b"]
+    assert all(result is results[0] for result in results[:10])
+    assert results[10] == {"key": "b"}
+    assert flight.stats() == {"in_flight": 0, "executed": 2, "shared": 9}
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    flight = SingleFlight()
+    runs = []
+
+    async def fail():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        await asyncio.gather(flight.do("k", fail), return_exceptions=True)
+
+    asyncio.run(run())
+    assert len(runs) == 2
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_tool_calls_with_defaults_are_coalesced(monkeypatch):
+    calls = []
+
+    class CountingClient:
+        async def list_nodes(self, path="", language="sv"):
+            calls.append((path, language))
+            await asyncio.sleep(0.05)
+            return [{"id": "BE", "text": "Befolkning", "type": "l"}]
+
+    monkeypatch.setattr(scb_tools, "scb_client", CountingClient())
+
+    async def run():
+        return await asyncio.gather(
+            scb_tools.call_tool("scb_browse_metadata", {}),
+            scb_tools.call_tool("scb_browse_metadata", {"path": "", "language": "SV"}),
+            scb_tools.call_tool("scb_browse_metadata", {"language": "sv"}),
+            scb_tools.call_tool("scb_browse_metadata", {"language": "en"}),
+        )
+
+    results = asyncio.run(run())
+
+    assert sorted(calls) == [("", "en"), ("", "sv")]
+    assert results[0] is results[1] is results[2]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming scb_fetch_data results over HTTP (NDJSON) and SSE
+"""
+
+import asyncio
+import itertools
+import json
+
+import httpx
+import pytest
+
+import scb_mcp_server_http
+import scb_mcp_server_sse
+
+VARIABLES = [
+    {"code": "Region", "values": [f"{i:02d}" for i in range(25)]},
+    {"code": "Tid", "values": ["2022", "2023"]},
+]
+
+
+def pxweb(request: httpx.Request) -> httpx.Response:
+    if request.method == "POST":
+        body = json.loads(request.content)
+        selection = [q["selection"]["values"] for q in body["query"]]
+        return httpx.Response(200, json={
+            "columns": [{"code": q["code"]} for q in body["query"]],
+            "comments": [],
+            "data": [{"key": list(key), "values": ["1"]} for key in itertools.product(*selection)],
+        })
+    return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+
+@pytest.fixture(autouse=True)
+def scb(mock_scb):
+    mock_scb(pxweb)
+
+
+def test_http_streams_rows_as_ndjson(monkeypatch, api_client):
+    monkeypatch.setenv("SCB_MAX_CELLS", "10")
+    response = api_client("POST", "/call_tool", json={
+        "name": "scb_fetch_data",
+        "arguments": {"table_id": "XX/TEST", "query": {"Region": ["*"], "Tid": ["*"]}},
+        "stream": True,
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["type"] == "meta"
+    assert lines[0]["chunks"] == 5
+    assert lines[-1] == {"type": "end", "rows": 50, "comments": []}
+    rows = [line for line in lines if "type" not in line]
+    assert len(rows) == 50
+    assert len([line for line in lines if line.get("type") == "progress"]) == 5
+
+
+def test_http_stream_reports_errors_in_band(api_client):
+    response = api_client("POST", "/call_tool", json={
+        "name": "scb_fetch_data",
+        "arguments": {"table_id": "XX/TEST", "query": {"Year": ["2023"]}},
+        "stream": True,
+    })
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["type"] == "error"
+    assert "Unknown variable 'Year'" in lines[-1]["error"]
+
+
+def test_http_stream_only_for_fetch_data(api_client):
+    response = api_client("POST", "/call_tool", json={
+        "name": "scb_browse_metadata", "arguments": {}, "stream": True,
+    })
+    assert response.status_code == 400
+
+
+def test_sse_streams_chunk_events(monkeypatch, api_client):
+    monkeypatch.setenv("SCB_MAX_CELLS", "20")
+    response = api_client("POST", "/fetch_data/stream", app=scb_mcp_server_sse.app, json={
+        "table_id": "XX/TEST", "query": {"Region": ["*"], "Tid": ["*"]},
+    })
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    names = [lines[0].removeprefix("event: ") for lines in events]
+    assert names == ["meta", "rows", "rows", "rows", "end"]
+    payloads = [json.loads(lines[1].removeprefix("data: ")) for lines in events]
+    assert sum(len(p["data"]) for p in payloads if p["type"] == "rows") == 50
+
+
+def test_ndjson_sends_one_block_per_chunk():
+    async def events():
+        yield {"type": "meta", "chunks": 2}
+        for chunk in range(2):
+            yield {"type": "rows", "chunk": chunk, "data": [{"key": [str(i)], "values": ["1"]} for i in range(3)]}
+        yield {"type": "end", "rows": 6}
+
+    async def collect():
+        return [block async for block in scb_mcp_server_http.ndjson_events(events())]
+
+    blocks = asyncio.run(collect())
+    assert len(blocks) == 4
+    assert [len(block.splitlines()) for block in blocks] == [1, 4, 4, 1]
+    assert json.loads(blocks[1].splitlines()[-1]) == {"type": "progress", "chunk": 0}
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped local table store
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import shutil
+
+import httpx
+
+import scb_tools
+from scb_client import ScbClient
+from scb_rate_limit import RateLimiter
+from scb_table_store import TableStore
+
+VARIABLES = [
+    {"code": "Region", "text": "region", "values": ["00", "01", "03"]},
+    {"code": "Kon", "text": "kön", "values": ["1", "2"]},
+    {"code": "ContentsCode", "text": "tabellinnehåll", "values": ["BE0101N1", "BE0101N2"]},
+    {"code": "Tid", "text": "år", "values": ["2022", "2023"], "time": True},
+]
+
+
+def cell(region, kon, tid, measure):
+    if (region, kon, tid, measure) == ("03", "2", "2023", "BE0101N2"):
+        return ".."
+    return str(int(region) * 1000 + int(kon) * 100 + (int(tid) - 2000) + (0.5 if measure == "BE0101N2" else 0))
+
+
+def pxweb_response(body: dict) -> dict:
+    selection = {item["code"]: item["selection"]["values"] for item in body["query"]}
+    contents = selection["ContentsCode"]
+    columns = [{"code": "Region", "text": "region", "type": "d"}, {"code": "Kon", "text": "kön", "type": "d"},
+               {"code": "Tid", "text": "år", "type": "t"}]
+    columns += [{"code": code, "text": f"Measure {code}", "type": "c"} for code in contents]
+    data = [
+        {"key": [region, kon, tid], "values": [cell(region, kon, tid, m) for m in contents]}
+        for region, kon, tid in itertools.product(selection["Region"], selection["Kon"], selection["Tid"])
+    ]
+    return {"columns": columns, "comments": [], "data": data}
+
+
+def make_client(posts):
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            body = json.loads(request.content)
+            posts.append(body)
+            return httpx.Response(200, json=pxweb_response(body))
+        return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+    return ScbClient(transport=httpx.MockTransport(pxweb), rate_limiter=RateLimiter(1000, 1))
+
+
+def test_download_splits_and_answers_queries_like_pxweb(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCB_MAX_CELLS", "8")
+    posts = []
+    store = TableStore(str(tmp_path), tables=["BE/T"])
+    client = make_client(posts)
+    asyncio.run(store.download(client, "BE/T", "sv", updated="2024-01-01"))
+    assert len(posts) > 1
+    assert store.is_current("BE/T", "sv", "2024-01-01")
+    assert not store.is_current("BE/T", "sv", "2024-02-01")
+
+    query = {"Region": ["03", "00"], "Kon": ["2"], "ContentsCode": ["BE0101N2", "BE0101N1"], "Tid": ["*"]}
+    stored = store.lookup("BE/T", "sv", query)
+    body = {"query": [{"code": code, "selection": {"values": values}} for code, values in
+                      [("Region", ["03", "00"]), ("Kon", ["2"]), ("ContentsCode", ["BE0101N2", "BE0101N1"]),
+                       ("Tid", ["2022", "2023"])]]}
+    assert stored == pxweb_response(body)
+    assert store.stats()["hits"] == 1
+
+
+def test_unselected_variable_falls_back_to_upstream(tmp_path):
+    store = TableStore(str(tmp_path))
+    asyncio.run(store.download(make_client([]), "BE/T", "sv"))
+    assert store.lookup("BE/T", "sv", {"Region": ["00"], "ContentsCode": ["BE0101N1"], "Tid": ["2023"]}) is None
+    assert store.stats()["fallbacks"] == 1
+    assert store.lookup("BE/T", "en", {"Region": ["00"]}) is None
+
+
+def test_refresh_replaces_values_file(tmp_path):
+    store = TableStore(str(tmp_path))
+    client = make_client([])
+
+    async def run():
+        await store.download(client, "BE/T", "sv", updated="2024-01-01")
+        await asyncio.sleep(0.002)
+        await store.download(client, "BE/T", "sv", updated="2024-02-01")
+
+    asyncio.run(run())
+    directory = store._table_dir("BE/T", "sv")
+    assert len([name for name in os.listdir(directory) if name.startswith("values.")]) == 1
+    assert store.is_current("BE/T", "sv", "2024-02-01")
+    # A new store opens the replica from disk
+    assert TableStore(str(tmp_path)).has("BE/T", "sv")
+
+
+def test_download_split_on_contents_fills_every_measure(tmp_path, monkeypatch):
+    # Each key has two measures, so a one-cell limit forces splitting the contents variable
+    monkeypatch.setenv("SCB_MAX_CELLS", "1")
+    store = TableStore(str(tmp_path))
+    asyncio.run(store.download(make_client([]), "BE/T", "sv"))
+
+    query = {"Region": ["*"], "Kon": ["*"], "ContentsCode": ["*"], "Tid": ["*"]}
+    body = {"query": [{"code": var["code"], "selection": {"values": var["values"]}} for var in VARIABLES]}
+    assert store.lookup("BE/T", "sv", query) == pxweb_response(body)
+
+
+def test_new_upstream_value_falls_back_to_scb_and_refreshes(tmp_path, monkeypatch, mock_scb):
+    store = TableStore(str(tmp_path))
+    asyncio.run(store.download(make_client([]), "BE/T", "sv"))
+
+    # SCB has since published 2024; the index knows no 'updated' timestamp for the table
+    live = [dict(var, values=var["values"] + ["2024"]) if var["code"] == "Tid" else var for var in VARIABLES]
+    posts = []
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            body = json.loads(request.content)
+            posts.append(body)
+            return httpx.Response(200, json=pxweb_response(body))
+        return httpx.Response(200, json={"title": "Test", "variables": live})
+
+    monkeypatch.setattr(scb_tools, "table_store", store)
+    mock_scb(pxweb)
+    query = {"Region": ["00"], "Kon": ["1"], "ContentsCode": ["BE0101N1"], "Tid": ["*"]}
+
+    async def run():
+        result = await scb_tools.fetch_data("BE/T", query)
+        await asyncio.gather(*store._tasks)
+        return result
+
+    result = asyncio.run(run())
+    assert "error" not in result
+    assert [row["key"][-1] for row in result["data"]["data"]] == ["2022", "2023", "2024"]
+    # The background refresh stored the new value
+    assert store.lookup("BE/T", "sv", query)["data"][-1]["key"] == ["00", "1", "2024"]
+    assert store.is_current("BE/T", "sv", None, live)
+
+
+def test_failed_refresh_backs_off_and_missing_tables_are_not_reopened(tmp_path):
+    store = TableStore(str(tmp_path))
+    asyncio.run(store.download(make_client([]), "BE/T", "sv"))
+    attempts = []
+
+    def failing(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.method)
+        return httpx.Response(500)
+
+    client = ScbClient(transport=httpx.MockTransport(failing), rate_limiter=RateLimiter(1000, 1), max_retries=0)
+
+    async def run():
+        for _ in range(3):
+            store.refresh_later(client, "BE/T", "sv", "2024-02-01")
+            await asyncio.gather(*store._tasks)
+
+    asyncio.run(run())
+    assert attempts == ["GET"]
+    assert store.stats()["failed_refreshes"] == {"sv:BE/T": 1}
+
+    # A miss is remembered, so later fetches do not look for meta.json on disk again
+    assert not store.has("BE/Other", "sv")
+    shutil.copytree(store._table_dir("BE/T", "sv"), store._table_dir("BE/Other", "sv"))
+    assert not store.has("BE/Other", "sv")
+    assert TableStore(str(tmp_path)).has("BE/Other", "sv")
+
+
+def test_replica_returns_cells_exactly_as_scb_sent_them(tmp_path):
+    raw = iter(["12.50", "..", ".", "-", "0.0", "7", "-3.25", "12345678901234567890", "1e3", "", "0.10", "x"] * 4)
+    responses = {}
+
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            body = json.loads(request.content)
+            response = pxweb_response(body)
+            for row in response["data"]:
+                row["values"] = [next(raw) for _ in row["values"]]
+            responses["full"] = response
+            return httpx.Response(200, json=response)
+        return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+    store = TableStore(str(tmp_path))
+    client = ScbClient(transport=httpx.MockTransport(pxweb), rate_limiter=RateLimiter(1000, 1))
+    asyncio.run(store.download(client, "BE/T", "sv"))
+
+    query = {"Region": ["*"], "Kon": ["*"], "ContentsCode": ["*"], "Tid": ["*"]}
+    assert store.lookup("BE/T", "sv", query)["data"] == responses["full"]["data"]
+    # Reopened from disk, the symbols and decimals still come back unchanged
+    assert TableStore(str(tmp_path)).lookup("BE/T", "sv", query)["data"] == responses["full"]["data"]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for OTLP/JSON tracing of tool calls and the slow-call profiler
+"""
+
+import json
+import os
+import threading
+import time
+
+import httpx
+
+import scb_tracing
+
+VARIABLES = [{"code": "Tid", "values": ["2022", "2023"]}]
+
+
+def read_traces(tracer):
+    tracer.flush()
+    with open(tracer.path) as f:
+        return [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"] for line in f]
+
+
+def test_fetch_data_is_traced_stage_by_stage(tmp_path, api_client, mock_scb):
+    def pxweb(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(200, json={"columns": [], "comments": [], "data": [{"key": ["2023"], "values": ["1"]}]})
+        return httpx.Response(200, json={"title": "Test", "variables": VARIABLES})
+
+    mock_scb(pxweb)
+    tracer = scb_tracing.Tracer(path=str(tmp_path / "traces.jsonl"))
+    scb_tracing.configure(tracer)
+    try:
+        response = api_client("POST", "/call_tool", json={"name": "scb_fetch_data",
+                                                          "arguments": {"table_id": "BE/T1", "query": {"Tid": ["2023"]}}})
+    finally:
+        scb_tracing.configure(None)
+    assert response.status_code == 200
+
+    [spans] = read_traces(tracer)
+    by_name = {span["name"]: span for span in spans}
+    for name in ("POST /call_tool", "tool scb_fetch_data", "execute", "resolve_table", "metadata",
+                 "get_data", "rate_limit.wait", "http GET", "http POST", "format", "serialize"):
+        assert name in by_name, name
+    assert len({span["traceId"] for span in spans}) == 1
+    root = by_name["POST /call_tool"]
+    assert "parentSpanId" not in root
+    assert by_name["tool scb_fetch_data"]["parentSpanId"] == root["spanId"]
+    assert by_name["http POST"]["parentSpanId"] == by_name["get_data"]["spanId"]
+    status = [a for a in by_name["http POST"]["attributes"] if a["key"] == "http.status_code"]
+    assert status == [{"key": "http.status_code", "value": {"intValue": "200"}}]
+
+
+def test_unsampled_calls_are_not_traced_and_tracing_is_off_by_default(tmp_path):
+    tracer = scb_tracing.Tracer(path=str(tmp_path / "traces.jsonl"), sample_rate=0.0)
+    scb_tracing.configure(tracer)
+    try:
+        with scb_tracing.trace("root") as root:
+            with scb_tracing.span("child") as child:
+                assert child is scb_tracing.NULL_SPAN
+        assert root is scb_tracing.NULL_SPAN
+    finally:
+        scb_tracing.configure(None)
+    tracer.flush()
+    assert not os.path.exists(tracer.path)
+
+    with scb_tracing.trace("anything") as span:
+        assert span is scb_tracing.NULL_SPAN
+
+
+def test_slow_calls_dump_folded_stacks(tmp_path):
+    tracer = scb_tracing.Tracer(path=str(tmp_path / "traces.jsonl"), profile_threshold=0.02,
+                                profile_dir=str(tmp_path / "profiles"), profile_interval=0.001)
+    scb_tracing.configure(tracer)
+
+    def busy_wait():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    try:
+        with scb_tracing.trace("fast"):
+            pass
+        with scb_tracing.trace("slow"):
+            busy_wait()
+    finally:
+        scb_tracing.configure(None)
+
+    traces = read_traces(tracer)
+    assert tracer.profiles == 1
+    [profile] = os.listdir(tmp_path / "profiles")
+    assert profile == traces[1][0]["traceId"] + ".folded"
+    with open(tmp_path / "profiles" / profile) as f:
+        lines = f.read().splitlines()
+    assert any("busy_wait (test_tracing.py" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_background_requests_are_not_traced_and_full_export_queue_drops(tmp_path):
+    tracer = scb_tracing.Tracer(path=str(tmp_path / "traces.jsonl"), queue_size=1)
+    scb_tracing.configure(tracer)
+    blocked = threading.Event()
+    try:
+        # Outside a tool call (e.g. the index crawler) spans are no-ops
+        with scb_tracing.span("http GET") as span:
+            assert span is scb_tracing.NULL_SPAN
+        # Hold the exporter thread, so the queue fills up
+        tracer._submit(blocked.wait)
+        time.sleep(0.05)
+        for name in ("first", "second"):
+            with scb_tracing.trace(name):
+                pass
+    finally:
+        scb_tracing.configure(None)
+        blocked.set()
+
+    [spans] = read_traces(tracer)
+    assert [span["name"] for span in spans] == ["first"]
+    assert tracer.stats()["dropped"] == 1